@@ -0,0 +1,94 @@
+"""
+fermvault app
+benchmarks/bench_settings_manager.py
+
+Microbenchmark for SettingsManager.get()/set() per-call cost.
+Compares the legacy linear category scan (re-implemented inline below against a
+legacy-shaped settings dict, live values included) with the current SettingsManager
+path (indexed snapshot for settings, LiveState for live values).
+
+Usage:  python benchmarks/bench_settings_manager.py [iterations]
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import threading
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from settings_manager import SettingsManager
+from live_state import LIVE_FIELDS
+
+# Keys touched by the monitor loop every tick (mix of early and late categories)
+HOT_GET_KEYS = ["control_mode", "beer_hold_f", "pid_idle_zone", "beer_pid_envelope_width",
+                "ds18b20_beer_sensor", "temp_units", "aux_relay_mode"]
+HOT_SET_KEYS = ["beer_temp_actual", "amb_temp_actual", "heat_state", "cool_state", "sensor_error_message"]
+
+LEGACY_TRANSIENT_LIST = [
+    "beer_temp_actual", "amb_temp_actual", "beer_temp_timestamp", "amb_temp_timestamp",
+    "og_timestamp_var", "sg_timestamp_var",
+    "amb_min_setpoint", "amb_max_setpoint", "beer_setpoint_current", "amb_target_setpoint",
+    "heat_state", "cool_state", "cool_restriction_status", "sensor_error_message",
+    "cooling_delay_message", "fan_state", "og_display_var", "sg_display_var",
+    "fg_status_var", "fg_value_var"
+]
+
+
+class LegacyStore:
+    """The pre-index settings layout: live values stored inside system_settings."""
+
+    def __init__(self, settings):
+        self.settings = copy.deepcopy(settings)
+        self.settings["system_settings"].update(dict(LIVE_FIELDS))
+        self._data_lock = threading.RLock()
+
+    def _save_all_settings(self):
+        pass # Disk cost is excluded so only the lookup path is measured
+
+
+def legacy_get(sm, key, default=None):
+    with sm._data_lock:
+        for category in sm.settings.values():
+            if isinstance(category, dict) and key in category:
+                return category[key]
+    return default
+
+
+def legacy_set(sm, key, value):
+    with sm._data_lock:
+        for category_name, category_data in sm.settings.items():
+            if isinstance(category_data, dict) and key in category_data:
+                category_data[key] = value
+                transient_keys = list(LEGACY_TRANSIENT_LIST) # The old code rebuilt this literal per call
+                if key not in transient_keys:
+                    sm._save_all_settings()
+                return True
+    return False
+
+
+def run(iterations):
+    data_dir = tempfile.mkdtemp(prefix="fv_bench_")
+    sm = SettingsManager(os.path.join(data_dir, "bench_settings.json"))
+    legacy = LegacyStore(sm.settings)
+
+    def bench(label, fn, keys):
+        total = timeit.timeit(lambda: [fn(k) for k in keys], number=iterations)
+        per_call_ns = total / (iterations * len(keys)) * 1e9
+        print(f"  {label:<20} {per_call_ns:8.0f} ns/call")
+        return per_call_ns
+
+    print(f"SettingsManager microbenchmark ({iterations} iterations)")
+    old_get = bench("legacy get()", lambda k: legacy_get(legacy, k), HOT_GET_KEYS)
+    new_get = bench("current get()", lambda k: sm.get(k), HOT_GET_KEYS)
+    old_set = bench("legacy set()", lambda k: legacy_set(legacy, k, 1.0), HOT_SET_KEYS)
+    new_set = bench("current set()", lambda k: sm.set(k, 1.0), HOT_SET_KEYS)
+    print(f"  get() speedup: {old_get / new_get:.1f}x   set() speedup: {old_set / new_set:.1f}x")
+
+    sm.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,55 @@
+"""
+fermvault app
+benchmarks/bench_thermal_sim.py
+
+Times the closed-loop thermal simulator: one scalar run (real control_step per tick)
+against a NumPy batch over a Beer Hold gain grid, then prints the best gain sets.
+
+Usage:  python benchmarks/bench_thermal_sim.py [hours]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+
+from control_params import ControlParams
+from thermal_sim import simulate, grid_search
+
+GRID = {
+    "pid_kp": np.linspace(0.0, 8.0, 16),
+    "pid_ki": [0.0, 0.03, 0.1, 0.3],
+    "pid_kd": np.linspace(0.0, 80.0, 16),
+    "beer_pid_envelope_width": [0.5, 1.0, 1.5, 2.0],
+}
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24.0
+    params = ControlParams(control_mode="Beer Hold", beer_hold_f=55.0)
+    runs = 1
+    for values in GRID.values():
+        runs *= len(values)
+
+    start = time.perf_counter()
+    simulate(params, duration_s=hours * 3600)
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = grid_search(params, GRID, duration_s=hours * 3600, top=5)
+    batch_s = time.perf_counter() - start
+
+    print(f"Simulated {hours:.0f} h per run")
+    print(f"  scalar:  1 run     {scalar_s * 1000:8.1f} ms")
+    print(f"  batch:   {runs} runs {batch_s * 1000:8.1f} ms  ({batch_s / runs * 1e6:.1f} us/run, {scalar_s * runs / batch_s:.0f}x)")
+    print("Best gain sets:")
+    for cost, gains, score in results:
+        print(f"  cost {cost:6.2f}  {gains}  overshoot {score.overshoot_f:.2f} F, settled {score.settling_time_s / 3600:.1f} h, "
+              f"{score.compressor_cycles} compressor cycles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+fermvault app
+autotune.py
+"""
+
+import csv
+import math
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# --- RELAY-FEEDBACK AUTOTUNE (Astrom-Hagglund) ---
+# The PID output (ambient offset from the beer setpoint, F) is switched between +relay_f
+# and -relay_f whenever the beer crosses setpoint -/+ hysteresis_f. The normal ambient
+# envelope and RelayControl (dwell, max runtime) turn that into heat/cool, so the beer
+# settles into a limit cycle. Its amplitude a and period Pu give the ultimate gain
+#   Ku = 4 * relay_f / (pi * sqrt(a^2 - hysteresis_f^2))
+# and a tuning rule turns (Ku, Pu) into PID gains in the kernel's units (F, seconds).
+
+# relay_f / hysteresis_f: F; cycles: full oscillations measured (after the first,
+# transient one); max_duration_s: give up after this long; rule: key of TUNING_RULES
+AutotuneConfig = namedtuple("AutotuneConfig", "relay_f hysteresis_f cycles max_duration_s rule")
+
+# rule -> (Kp / Ku, Ti / Pu, Td / Pu)
+TUNING_RULES = {
+    "ziegler-nichols": (0.6, 0.5, 0.125),
+    "tyreus-luyben": (0.45, 2.2, 1 / 6.3),   # Less overshoot; suits slow thermal loads
+    "no-overshoot": (0.2, 0.5, 1 / 3),
+}
+DEFAULT_TUNING_RULE = "tyreus-luyben"
+
+AutotuneResult = namedtuple("AutotuneResult", "ultimate_gain ultimate_period_s amplitude_f relay_f cycles rule kp ki kd")
+
+# status: "running", "done" or "failed"
+# relay: +1 (output +relay_f) or -1; rise_time: time of the last upward switch (None before the first)
+# high / low: beer extremes since rise_time; amplitudes / periods: one entry per measured cycle
+AutotuneState = namedtuple("AutotuneState", "status start_time relay rise_time high low amplitudes periods result")
+
+
+def tuning_from_oscillation(amplitude_f, period_s, relay_f, hysteresis_f=0.0, rule=DEFAULT_TUNING_RULE, cycles=0):
+    """Returns the AutotuneResult for a measured limit cycle, or None if it is unusable."""
+    if amplitude_f <= 0 or period_s <= 0 or relay_f <= 0:
+        return None
+    kp_ratio, ti_ratio, td_ratio = TUNING_RULES.get(rule, TUNING_RULES[DEFAULT_TUNING_RULE])
+    effective = math.sqrt(amplitude_f ** 2 - hysteresis_f ** 2) if amplitude_f > hysteresis_f else amplitude_f
+    ku = 4.0 * relay_f / (math.pi * effective)
+    kp = kp_ratio * ku
+    ki = kp / (ti_ratio * period_s)
+    kd = kp * td_ratio * period_s
+    return AutotuneResult(ku, period_s, amplitude_f, relay_f, cycles, rule if rule in TUNING_RULES else DEFAULT_TUNING_RULE,
+                          kp, ki, kd)
+
+
+def autotune_step(state, beer_temp, setpoint, now, config):
+    """
+    One relay-feedback update at time 'now' (s). 'state' is None to start a run.
+    Returns (pid_output, new_state, event): event is None, "started", "cycle",
+    "done" or "failed". Once finished the state no longer changes and the output is 0.
+    """
+    if state is None:
+        relay = -1 if beer_temp > setpoint else 1
+        state = AutotuneState("running", now, relay, None, beer_temp, beer_temp, (), (), None)
+        return relay * config.relay_f, state, "started"
+    if state.status != "running":
+        return 0.0, state, None
+
+    relay, rise_time = state.relay, state.rise_time
+    high, low = max(state.high, beer_temp), min(state.low, beer_temp)
+    amplitudes, periods = state.amplitudes, state.periods
+    event = None
+
+    if relay > 0 and beer_temp > setpoint + config.hysteresis_f:
+        # Upward switch: closes one full cycle (peak and trough since the previous one)
+        relay = -1
+        if rise_time is not None:
+            amplitudes += ((high - low) / 2.0,)
+            periods += (now - rise_time,)
+            event = "cycle"
+        rise_time = now
+        high = low = beer_temp
+    elif relay < 0 and beer_temp < setpoint - config.hysteresis_f:
+        relay = 1
+
+    state = state._replace(relay=relay, rise_time=rise_time, high=high, low=low, amplitudes=amplitudes, periods=periods)
+
+    if len(periods) >= config.cycles:
+        result = tuning_from_oscillation(sum(amplitudes) / len(amplitudes), sum(periods) / len(periods),
+                                         config.relay_f, config.hysteresis_f, config.rule, len(periods))
+        return 0.0, state._replace(status="done" if result else "failed", result=result), "done" if result else "failed"
+    if now - state.start_time > config.max_duration_s:
+        return 0.0, state._replace(status="failed"), "failed"
+    return relay * config.relay_f, state, event
+
+
+# --- OFFLINE ---
+def autotune_from_series(times, beer_temps, setpoint, config):
+    """
+    Replays the relay-feedback run recorded in (times, beer_temps) - e.g. a logged
+    Autotune session or a simulator trace - and returns its AutotuneResult, or None.
+    """
+    state = None
+    for now, beer_temp in zip(times, beer_temps):
+        _, state, event = autotune_step(state, beer_temp, setpoint, now, config)
+        if event in ("done", "failed"):
+            return state.result
+    return None
+
+
+def autotune_from_pid_log(log_file_path, config):
+    """
+    Re-derives the gains of the last Autotune session in a pid_log.csv (rows logged with
+    ControlMode "Autotune") with 'config', which must be the session's settings. The
+    relay amplitude is config.relay_f: once a session finishes the beer is held by the PID
+    under the same mode, so the logged PID_Output is not the relay output.
+    Returns an AutotuneResult, or None if the log holds no complete session.
+    """
+    runs, run = [], None
+    with open(log_file_path, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row.get('ControlMode') != "Autotune":
+                run = None
+                continue
+            if run is None:
+                run = []
+                runs.append(run)
+            try:
+                run.append((time.mktime(datetime.strptime(row['Timestamp'], "%Y-%m-%d %H:%M:%S").timetuple()),
+                            float(row['MeasuredTemp']), float(row['Setpoint'])))
+            except (KeyError, TypeError, ValueError):
+                continue # Skip a malformed row
+    if not runs or not runs[-1]:
+        return None
+    run = runs[-1]
+    return autotune_from_series([row[0] for row in run], [row[1] for row in run], run[0][2], config)
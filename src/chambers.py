@@ -0,0 +1,437 @@
+"""
+fermvault app
+chambers.py
+"""
+
+import os
+import copy
+import threading
+
+from control_params import ControlParams, CONTROL_PARAM_KEYS
+from control_kernel import (KernelInputs, control_step, initial_state, reset_ramp, resume_ramp, reset_profile,
+                            resume_profile_run, append_pid_log_row)
+from sensor_conditioning import condition_reading
+from relay_control import RelayControl
+from live_state import LiveState
+from tick_scheduler import TickScheduler, CONTROL_LOOP_PERIOD_S
+from clock import SYSTEM_CLOCK
+from thermal_model import load_model, model_path
+from compressor_planner import CompressorPlanner
+
+# Relay roles every chamber maps to its own GPIO pins
+RELAY_ROLES = ("Heat", "Cool", "Fan")
+
+# Settings every chamber keeps its own copy of (copied from the main vault when the
+# chamber is added). Everything else in ControlParams (PID gains, compressor protection,
+# filters...) follows the global settings unless the chamber overrides it.
+CHAMBER_OWN_KEYS = (
+    "control_mode", "ambient_hold_f", "beer_hold_f", "ramp_up_hold_f", "fast_crash_hold_f",
+    "ramp_up_duration_hours", "fermentation_profile", "ds18b20_beer_sensor", "ds18b20_ambient_sensor",
+)
+
+# Ramp persistence, stored per chamber under "ramp" (same keys as the main vault)
+RAMP_PERSIST_KEYS = ("ramp_start_time", "ramp_latched_start_temp", "ramp_is_finished")
+
+
+class Chamber:
+    """
+    Runtime state of one additional chamber: its relays (own pins, dwell and fail-safe
+    timers), its LiveState, probe conditioners, control kernel (PID/ramp) state and the
+    ControlParams compiled from the global settings plus its own settings.
+    """
+
+    def __init__(self, chamber_id, name, relay_control, live_state):
+        self.chamber_id = chamber_id
+        self.name = name
+        self.relay_control = relay_control
+        self.live_state = live_state
+        self.kernel_state = initial_state()
+        self.conditioners = {}          # role -> (sensor_id, ProbeConditioner)
+        self.params = None
+        self.monitoring = False
+        self.relays_active = False      # Driving relays: monitoring, or still shutting down
+        self.outputs = None             # KernelOutputs of the last tick
+        self.thermal_model = None       # Identified beer model (thermal_model.py), if any
+        self.compressor_planner = CompressorPlanner()
+
+    @property
+    def pins(self):
+        return self.relay_control.pins
+
+    def status(self):
+        """Summary for the UI/notifications."""
+        live = self.live_state
+        return {
+            "name": self.name,
+            "mode": self.params.control_mode if self.params else "",
+            "monitoring": self.monitoring,
+            "beer_temp": live.beer_temp_actual,
+            "amb_temp": live.amb_temp_actual,
+            "beer_setpoint": live.beer_setpoint_current,
+            "heat_state": live.heat_state,
+            "cool_state": live.cool_state,
+            "sensor_error_message": live.sensor_error_message,
+        }
+
+
+class ChamberRegistry:
+    """
+    Drives any number of additional chambers from one thread. The "chambers" setting
+    is the source of truth; the registry keeps one runtime Chamber per entry.
+
+    All chambers share the sensor acquisition service (every probe of every chamber is
+    read in one acquisition per tick), the GPIO driver and the UI/notification log.
+    A tick is one bus acquisition plus one control_step() and one relay update per
+    chamber, so the per-tick cost grows linearly and stays small for 8+ chambers.
+    """
+
+    def __init__(self, settings_manager, sensor_acquisition, clock=None, reserved_pins=(), log_message=None):
+        self.settings_manager = settings_manager
+        self.sensor_acquisition = sensor_acquisition
+        self.clock = clock or SYSTEM_CLOCK
+        self.reserved_pins = {int(pin) for pin in reserved_pins} # GPIO pins owned by the main vault
+        self.log_message = log_message  # callable(str) -> UI system log
+        self._chambers = {}             # chamber_id -> Chamber, in settings order
+        self._lock = threading.RLock()  # Guards _chambers and config edits against the tick
+        self._synced_snapshot = None
+        self.tick_scheduler = TickScheduler(CONTROL_LOOP_PERIOD_S, clock=self.clock)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        if hasattr(self.settings_manager, 'data_dir'):
+            self.data_dir = self.settings_manager.data_dir
+        else:
+            self.data_dir = os.path.join(os.path.expanduser('~'), 'fermvault_data')
+
+    # --- CONFIGURATION (persisted in the "chambers" setting) ---
+    def _configs(self):
+        return copy.deepcopy(list(self.settings_manager.get("chambers", []) or []))
+
+    def _save_configs(self, configs):
+        self.settings_manager.set("chambers", configs)
+        self.sync()
+
+    def _find(self, configs, chamber_id):
+        for cfg in configs:
+            if cfg.get("id") == chamber_id:
+                return cfg
+        raise KeyError(f"No chamber '{chamber_id}'")
+
+    def _check_settings(self, settings):
+        unknown = set(settings) - set(CONTROL_PARAM_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown chamber settings: {sorted(unknown)}")
+
+    def _check_pins(self, relay_pins, configs, chamber_id=None):
+        missing = [role for role in RELAY_ROLES if role not in relay_pins]
+        if missing:
+            raise ValueError(f"Chamber relay pins missing {missing}")
+        pins = [int(relay_pins[role]) for role in RELAY_ROLES]
+        if len(set(pins)) != len(pins):
+            raise ValueError(f"Chamber relay pins must be distinct: {pins}")
+        used = set(self.reserved_pins)
+        for cfg in configs:
+            if cfg.get("id") != chamber_id:
+                used.update(int(pin) for pin in cfg.get("relay_pins", {}).values())
+        clash = used.intersection(pins)
+        if clash:
+            raise ValueError(f"GPIO pins {sorted(clash)} are already used by another chamber")
+        return {role: int(relay_pins[role]) for role in RELAY_ROLES}
+
+    def add_chamber(self, chamber_id, name, relay_pins, **settings):
+        """
+        Adds a chamber with its own relay pins. 'settings' are ControlParams keys for
+        this chamber (e.g. ds18b20_beer_sensor, control_mode, beer_hold_f). Returns the Chamber.
+        """
+        self._check_settings(settings)
+        with self._lock:
+            configs = self._configs()
+            if not chamber_id or any(cfg.get("id") == chamber_id for cfg in configs):
+                raise ValueError(f"Chamber id '{chamber_id}' is empty or already in use")
+            pins = self._check_pins(relay_pins, configs)
+
+            snap = self.settings_manager.snapshot()
+            own = {key: snap[key] for key in CHAMBER_OWN_KEYS if key in snap}
+            own["ds18b20_beer_sensor"] = own["ds18b20_ambient_sensor"] = "unassigned"
+            own.update(settings)
+            configs.append({
+                "id": chamber_id, "name": name or chamber_id, "relay_pins": pins, "settings": own,
+                "monitoring": "OFF", "ramp": {"ramp_start_time": 0.0, "ramp_latched_start_temp": 0.0, "ramp_is_finished": False},
+            })
+            self._save_configs(configs)
+            return self._chambers[chamber_id]
+
+    def update_chamber(self, chamber_id, name=None, relay_pins=None, **settings):
+        """Changes a chamber's name, relay pins and/or settings."""
+        self._check_settings(settings)
+        with self._lock:
+            configs = self._configs()
+            cfg = self._find(configs, chamber_id)
+            if relay_pins is not None:
+                cfg["relay_pins"] = self._check_pins(relay_pins, configs, chamber_id)
+            if name:
+                cfg["name"] = name
+            cfg.setdefault("settings", {}).update(settings)
+            self._save_configs(configs)
+
+    def remove_chamber(self, chamber_id):
+        """Removes a chamber; its relays are switched off."""
+        with self._lock:
+            configs = self._configs()
+            self._find(configs, chamber_id)
+            self._save_configs([cfg for cfg in configs if cfg.get("id") != chamber_id])
+
+    def set_monitoring(self, chamber_id, on):
+        """Starts/stops control of one chamber. Stopping turns its relays off (after compressor dwell)."""
+        with self._lock:
+            configs = self._configs()
+            self._find(configs, chamber_id)["monitoring"] = "ON" if on else "OFF"
+            self._save_configs(configs)
+
+    def reset_ramp(self, chamber_id):
+        """Restarts a chamber's ramp from its pre-ramp stage and clears its persisted ramp."""
+        with self._lock:
+            chamber = self._chambers[chamber_id]
+            chamber.kernel_state = reset_ramp(chamber.kernel_state)
+            self._persist(chamber, {"ramp_start_time": 0.0, "ramp_latched_start_temp": 0.0, "ramp_is_finished": False})
+
+    def reset_profile(self, chamber_id):
+        """Drops a chamber's profile run and its persisted record (its Profile mode starts over)."""
+        with self._lock:
+            chamber = self._chambers[chamber_id]
+            chamber.kernel_state = reset_profile(chamber.kernel_state)
+            self._persist(chamber, {"profile_run": None})
+
+    def apply_autotune_gains(self, chamber_id):
+        """Copies the gains proposed by the chamber's last Autotune run into its settings. Returns True if applied."""
+        with self._lock:
+            result = self._find(self._configs(), chamber_id).get("autotune_result")
+            if not result:
+                return False
+            self.update_chamber(chamber_id, pid_kp=round(result["kp"], 4), pid_ki=round(result["ki"], 6),
+                                pid_kd=round(result["kd"], 2))
+            return True
+
+    def _persist(self, chamber, values):
+        """Stores kernel persistence: ramp keys under "ramp", anything else (autotune_result, profile_run) on the chamber."""
+        with self._lock:
+            configs = self._configs()
+            try:
+                cfg = self._find(configs, chamber.chamber_id)
+            except KeyError:
+                return # Removed meanwhile
+            for key, value in values.items():
+                if key in RAMP_PERSIST_KEYS:
+                    cfg.setdefault("ramp", {})[key] = value
+                else:
+                    cfg[key] = value
+            self._save_configs(configs)
+
+    # --- RUNTIME CHAMBERS ---
+    def get(self, chamber_id):
+        return self._chambers.get(chamber_id)
+
+    def chambers(self):
+        """Returns the runtime Chambers in settings order."""
+        return list(self._chambers.values())
+
+    def status(self):
+        """Returns {chamber_id: status dict} for every chamber."""
+        return {chamber.chamber_id: chamber.status() for chamber in self.chambers()}
+
+    def sync(self):
+        """Builds, reconfigures or removes runtime chambers to match the "chambers" setting."""
+        snap = self.settings_manager.snapshot()
+        with self._lock:
+            if snap is self._synced_snapshot:
+                return
+            self._synced_snapshot = snap
+            chambers = {}
+            for cfg in snap.get("chambers") or []:
+                chamber_id = cfg.get("id")
+                if not chamber_id or chamber_id in chambers:
+                    continue
+                try:
+                    chamber = self._chambers.get(chamber_id)
+                    pins = {role: int(pin) for role, pin in cfg.get("relay_pins", {}).items()}
+                    if chamber is not None and chamber.pins != pins:
+                        self._release(chamber) # Rewired: rebuild on the new pins
+                        chamber = None
+                    if chamber is None:
+                        chamber = self._build(chamber_id, cfg, snap)
+                    self._configure(chamber, cfg, snap)
+                    chambers[chamber_id] = chamber
+                except Exception as e:
+                    print(f"[Chambers] Invalid chamber config {chamber_id!r}: {e}")
+            for chamber_id, chamber in self._chambers.items():
+                if chamber_id not in chambers:
+                    self._release(chamber)
+                    print(f"[Chambers] Chamber '{chamber.name}' removed.")
+            self._chambers = chambers
+
+    def _build(self, chamber_id, cfg, snap):
+        live_state = LiveState()
+        relay_control = RelayControl(self.settings_manager, {role: int(pin) for role, pin in cfg["relay_pins"].items()},
+                                     clock=self.clock, live_state=live_state)
+        chamber = Chamber(chamber_id, cfg.get("name") or chamber_id, relay_control, live_state)
+        relay_control.set_logger(lambda message: self._log(chamber, message))
+        chamber.thermal_model = load_model(model_path(self.data_dir, chamber_id))
+        chamber.compressor_planner.set_model(chamber.thermal_model)
+
+        ramp = cfg.get("ramp") or {}
+        if ramp.get("ramp_start_time", 0.0) > 0:
+            params = ControlParams.from_settings({**snap, **cfg.get("settings", {})})
+            chamber.kernel_state = resume_ramp(chamber.kernel_state, params, self.clock.time(), ramp["ramp_start_time"],
+                                               ramp.get("ramp_latched_start_temp", 0.0), ramp.get("ramp_is_finished", False))
+        if cfg.get("profile_run"):
+            chamber.kernel_state = resume_profile_run(chamber.kernel_state, cfg["profile_run"], self.clock.time())
+        print(f"[Chambers] Chamber '{chamber.name}' ready on pins {cfg['relay_pins']}.")
+        return chamber
+
+    def _configure(self, chamber, cfg, snap):
+        chamber.name = cfg.get("name") or chamber.chamber_id
+        chamber.params = ControlParams.from_settings({**snap, **cfg.get("settings", {})})
+        monitoring = cfg.get("monitoring") == "ON"
+        if monitoring and not chamber.monitoring:
+            # PID dt starts at the first tick; an autotune run starts over
+            chamber.kernel_state = chamber.kernel_state._replace(pid_last_time=None, autotune=None)
+            chamber.compressor_planner.reset()
+        chamber.monitoring = monitoring
+        if chamber.monitoring:
+            chamber.relays_active = True
+
+    def update_relay_logic(self):
+        """Applies a relay polarity (or first-time relay logic) change to every chamber's relays."""
+        with self._lock:
+            for chamber in self._chambers.values():
+                chamber.relay_control.update_relay_logic()
+
+    def _release(self, chamber):
+        chamber.relay_control.turn_off_all_relays()
+
+    # --- CONTROL LOOP ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="chambers")
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.tick_scheduler.wake()
+
+    def _loop(self):
+        self.tick_scheduler.reset()
+        while True:
+            tick = self.tick_scheduler.next_tick(self._stop_event)
+            if tick is None:
+                break
+            try:
+                self.tick(tick.start)
+            except Exception as e:
+                print(f"[Chambers] Tick failed: {e}")
+
+    def tick(self, mono_time):
+        """One control pass over every chamber."""
+        self.sync()
+        chambers = self.chambers()
+        if not chambers:
+            return
+
+        # One acquisition for every probe of every chamber
+        sensor_ids = []
+        for chamber in chambers:
+            sensor_ids.append(chamber.params.ds18b20_beer_sensor)
+            sensor_ids.append(chamber.params.ds18b20_ambient_sensor)
+        readings = self.sensor_acquisition.get_readings(
+            sensor_ids,
+            max_age_s=min(chamber.params.sensor_cache_max_age_s for chamber in chambers),
+            timeout_s=max(chamber.params.sensor_read_timeout_s for chamber in chambers),
+        )
+
+        wall_time = self.clock.time()
+        for chamber in chambers:
+            try:
+                self._step(chamber, readings, wall_time, mono_time)
+            except Exception as e:
+                print(f"[Chambers] Chamber '{chamber.name}' control pass failed: {e}")
+
+    def _step(self, chamber, readings, wall_time, mono_time):
+        params = chamber.params
+        beer_id = params.ds18b20_beer_sensor
+        amb_id = params.ds18b20_ambient_sensor
+        beer_temp = condition_reading(chamber.conditioners, "beer", beer_id, readings.get(beer_id), params.beer_conditioning)
+        amb_temp = condition_reading(chamber.conditioners, "ambient", amb_id, readings.get(amb_id), params.ambient_conditioning)
+
+        drives_relays = chamber.relays_active
+        inputs = KernelInputs(beer_temp, amb_temp, wall_time, mono_time, chamber.monitoring, drives_relays)
+        # Under the registry lock: a reset_ramp()/reset_profile() from the UI thread is not overwritten
+        with self._lock:
+            outputs, chamber.kernel_state = control_step(inputs, params, chamber.kernel_state)
+        chamber.outputs = outputs
+
+        # --- EFFECTS ---
+        for line in outputs.console:
+            print(f"[{chamber.name}] {line}")
+        for message in outputs.messages:
+            self._log(chamber, message)
+        if outputs.pid_log is not None and params.pid_logging_enabled:
+            self._log_pid_data(chamber, params, outputs.pid_log, amb_temp)
+        if outputs.persist:
+            self._persist(chamber, outputs.persist)
+
+        # --- RELAYS ---
+        if drives_relays:
+            desired_cool = outputs.desired_cool
+            planner_message = chamber.compressor_planner.unavailable_message(params)
+            if planner_message:
+                self._log(chamber, planner_message)
+            if chamber.monitoring and chamber.compressor_planner.applies(outputs, params):
+                desired_cool = chamber.compressor_planner.decide(outputs, params, beer_temp, amb_temp,
+                                                                 chamber.relay_control.cooling_window(params), mono_time)
+            final_heat, final_cool = chamber.relay_control.set_desired_states(
+                outputs.desired_heat, desired_cool, outputs.current_mode, params=params)
+            if not chamber.monitoring and not final_heat and not final_cool:
+                chamber.relays_active = False
+                print(f"[Chambers] Chamber '{chamber.name}' stopped; relays are safely OFF.")
+
+        # --- LIVE STATE ---
+        now_str = self.clock.now().strftime("%H:%M:%S")
+        chamber.live_state.update(
+            beer_temp_actual=beer_temp if beer_temp is not None else "--.-",
+            amb_temp_actual=amb_temp if amb_temp is not None else "--.-",
+            amb_min_setpoint=outputs.amb_min,
+            amb_max_setpoint=outputs.amb_max,
+            beer_setpoint_current=outputs.beer_setpoint,
+            amb_target_setpoint=outputs.ambient_target,
+            sensor_error_message=outputs.sensor_error_message,
+        )
+        if beer_temp is not None:
+            chamber.live_state.update(beer_temp_timestamp=now_str)
+        if amb_temp is not None:
+            chamber.live_state.update(amb_temp_timestamp=now_str)
+
+    def _log(self, chamber, message):
+        if self.log_message:
+            self.log_message(f"[{chamber.name}] {message}")
+
+    def _log_pid_data(self, chamber, params, pid_log, amb_temp):
+        try:
+            os.makedirs(self.data_dir, exist_ok=True)
+            append_pid_log_row(
+                os.path.join(self.data_dir, f"pid_log_{chamber.chamber_id}.csv"),
+                self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
+                params.control_mode,
+                pid_log,
+                "ON" if "COOLING" in chamber.live_state.cool_state else "OFF",
+                "ON" if "HEATING" in chamber.live_state.heat_state else "OFF",
+                amb_temp,
+            )
+        except Exception as e:
+            print(f"[ERROR] Failed to write PID log for chamber '{chamber.name}': {e}")
+
+    def cleanup(self):
+        """Stops the loop and switches every chamber's relays off (app exit)."""
+        self.stop()
+        for chamber in self.chambers():
+            self._release(chamber)
@@ -0,0 +1,102 @@
+"""
+fermvault app
+clock.py
+"""
+
+import time
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+
+class Clock(ABC):
+    """
+    Time source for the control, relay and notification logic.
+      time()       - wall-clock epoch seconds (persisted timestamps, ramp start, display)
+      monotonic()  - seconds for intervals and deadlines (never jumps)
+      now()        - wall-clock datetime
+      sleep(s)     - blocks for s seconds
+      wait(ev, s)  - waits up to s seconds for a threading.Event; returns True if it is set
+    """
+
+    @abstractmethod
+    def time(self):
+        """Wall-clock epoch seconds."""
+
+    @abstractmethod
+    def monotonic(self):
+        """Seconds on a clock that never jumps."""
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    @abstractmethod
+    def sleep(self, seconds):
+        """Blocks for 'seconds'."""
+
+    @abstractmethod
+    def wait(self, event, timeout):
+        """Waits up to 'timeout' seconds for 'event'; returns True if it is set."""
+
+
+class SystemClock(Clock):
+    """The real clock."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """
+    Simulated clock. Time only moves when advance() is called or when a caller
+    sleeps/waits, which jumps time forward instead of blocking. A ramp, dwell or
+    fail-safe scenario therefore runs as fast as the logic executes and gives the
+    same result every run.
+
+    Meant to be driven from one thread (e.g. a simulation stepping the control
+    loop); threads sharing one virtual clock each move it forward when they wait.
+    """
+
+    def __init__(self, start_time=None):
+        # Wall-clock time at the start of the simulation (defaults to the real "now")
+        self.start_time = time.time() if start_time is None else float(start_time)
+        self._elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.start_time + self._elapsed
+
+    def monotonic(self):
+        return self._elapsed
+
+    def advance(self, seconds):
+        """Moves simulated time forward."""
+        if seconds > 0:
+            with self._lock:
+                self._elapsed += seconds
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        if timeout is not None:
+            self.advance(timeout)
+        return event.is_set()
+
+
+SYSTEM_CLOCK = SystemClock()
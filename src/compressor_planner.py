@@ -0,0 +1,197 @@
+"""
+fermvault app
+compressor_planner.py
+"""
+
+import math
+from collections import namedtuple
+
+from thermal_sim import DEFAULT_PLANT, plant_from_model, plant_step
+
+# --- OPTIONAL IMPORT: NumPy (predictive cooling falls back to the thermostat without it) ---
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- PREDICTIVE COMPRESSOR SCHEDULING ---
+# Every tick the planner rolls the chamber model forward over the horizon for a set of
+# candidate compressor schedules and runs the first step of the cheapest one (receding
+# horizon). Candidates are one full cycle from the current relay state - keep the
+# current state for A, switch for B, switch back for the rest of the horizon - with A
+# and B chosen on a grid that already respects the dwell time, the max runtime and any
+# fail-safe lockout, so RelayControl never has to block the plan. Switches fall on the
+# PLAN_STEP_S grid, so the plan is only rebuilt once per step (or when the relay state
+# departs from it); the ticks in between reuse its decision.
+# Cost per candidate: beer outside setpoint +/- tolerance (dominant), air below the
+# envelope floor, compressor starts (favours fewer, longer cycles), squared beer error.
+PLAN_STEP_S = 60
+PLAN_GRID_S = 600
+OUT_OF_BAND_WEIGHT = 100.0      # per F outside the tolerance, per step
+AIR_FLOOR_WEIGHT = 100.0        # per F below amb_min, per step
+START_WEIGHT = 5.0              # per compressor start
+ERROR_WEIGHT = 0.1              # per F^2, per step
+# Online correction of the model's compressor pull-down (EWMA weight, clamp)
+COOL_RATE_ALPHA = 0.1
+COOL_SCALE_LIMITS = (0.2, 5.0)
+
+# Control modes the planner drives (beer-controlled, not an autotune experiment)
+PLANNED_MODES = ("Beer Hold", "Ramp-Up", "Fast Crash", "Profile")
+
+# cool_now: the decision for this tick; switch_in_s / next_state_s: the planned cycle
+# predicted_min_f / predicted_max_f: beer range over the horizon for the chosen plan
+CompressorPlan = namedtuple("CompressorPlan", "cool_now switch_in_s next_state_s starts cost predicted_min_f predicted_max_f")
+
+
+class CompressorPlanner:
+    """
+    Replaces the thermostat's cooling demand with a planned one when predictive
+    cooling is enabled and an identified ThermalModel is available. Heating stays with
+    the thermostat envelope.
+    """
+
+    def __init__(self, model=None, base_plant=DEFAULT_PLANT):
+        self.base_plant = base_plant
+        self.plant = None
+        self.set_model(model)
+        self.cool_scale = 1.0
+        self.plan = None                # Current CompressorPlan
+        self._plan_time = None
+        self._last = None               # (time, air, beer, cool_on) of the last tick
+        self._reported = ""             # Last unavailable_message() reason given
+
+    def set_model(self, model):
+        self.model = model
+        self.plant = plant_from_model(model, self.base_plant) if model is not None else None
+
+    def applies(self, outputs, params):
+        """True if this tick's cooling should come from the planner."""
+        return (params.predictive_cooling and np is not None and self.plant is not None
+                and outputs.current_mode in PLANNED_MODES and not outputs.sensor_error_message)
+
+    def unavailable_message(self, params):
+        """
+        Why predictive cooling, enabled in 'params', cannot run (NumPy or the thermal
+        model missing). Returned once per reason so the caller can tell the user instead
+        of silently staying on the thermostat; "" otherwise.
+        """
+        reason = ""
+        if params.predictive_cooling:
+            if np is None:
+                reason = "Predictive cooling needs NumPy (pip install numpy). Using the thermostat."
+            elif self.plant is None:
+                reason = "Predictive cooling needs an identified thermal model (thermal_model.py). Using the thermostat."
+        if reason == self._reported:
+            return ""
+        self._reported = reason
+        return reason
+
+    def decide(self, outputs, params, beer_temp, amb_temp, window, now):
+        """
+        Returns the compressor demand for this tick. 'window' is the relay's
+        CoolingWindow; 'now' is the tick time (s).
+        """
+        plant = self.plant._replace(room_f=params.mpc_room_f)
+        self._learn_cool_rate(plant, beer_temp, amb_temp, window.cool_on, now)
+        if (self.plan is not None and now - self._plan_time < PLAN_STEP_S
+                and (window.cool_on == self.plan.cool_now or self.plan.switch_in_s == 0)):
+            return self.plan.cool_now
+        plant = plant._replace(cool_f_per_s=plant.cool_f_per_s * self.cool_scale)
+        self.plan = plan_compressor(plant, beer_temp, amb_temp, outputs.beer_setpoint, outputs.amb_min,
+                                    window, params)
+        self._plan_time = now
+        return self.plan.cool_now
+
+    def _learn_cool_rate(self, plant, beer_temp, amb_temp, cool_on, now):
+        """Scales the model's pull-down rate to the air slope seen while the compressor runs."""
+        last, self._last = self._last, (now, amb_temp, beer_temp, cool_on)
+        if last is None or not (cool_on and last[3]):
+            return
+        dt = now - last[0]
+        if not 0 < dt <= 4 * PLAN_STEP_S:
+            return
+        passive = plant.air_loss_per_s * (plant.room_f - last[1]) + plant.air_beer_per_s * (last[2] - last[1])
+        observed_cool = passive - (amb_temp - last[1]) / dt
+        if observed_cool > 0:
+            scale = (1 - COOL_RATE_ALPHA) * self.cool_scale + COOL_RATE_ALPHA * observed_cool / plant.cool_f_per_s
+            self.cool_scale = min(COOL_SCALE_LIMITS[1], max(COOL_SCALE_LIMITS[0], scale))
+
+    def reset(self):
+        self.plan = None
+        self._plan_time = None
+        self._last = None
+        self._reported = ""
+
+
+def _candidate_schedules(window, params, steps):
+    """Boolean compressor schedules (one row per candidate), 'no switch now' candidates first."""
+    dwell = math.ceil(params.cooling_dwell_time_s / PLAN_STEP_S)
+    max_run = max(1, int(params.max_cool_runtime_s // PLAN_STEP_S))
+    grid = max(1, PLAN_GRID_S // PLAN_STEP_S)
+    if window.cool_on:
+        earliest = math.ceil(window.dwell_remaining_s / PLAN_STEP_S)
+        latest = max(earliest, int((params.max_cool_runtime_s - window.run_s) // PLAN_STEP_S))
+        min_second, max_second = max(dwell, 1), steps
+    else:
+        earliest = math.ceil(max(window.dwell_remaining_s, window.lockout_remaining_s) / PLAN_STEP_S)
+        latest = steps
+        min_second, max_second = max(dwell, 1), max_run
+
+    firsts = sorted({min(a, steps) for a in list(range(earliest, latest + 1, grid)) + [latest, steps]})
+    firsts.sort(key=lambda a: a == 0) # Staying in the current state first (ties keep the relay still)
+    rows = []
+    for first in firsts:
+        if first >= steps:
+            rows.append((first, 0))
+            continue
+        seconds = set(range(min_second, min(max_second, steps - first) + 1, grid))
+        seconds.update((min(min_second, steps - first), min(max_second, steps - first)))
+        rows.extend((first, second) for second in sorted(seconds))
+
+    schedules = np.empty((len(rows), steps), dtype=bool)
+    for i, (first, second) in enumerate(rows):
+        state = window.cool_on
+        schedules[i, :first] = state
+        schedules[i, first:first + second] = not state
+        rest = schedules[i, first + second:]
+        rest[:] = state
+        if state:
+            rest[max_run:] = False # Back on: still bound by the max runtime
+    return schedules, rows
+
+
+def plan_compressor(plant, beer_temp, amb_temp, setpoint, amb_floor, window, params):
+    """
+    Plans the compressor over params.mpc_horizon_s from the current readings. Returns
+    the cheapest CompressorPlan (all candidates are rolled out at once with NumPy).
+    """
+    steps = max(2, int(params.mpc_horizon_s // PLAN_STEP_S))
+    schedules, rows = _candidate_schedules(window, params, steps)
+    count = schedules.shape[0]
+
+    beer = np.full(count, float(beer_temp))
+    air = np.full(count, float(amb_temp))
+    out_of_band = np.zeros(count)
+    below_floor = np.zeros(count)
+    sq_error = np.zeros(count)
+    beer_min = beer.copy()
+    beer_max = beer.copy()
+    for j in range(steps):
+        beer, air = plant_step(plant, beer, air, False, schedules[:, j], PLAN_STEP_S)
+        error = beer - setpoint
+        out_of_band += np.maximum(np.abs(error) - params.mpc_beer_tolerance_f, 0.0)
+        below_floor += np.maximum(amb_floor - air, 0.0)
+        sq_error += error * error
+        np.minimum(beer_min, beer, out=beer_min)
+        np.maximum(beer_max, beer, out=beer_max)
+
+    starts = (schedules[:, 0] & (not window.cool_on)).astype(int) + np.sum(schedules[:, 1:] & ~schedules[:, :-1], axis=1)
+    cost = (OUT_OF_BAND_WEIGHT * out_of_band + AIR_FLOOR_WEIGHT * below_floor
+            + START_WEIGHT * starts + ERROR_WEIGHT * sq_error)
+    best = int(np.argmin(cost))
+    first, second = rows[best]
+    return CompressorPlan(
+        cool_now=bool(schedules[best, 0]), switch_in_s=first * PLAN_STEP_S, next_state_s=second * PLAN_STEP_S,
+        starts=int(starts[best]), cost=float(cost[best]),
+        predicted_min_f=float(beer_min[best]), predicted_max_f=float(beer_max[best]),
+    )
@@ -0,0 +1,548 @@
+"""
+fermvault app
+control_kernel.py
+"""
+
+import os
+import csv
+from collections import namedtuple
+from datetime import datetime
+
+from autotune import autotune_step
+from fermentation_profile import start_profile, advance_profile, profile_point, profile_record, resume_profile
+
+# --- CONTROL KERNEL ---
+# One pure function, control_step(inputs, params, state) -> (outputs, new_state), holds
+# the sensor validation, fail-safe, setpoint, PID, ramp and profile logic. It does no I/O:
+# no settings, relays, files, UI or clock reads. The monitor and standby paths in
+# TemperatureController read sensors, call it, and carry out the returned effects
+# (log messages, PID log row, ramp/profile persistence), so the kernel can be replayed,
+# batched and benchmarked on its own. (append_pid_log_row is the callers' CSV writer.)
+
+# PID output clamp (F offset added to the beer setpoint to get the ambient setpoint)
+PID_OUT_MIN = -10.0
+PID_OUT_MAX = 5.0
+
+# Ambient envelope clamp (F)
+AMBIENT_ENVELOPE_MIN_F = -10.0
+AMBIENT_ENVELOPE_MAX_F = 100.0
+
+# beer_temp / amb_temp: conditioned readings (F), None for a failed or unassigned probe
+# wall_time: epoch seconds (ramp timing); mono_time: monotonic seconds (PID dt)
+# monitoring: monitoring is ON; drives_relays: this pass controls the relays (monitor loop).
+# A pass that does not drive the relays is a preview: it reports setpoints for the UI
+# but only keeps the sensor/fail-safe latches, never the PID or ramp state.
+KernelInputs = namedtuple("KernelInputs", "beer_temp amb_temp wall_time mono_time monitoring drives_relays")
+
+KernelState = namedtuple("KernelState", (
+    "beer_ok amb_ok fail_safe_logged "
+    "pid_setpoint pid_integral pid_last_error pid_last_time "
+    "ramp_target ramp_start_time ramp_start_temp ramp_finished ramp_pre_ramp ramp_logging_done "
+    "autotune profile"
+))
+
+# messages: UI system log lines; console: print() lines
+# pid_log: (setpoint, measured, pid_output, amb_min, amb_max) row for pid_log.csv, or None
+# persist: {settings key: value} for the ramp/profile state that must survive a restart
+KernelOutputs = namedtuple("KernelOutputs", (
+    "desired_heat desired_cool amb_min amb_max beer_setpoint ambient_target current_mode "
+    "sensor_error_message fail_safe_active ramp_target_message ramp_end_target ramp_start_time "
+    "ramp_is_finished messages console pid_log persist"
+))
+
+# Compressor constraints as seen by a planner (RelayControl.cooling_window()): relay state,
+# current run length, and the time (s) until the dwell / fail-safe lockout allow a change
+CoolingWindow = namedtuple("CoolingWindow", "cool_on run_s dwell_remaining_s lockout_remaining_s")
+
+_LATCH_FIELDS = ("beer_ok", "amb_ok", "fail_safe_logged")
+
+# Columns of pid_log.csv (one row per KernelOutputs.pid_log)
+PID_LOG_FIELDS = ['Timestamp', 'ControlMode', 'Setpoint', 'MeasuredTemp', 'PID_Output',
+                  'AmbientSetpoint_Min', 'AmbientSetpoint_Max', 'CoolState', 'HeatState', 'AmbientTemp']
+
+# log path -> columns of that file (logs started before a column was added keep their header)
+_pid_log_headers = {}
+
+
+def append_pid_log_row(log_file_path, timestamp, control_mode, pid_log, cool_state, heat_state, amb_temp=None):
+    """Appends one KernelOutputs.pid_log row to a PID log CSV (header on first write). Raises on I/O errors."""
+    setpoint, measured_temp, pid_output, amb_min, amb_max = pid_log
+    file_exists = os.path.isfile(log_file_path)
+    fieldnames = _pid_log_headers.get(log_file_path) if file_exists else None
+    if fieldnames is None:
+        fieldnames = PID_LOG_FIELDS
+        if file_exists:
+            with open(log_file_path, newline='') as csvfile:
+                fieldnames = next(csv.reader(csvfile), None) or PID_LOG_FIELDS
+        _pid_log_headers[log_file_path] = fieldnames
+    with open(log_file_path, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow({
+            'Timestamp': timestamp,
+            'ControlMode': control_mode,
+            'Setpoint': f"{setpoint:.2f}",
+            'MeasuredTemp': f"{measured_temp:.3f}",
+            'PID_Output': f"{pid_output:.4f}",
+            'AmbientSetpoint_Min': f"{amb_min:.2f}",
+            'AmbientSetpoint_Max': f"{amb_max:.2f}",
+            'CoolState': cool_state,
+            'HeatState': heat_state,
+            'AmbientTemp': f"{amb_temp:.3f}" if amb_temp is not None else "",
+        })
+
+
+def initial_state():
+    """Kernel state at startup: sensors assumed OK, PID cleared, no ramp in progress."""
+    return KernelState(
+        beer_ok=True, amb_ok=True, fail_safe_logged=False,
+        pid_setpoint=0.0, pid_integral=0.0, pid_last_error=0.0, pid_last_time=None,
+        autotune=None, profile=None,
+        **_fresh_ramp(),
+    )
+
+
+def _fresh_ramp():
+    return dict(ramp_target=0.0, ramp_start_time=0.0, ramp_start_temp=None, ramp_finished=False,
+                ramp_pre_ramp=True, ramp_logging_done=False)
+
+
+def reset_ramp(state):
+    """Returns 'state' with the ramp back at its pre-ramp start."""
+    return state._replace(**_fresh_ramp())
+
+
+def resume_ramp(state, params, wall_time, start_time, start_temp, is_finished):
+    """
+    Returns 'state' with a persisted ramp restored (main ramp already under way) and its
+    target computed for 'wall_time', so the target never reads 0.0 while sensors warm up.
+    """
+    end_temp = params.ramp_up_hold_f
+    if is_finished or params.ramp_up_duration_s <= 0:
+        target = end_temp
+    else:
+        elapsed = wall_time - start_time
+        if elapsed >= params.ramp_up_duration_s:
+            target = end_temp
+            is_finished = True
+        else:
+            target = start_temp + (end_temp - start_temp) * elapsed / params.ramp_up_duration_s
+    return state._replace(
+        ramp_target=target, ramp_start_time=start_time, ramp_start_temp=start_temp,
+        ramp_finished=bool(is_finished), ramp_pre_ramp=False, ramp_logging_done=False,
+        pid_setpoint=target, # Prime the PID so it doesn't see a 0->Target jump
+    )
+
+
+def reset_profile(state):
+    """Returns 'state' with no profile run (the Profile mode starts a new one)."""
+    return state._replace(profile=None)
+
+
+def resume_profile_run(state, record, wall_time):
+    """
+    Returns 'state' with the profile run saved in 'record' (settings "profile_run")
+    restored, or unchanged if the record is empty or unreadable. The PID is primed
+    with the run's target at 'wall_time'.
+    """
+    run = resume_profile(record)
+    if run is None:
+        return state
+    return state._replace(profile=run, pid_setpoint=profile_point(run, wall_time).target_f)
+
+
+# --- PID ---
+def pid_step(kp, ki, kd, setpoint, process_variable, integral, last_error, dt,
+             out_min=PID_OUT_MIN, out_max=PID_OUT_MAX):
+    """One PID update with output clamping. Returns (output, integral, last_error)."""
+    error = setpoint - process_variable
+
+    # Calculate P and D terms first so we can use them for anti-windup
+    p_term = kp * error
+    derivative = (error - last_error) / dt if dt > 0 else 0
+    d_term = kd * derivative
+
+    # Add to integral and calculate provisional output
+    integral += error * dt
+    output = p_term + ki * integral + d_term
+
+    # Output Clamping and Anti-Windup (Back-calculation)
+    if output > out_max:
+        output = out_max
+        # Stop the integral from ballooning invisibly
+        if ki != 0:
+            integral = (output - p_term - d_term) / ki
+    elif output < out_min:
+        output = out_min
+        if ki != 0:
+            integral = (output - p_term - d_term) / ki
+
+    return output, integral, error
+
+
+def _run_pid(s, params, setpoint, beer_temp, mono_time, reset=False, dt_if_zero=None):
+    """PID update toward 'setpoint' on the working state 's'. 'reset' clears integral and derivative memory first."""
+    if reset:
+        s["pid_integral"] = 0.0
+        s["pid_last_error"] = 0.0
+    s["pid_setpoint"] = setpoint
+
+    last_time = s["pid_last_time"]
+    dt = 0.0 if last_time is None else mono_time - last_time
+    s["pid_last_time"] = mono_time
+    if dt == 0 and dt_if_zero is not None:
+        dt = dt_if_zero
+
+    if abs(beer_temp - setpoint) <= params.pid_idle_zone:
+        s["pid_integral"] = 0.0
+
+    output, s["pid_integral"], s["pid_last_error"] = pid_step(
+        params.pid_kp, params.pid_ki, params.pid_kd, setpoint, beer_temp,
+        s["pid_integral"], s["pid_last_error"], dt)
+    return output
+
+
+def _envelope(ambient_setpoint, width):
+    amb_min = max(AMBIENT_ENVELOPE_MIN_F, min(AMBIENT_ENVELOPE_MAX_F, ambient_setpoint - width))
+    amb_max = max(AMBIENT_ENVELOPE_MIN_F, min(AMBIENT_ENVELOPE_MAX_F, ambient_setpoint + width))
+    return amb_min, amb_max
+
+
+# --- CONTROL MODES ---
+def _ambient_hold(s, fx, inputs, params):
+    """Ambient Temp to the Ambient Hold Setpoint (Simple Thermostat)."""
+    target = params.ambient_hold_f
+    amb_min = target - params.ambient_deadband
+    amb_max = target + params.ambient_deadband
+    # Logged even in Ambient Mode (PID output 0)
+    fx["pid_log"] = (target, inputs.amb_temp, 0.0, amb_min, amb_max)
+    return amb_min, amb_max, ""
+
+
+def _pid_hold(s, fx, inputs, params, target, envelope_width):
+    """Beer Temp to a fixed setpoint (Beer Hold / Fast Crash), PID-assisted."""
+    pid_output = _run_pid(s, params, target, inputs.beer_temp, inputs.mono_time, reset=True)
+    amb_min, amb_max = _envelope(target + pid_output, envelope_width)
+    fx["pid_log"] = (target, inputs.beer_temp, pid_output, amb_min, amb_max)
+    return amb_min, amb_max, ""
+
+
+def _autotune(s, fx, inputs, params):
+    """
+    Relay-feedback autotune around the Beer Hold setpoint (see autotune.py). The PID
+    output is replaced by the +/- relay swing; the envelope and relays work as in Beer
+    Hold. When the run ends the gains are proposed (logged and persisted, not applied)
+    and the beer is held with the current gains.
+    """
+    target = params.beer_hold_f
+    config = params.autotune
+    if s["autotune"] is not None and s["autotune"].status != "running":
+        amb_min, amb_max, _ = _pid_hold(s, fx, inputs, params, target, params.beer_pid_envelope_width)
+        return amb_min, amb_max, "Autotune finished" if s["autotune"].status == "done" else "Autotune failed"
+
+    output, s["autotune"], event = autotune_step(s["autotune"], inputs.beer_temp, target, inputs.mono_time, config)
+    state = s["autotune"]
+    if event == "started":
+        fx["messages"].append(f"Autotune started: relay {params.display_delta(config.relay_f):.1f} {params.temp_units} "
+                              f"around {params.display_temp(target):.1f} {params.temp_units}, {config.cycles} cycles.")
+    elif event == "cycle":
+        fx["console"].append(f"[TempController] Autotune cycle {len(state.periods)}/{config.cycles}: "
+                             f"amplitude {state.amplitudes[-1]:.2f} F, period {state.periods[-1] / 60:.1f} min.")
+    elif event == "done":
+        result = state.result
+        fx["messages"].append(f"Autotune finished: Ku={result.ultimate_gain:.3f}, Pu={result.ultimate_period_s / 60:.1f} min. "
+                              f"Proposed Kp={result.kp:.3f}, Ki={result.ki:.5f}, Kd={result.kd:.1f} ({result.rule}).")
+        fx["persist"]["autotune_result"] = dict(result._asdict())
+    elif event == "failed":
+        fx["messages"].append("Autotune failed: no stable oscillation. Gains unchanged.")
+
+    if event in ("done", "failed"):
+        amb_min, amb_max, _ = _pid_hold(s, fx, inputs, params, target, params.beer_pid_envelope_width)
+        return amb_min, amb_max, "Autotune finished" if event == "done" else "Autotune failed"
+
+    amb_min, amb_max = _envelope(target + output, params.beer_pid_envelope_width)
+    fx["pid_log"] = (target, inputs.beer_temp, output, amb_min, amb_max)
+    return amb_min, amb_max, f"Autotune cycle {len(state.periods) + 1}/{config.cycles}"
+
+
+def _ramp_up(s, fx, inputs, params):
+    """
+    Beer temp in three stages:
+    1. [Pre-Ramp]: Holds at start_temp until beer is stable (PID).
+    2. [Main Ramp]: Uses PID to force beer to follow the moving target.
+    3. [PID Landing]: Switches back to static PID to "soft land" at the end_temp.
+    """
+    beer_temp = inputs.beer_temp
+    live_start_temp = params.beer_hold_f
+    end_temp = params.ramp_up_hold_f
+    duration_hours = params.ramp_up_duration_hours
+
+    # --- STATE 1: Pre-Ramp (Waiting to hit start temp) ---
+    if s["ramp_pre_ramp"]:
+        if not s["ramp_logging_done"]:
+            fx["messages"].append("Ramp pre-condition: bringing beer to setpoint before starting ramp.")
+            s["ramp_logging_done"] = True
+
+        # Simple hold at the start_temp
+        pid_output = _run_pid(s, params, live_start_temp, beer_temp, inputs.mono_time,
+                              reset=s["pid_setpoint"] != live_start_temp)
+        amb_min, amb_max = _envelope(live_start_temp + pid_output, params.beer_pid_envelope_width)
+
+        # Transition to Ramping: latch the start parameters now
+        if abs(beer_temp - live_start_temp) <= params.ramp_pre_ramp_tolerance:
+            fx["console"].append(f"[TempController] Ramp pre-condition met. Starting ramp from {live_start_temp}F.")
+            s.update(ramp_pre_ramp=False, ramp_logging_done=False, ramp_target=live_start_temp,
+                     ramp_start_temp=live_start_temp, ramp_start_time=inputs.wall_time, ramp_finished=False)
+            fx["persist"].update(ramp_start_time=inputs.wall_time, ramp_latched_start_temp=live_start_temp,
+                                 ramp_is_finished=False)
+        return amb_min, amb_max, "Ramp pre-condition"
+
+    # --- Ramp Increment Logic (LATCHED start temp) ---
+    start_temp = s["ramp_start_temp"] if s["ramp_start_temp"] is not None else live_start_temp
+    if s["ramp_finished"]:
+        s["ramp_target"] = end_temp
+    elif duration_hours > 0 and inputs.wall_time - s["ramp_start_time"] < params.ramp_up_duration_s:
+        fraction_complete = (inputs.wall_time - s["ramp_start_time"]) / params.ramp_up_duration_s
+        s["ramp_target"] = start_temp + (end_temp - start_temp) * fraction_complete
+    else:
+        # Ramp time elapsed (or no duration): hold at end_temp and persist the finished state once
+        s["ramp_target"] = end_temp
+        s["ramp_finished"] = True
+        fx["persist"]["ramp_is_finished"] = True
+    target_beer_temp = s["ramp_target"]
+
+    if s["ramp_finished"]:
+        ramp_target_message = "Ramp Finished"
+    else:
+        end_time_str = datetime.fromtimestamp(s["ramp_start_time"] + params.ramp_up_duration_s).strftime("%m-%d %H:%M:%S")
+        ramp_target_message = f"Target {params.display_temp(end_temp):.1f} {params.temp_units} at {end_time_str}"
+
+    # --- STATE 3: PID Landing ---
+    if not s["ramp_finished"] and (end_temp - target_beer_temp) < params.ramp_pid_landing_zone:
+        if not s["ramp_logging_done"]:
+            fx["messages"].append("Ramp-Up: Entering final PID landing zone.")
+            s["ramp_logging_done"] = True
+
+        pid_output = _run_pid(s, params, end_temp, beer_temp, inputs.mono_time,
+                              reset=s["pid_setpoint"] != end_temp, dt_if_zero=1.0)
+        amb_min, amb_max = _envelope(end_temp + pid_output, params.beer_pid_envelope_width)
+        fx["pid_log"] = (end_temp, beer_temp, pid_output, amb_min, amb_max)
+        return amb_min, amb_max, "Ramp Landing..."
+
+    # --- STATE 2: Main Ramp (PID Driven) ---
+    if not s["ramp_logging_done"]:
+        if duration_hours > 0:
+            rate_per_hour = params.display_delta(end_temp - start_temp) / duration_hours
+            fx["messages"].append(f"Ramp started: {rate_per_hour:.2f} {params.temp_units} degree change every hour.")
+        s["ramp_logging_done"] = True
+
+    # PID Control for Moving Target (no reset: the setpoint moves every tick)
+    pid_output = _run_pid(s, params, target_beer_temp, beer_temp, inputs.mono_time, dt_if_zero=1.0)
+    amb_min, amb_max = _envelope(target_beer_temp + pid_output, params.beer_pid_envelope_width)
+    fx["pid_log"] = (target_beer_temp, beer_temp, pid_output, amb_min, amb_max)
+    return amb_min, amb_max, ramp_target_message
+
+
+def _profile(s, fx, inputs, params):
+    """
+    Beer temp follows the fermentation profile (see fermentation_profile.py). The run
+    starts on the first pass (a leading ramp starts from the beer temperature) and its
+    record is persisted at the start, at every wait that ends and when it finishes.
+    Ramps track the moving target; holds, waits and crashes PID to a fixed target.
+    """
+    beer_temp = inputs.beer_temp
+    if s["profile"] is None:
+        definition = params.fermentation_profile
+        if definition is None:
+            amb_min, amb_max, _ = _pid_hold(s, fx, inputs, params, params.beer_hold_f, params.beer_pid_envelope_width)
+            return amb_min, amb_max, "No profile set"
+        s["profile"] = start_profile(definition, beer_temp, inputs.wall_time)
+        fx["messages"].append(f"Profile '{definition.name}' started: {len(definition.steps)} steps "
+                              f"from {params.display_temp(beer_temp):.1f} {params.temp_units}.")
+        fx["persist"]["profile_run"] = profile_record(s["profile"])
+
+    run, point, event = advance_profile(s["profile"], beer_temp, inputs.wall_time)
+    s["profile"] = run
+    steps = run.table.definition.steps
+    if event:
+        fx["persist"]["profile_run"] = profile_record(run)
+        if event == "finished":
+            fx["messages"].append(f"Profile '{run.table.definition.name}' finished. Holding "
+                                  f"{params.display_temp(point.target_f):.1f} {params.temp_units}.")
+        else:
+            fx["messages"].append(f"Profile: wait condition met. Starting step {point.step + 1}/{len(steps)}.")
+
+    target = point.target_f
+    if point.kind == "ramp":
+        # Moving target: no reset (as the main Ramp-Up)
+        pid_output = _run_pid(s, params, target, beer_temp, inputs.mono_time, dt_if_zero=1.0)
+    else:
+        pid_output = _run_pid(s, params, target, beer_temp, inputs.mono_time, reset=s["pid_setpoint"] != target)
+    width = params.crash_pid_envelope_width if point.kind == "crash" else params.beer_pid_envelope_width
+    amb_min, amb_max = _envelope(target + pid_output, width)
+    fx["pid_log"] = (target, beer_temp, pid_output, amb_min, amb_max)
+
+    end_temp = f"{params.display_temp(point.end_f):.1f} {params.temp_units}"
+    if run.finished:
+        return amb_min, amb_max, "Profile Finished"
+    if point.kind == "wait":
+        return amb_min, amb_max, f"Step {point.step + 1}/{len(steps)}: Waiting at {end_temp}"
+    end_time_str = datetime.fromtimestamp(point.end_time).strftime("%m-%d %H:%M:%S")
+    action = {"hold": "Hold at", "ramp": "Ramp to", "crash": "Crash to"}[point.kind]
+    return amb_min, amb_max, f"Step {point.step + 1}/{len(steps)}: {action} {end_temp} until {end_time_str}"
+
+
+def _sensor_change_messages(messages, name, ok, was_ok, sensor_id):
+    if ok and not was_ok:
+        messages.append(f"{name} sensor re-connected.")
+    elif not ok and was_ok:
+        if sensor_id == "unassigned":
+            messages.append(f"{name} sensor is unassigned. Please set in System Settings.")
+        else:
+            messages.append(f"{name} sensor reading failed. Check connection.")
+
+
+def _sensor_error(mode, beer_ok, amb_ok, params):
+    """The critical sensor error for 'mode', or "" when the mode has the probes it needs."""
+    if mode == "Ambient Hold":
+        # A missing beer sensor is logged, but is not a critical error here
+        if not amb_ok:
+            return "FAIL: Ambient Sensor Unassigned" if params.ds18b20_ambient_sensor == "unassigned" else "FAIL: Ambient Sensor Missing"
+    elif mode in ("Beer Hold", "Ramp-Up", "Fast Crash", "Autotune", "Profile"):
+        if not beer_ok and not amb_ok:
+            return "FAIL: Both Sensors Failed" # Generic, as this is a total failure
+        if not beer_ok:
+            return "FAIL: Beer Sensor Unassigned" if params.ds18b20_beer_sensor == "unassigned" else "FAIL: Beer Sensor Missing"
+        if not amb_ok:
+            return "FAIL: Ambient Sensor Unassigned" if params.ds18b20_ambient_sensor == "unassigned" else "FAIL: Ambient Sensor Missing"
+    return ""
+
+
+def _new_effects():
+    return {"messages": [], "console": [], "pid_log": None, "persist": {}}
+
+
+def control_step(inputs, params, state):
+    """
+    One control pass. Takes the conditioned readings, the pass's ControlParams and the
+    previous KernelState; returns (KernelOutputs, new KernelState). Pure: the inputs
+    and state are not modified and nothing outside is touched.
+    """
+    s = state._asdict()
+    fx = _new_effects()
+    messages = fx["messages"]
+    beer_temp, amb_temp = inputs.beer_temp, inputs.amb_temp
+    beer_ok = beer_temp is not None
+    amb_ok = amb_temp is not None
+
+    # --- 1. SENSOR STATE CHANGES (latched: logged once per transition) ---
+    _sensor_change_messages(messages, "Beer", beer_ok, s["beer_ok"], params.ds18b20_beer_sensor)
+    _sensor_change_messages(messages, "Ambient", amb_ok, s["amb_ok"], params.ds18b20_ambient_sensor)
+    s["beer_ok"] = beer_ok
+    s["amb_ok"] = amb_ok
+
+    # --- 2. VALIDATE SENSORS BASED ON CONTROL MODE ---
+    current_mode = params.control_mode
+    sensor_error_message = _sensor_error(current_mode, beer_ok, amb_ok, params)
+
+    # --- 3. SETPOINTS (always needed for the UI) ---
+    ambient_target = params.ambient_hold_f
+    ramp_end_target = 0.0
+    ramp_start_time = 0.0
+    ramp_is_finished = False
+    if current_mode == "Ramp-Up":
+        live_ramp = inputs.monitoring and not s["ramp_pre_ramp"]
+        beer_setpoint = s["ramp_target"] if live_ramp else params.beer_hold_f
+        ramp_end_target = params.ramp_up_hold_f
+        ramp_start_time = s["ramp_start_time"]
+        ramp_is_finished = s["ramp_finished"]
+    elif current_mode == "Profile" and s["profile"] is not None:
+        point = profile_point(s["profile"], inputs.wall_time)
+        beer_setpoint = point.target_f
+        ramp_end_target = point.end_f
+        ramp_start_time = s["profile"].phase_start_time
+        ramp_is_finished = s["profile"].finished
+    elif current_mode == "Fast Crash":
+        beer_setpoint = params.fast_crash_hold_f
+    else: # Beer Hold, Autotune, Ambient Hold, Off, or a Profile not started yet
+        beer_setpoint = params.beer_hold_f
+    if current_mode != "Autotune":
+        s["autotune"] = None # Leaving the mode abandons a run; re-entering starts over
+
+    # --- 4. FAIL-SAFE, ERROR OR NORMAL CONTROL ---
+    desired_heat = False
+    desired_cool = False
+    amb_min, amb_max = 0.0, 0.0
+    ramp_target_message = ""
+
+    # "Limp-Home" Mode (Beer Sensor Failed/Unassigned, Ambient OK)
+    fail_safe_active = ("FAIL: Beer Sensor" in sensor_error_message) and amb_ok
+
+    if fail_safe_active:
+        if not s["fail_safe_logged"]:
+            messages.append(f"FAIL-SAFE: Beer sensor failed. Holding chamber at {beer_setpoint:.1f} F.")
+            s["fail_safe_logged"] = True
+        # Simple thermostatic control on AMBIENT around the beer setpoint
+        amb_min = beer_setpoint - params.ambient_deadband
+        amb_max = beer_setpoint + params.ambient_deadband
+        desired_heat = amb_temp < amb_min
+        desired_cool = amb_temp > amb_max
+
+    elif sensor_error_message:
+        # Other critical sensor error: shutdown (envelope stays 0.0)
+        if s["fail_safe_logged"]:
+            messages.append("FAIL-SAFE: Resuming normal shutdown (other sensor failed).")
+            s["fail_safe_logged"] = False
+
+    else:
+        if s["fail_safe_logged"]:
+            messages.append("FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
+            s["fail_safe_logged"] = False
+
+        # A preview runs the mode logic on scratch effects; its state changes are dropped below
+        mode_fx = fx if inputs.drives_relays else _new_effects()
+        if current_mode == "Ambient Hold":
+            amb_min, amb_max, ramp_target_message = _ambient_hold(s, mode_fx, inputs, params)
+        elif current_mode == "Beer Hold":
+            amb_min, amb_max, ramp_target_message = _pid_hold(s, mode_fx, inputs, params, params.beer_hold_f, params.beer_pid_envelope_width)
+        elif current_mode == "Ramp-Up":
+            amb_min, amb_max, ramp_target_message = _ramp_up(s, mode_fx, inputs, params)
+        elif current_mode == "Fast Crash":
+            amb_min, amb_max, ramp_target_message = _pid_hold(s, mode_fx, inputs, params, params.fast_crash_hold_f, params.crash_pid_envelope_width)
+        elif current_mode == "Autotune":
+            amb_min, amb_max, ramp_target_message = _autotune(s, mode_fx, inputs, params)
+        elif current_mode == "Profile":
+            amb_min, amb_max, ramp_target_message = _profile(s, mode_fx, inputs, params)
+
+        # Relay demand from the ambient envelope
+        desired_heat = amb_temp < amb_min
+        desired_cool = amb_temp > amb_max
+
+    # --- 5. SHUTDOWN OVERRIDE (monitoring stopped; relays go OFF, Aux follows mode "OFF") ---
+    if inputs.drives_relays and not inputs.monitoring:
+        fx["console"].append("[Monitor Loop] Shutdown requested. Sending OFF commands.")
+        desired_heat = False
+        desired_cool = False
+        current_mode = "OFF"
+        sensor_error_message = ""
+        if s["fail_safe_logged"]:
+            messages.append("FAIL-SAFE: Monitoring stopped. Resuming normal shutdown.")
+            s["fail_safe_logged"] = False
+
+    if inputs.drives_relays:
+        new_state = KernelState(**s)
+    else:
+        new_state = state._replace(**{name: s[name] for name in _LATCH_FIELDS})
+
+    outputs = KernelOutputs(
+        desired_heat=desired_heat, desired_cool=desired_cool,
+        amb_min=amb_min, amb_max=amb_max,
+        beer_setpoint=beer_setpoint, ambient_target=ambient_target,
+        current_mode=current_mode, sensor_error_message=sensor_error_message,
+        fail_safe_active=fail_safe_active, ramp_target_message=ramp_target_message,
+        ramp_end_target=ramp_end_target, ramp_start_time=ramp_start_time, ramp_is_finished=ramp_is_finished,
+        messages=tuple(messages), console=tuple(fx["console"]),
+        pid_log=fx["pid_log"], persist=fx["persist"],
+    )
+    return outputs, new_state
@@ -0,0 +1,203 @@
+"""
+fermvault app
+control_params.py
+"""
+
+# --- CONTROL PARAMETER SPEC ---
+# (attribute / settings key, default, kind). Temperatures and temperature deltas are
+# stored in Fahrenheit (the settings source of truth); durations in seconds/hours as named.
+#   "temp"     - absolute temperature (F)
+#   "delta"    - temperature width/deadband (F), must be >= 0
+#   "duration" - time value, must be >= 0
+#   "flag"     - boolean
+#   "text"     - string passed through as-is
+#   "bits"     - DS18B20 resolution: 9-12, or 0 to leave the probe as configured
+#   "count"    - integer >= 1
+#   "fraction" - number in (0, 1]
+#   "gain"     - PID gain, must be >= 0
+#   "profile"  - fermentation profile definition, parsed to a ProfileDefinition (or None)
+from sensor_conditioning import ConditioningConfig
+from autotune import AutotuneConfig
+from fermentation_profile import ProfileDefinition, parse_profile
+
+# --- CONTROL MODE DEFAULTS (also the settings defaults, see SettingsManager) ---
+DEFAULT_CONTROL_MODE = "Beer Hold"
+DEFAULT_AMBIENT_HOLD_F = 68.0
+DEFAULT_BEER_HOLD_F = 55.0
+DEFAULT_RAMP_UP_HOLD_F = 68.0
+DEFAULT_RAMP_UP_DURATION_HOURS = 30.0
+DEFAULT_FAST_CRASH_HOLD_F = 34.0
+
+CONTROL_PARAM_SPEC = (
+    ("control_mode", DEFAULT_CONTROL_MODE, "text"),
+    ("temp_units", "F", "text"),
+
+    ("ambient_hold_f", DEFAULT_AMBIENT_HOLD_F, "temp"),
+    ("beer_hold_f", DEFAULT_BEER_HOLD_F, "temp"),
+    ("ramp_up_hold_f", DEFAULT_RAMP_UP_HOLD_F, "temp"),
+    ("fast_crash_hold_f", DEFAULT_FAST_CRASH_HOLD_F, "temp"),
+    ("ramp_up_duration_hours", DEFAULT_RAMP_UP_DURATION_HOURS, "duration"),
+    ("fermentation_profile", None, "profile"),
+
+    ("pid_kp", 2.0, "gain"),
+    ("pid_ki", 0.03, "gain"),
+    ("pid_kd", 20.0, "gain"),
+    ("pid_idle_zone", 0.5, "delta"),
+    ("ambient_deadband", 1.0, "delta"),
+    ("beer_pid_envelope_width", 1.0, "delta"),
+    ("crash_pid_envelope_width", 2.0, "delta"),
+    ("ramp_pre_ramp_tolerance", 0.2, "delta"),
+    ("ramp_thermo_deadband", 0.1, "delta"),
+    ("ramp_pid_landing_zone", 0.5, "delta"),
+
+    ("cooling_dwell_time_s", 180.0, "duration"),
+    ("max_cool_runtime_s", 7200.0, "duration"),
+    ("fail_safe_shutdown_time_s", 3600.0, "duration"),
+
+    ("aux_relay_mode", "MONITORING", "text"),
+    ("ds18b20_beer_sensor", "unassigned", "text"),
+    ("ds18b20_ambient_sensor", "unassigned", "text"),
+    ("ds18b20_beer_resolution_bits", 0, "bits"),
+    ("ds18b20_ambient_resolution_bits", 0, "bits"),
+    ("sensor_timing_mode", "PROBE SETTINGS", "text"),
+    ("sensor_cache_max_age_s", 2.0, "duration"),
+    ("sensor_read_timeout_s", 2.0, "duration"),
+
+    ("beer_filter_median_window", 3, "count"),
+    ("beer_filter_ema_alpha", 1.0, "fraction"),
+    ("beer_filter_max_rate_f_per_min", 2.0, "delta"),
+    ("ambient_filter_median_window", 3, "count"),
+    ("ambient_filter_ema_alpha", 1.0, "fraction"),
+    ("ambient_filter_max_rate_f_per_min", 10.0, "delta"),
+    ("filter_max_rejects", 3, "count"),
+    ("pid_logging_enabled", False, "flag"),
+
+    ("autotune_relay_f", 4.0, "delta"),
+    ("autotune_hysteresis_f", 0.1, "delta"),
+    ("autotune_cycles", 3, "count"),
+    ("autotune_max_hours", 48.0, "duration"),
+    ("autotune_rule", "tyreus-luyben", "text"),
+
+    ("predictive_cooling", False, "flag"),
+    ("mpc_horizon_s", 10800.0, "duration"),
+    ("mpc_beer_tolerance_f", 0.5, "delta"),
+    ("mpc_room_f", 70.0, "temp"),
+
+    ("adaptive_loop_rate", True, "flag"),
+    ("loop_min_period_s", 2.0, "duration"),
+    ("loop_max_period_s", 30.0, "duration"),
+)
+
+CONTROL_PARAM_KEYS = tuple(name for name, _, _ in CONTROL_PARAM_SPEC)
+
+VALID_RESOLUTION_BITS = (0, 9, 10, 11, 12)
+
+# Resolutions used by the "FAST AMBIENT" sensor timing mode. The ambient probe only
+# drives the thermostat envelope; the beer probe feeds the PID and keeps full precision.
+FAST_AMBIENT_RESOLUTION_BITS = 9
+FULL_RESOLUTION_BITS = 12
+
+
+class ControlParams:
+    """
+    Immutable, validated view of every setting the control loop uses.
+    Built once per settings change (see SettingsManager.control_params()) and
+    handed to the control functions, so a tick is plain attribute reads.
+    """
+
+    __slots__ = CONTROL_PARAM_KEYS + ("ramp_up_duration_s", "beer_resolution_bits", "ambient_resolution_bits",
+                                      "beer_conditioning", "ambient_conditioning", "autotune")
+
+    def __init__(self, **values):
+        for name, default, kind in CONTROL_PARAM_SPEC:
+            object.__setattr__(self, name, self._validate(name, values.get(name, default), default, kind))
+        object.__setattr__(self, "ramp_up_duration_s", self.ramp_up_duration_hours * 3600)
+        # Effective probe resolutions after applying the sensor timing mode
+        if self.sensor_timing_mode == "FAST AMBIENT":
+            object.__setattr__(self, "beer_resolution_bits", FULL_RESOLUTION_BITS)
+            object.__setattr__(self, "ambient_resolution_bits", FAST_AMBIENT_RESOLUTION_BITS)
+        else:
+            object.__setattr__(self, "beer_resolution_bits", self.ds18b20_beer_resolution_bits)
+            object.__setattr__(self, "ambient_resolution_bits", self.ds18b20_ambient_resolution_bits)
+        # Per-probe conditioning pipelines
+        object.__setattr__(self, "beer_conditioning", ConditioningConfig(
+            self.beer_filter_median_window, self.beer_filter_ema_alpha,
+            self.beer_filter_max_rate_f_per_min, self.filter_max_rejects))
+        object.__setattr__(self, "ambient_conditioning", ConditioningConfig(
+            self.ambient_filter_median_window, self.ambient_filter_ema_alpha,
+            self.ambient_filter_max_rate_f_per_min, self.filter_max_rejects))
+        # Relay-feedback autotune run
+        object.__setattr__(self, "autotune", AutotuneConfig(
+            self.autotune_relay_f, self.autotune_hysteresis_f, self.autotune_cycles,
+            self.autotune_max_hours * 3600, self.autotune_rule))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Compiles params from a flat settings mapping (e.g. SettingsManager.snapshot())."""
+        return cls(**{name: settings[name] for name in CONTROL_PARAM_KEYS if name in settings})
+
+    @staticmethod
+    def _validate(name, value, default, kind):
+        if kind == "text":
+            return value if isinstance(value, str) else default
+        if kind == "flag":
+            return bool(value)
+        if kind == "profile":
+            if value is None or isinstance(value, ProfileDefinition):
+                return value
+            try:
+                return parse_profile(value)
+            except ValueError as e:
+                print(f"[ControlParams] Invalid fermentation profile for '{name}' ({e}). Profile disabled.")
+                return default
+        if kind == "count":
+            try:
+                count = int(value)
+            except (ValueError, TypeError):
+                count = 0
+            if count < 1:
+                print(f"[ControlParams] Invalid count {value!r} for '{name}'. Using default {default}.")
+                return default
+            return count
+        if kind == "fraction":
+            try:
+                fraction = float(value)
+            except (ValueError, TypeError):
+                fraction = 0.0
+            if not 0.0 < fraction <= 1.0:
+                print(f"[ControlParams] Invalid fraction {value!r} for '{name}'. Using default {default}.")
+                return float(default)
+            return fraction
+        if kind == "bits":
+            try:
+                bits = int(value)
+            except (ValueError, TypeError):
+                bits = None
+            if bits not in VALID_RESOLUTION_BITS:
+                print(f"[ControlParams] Invalid resolution {value!r} for '{name}'. Using default {default}.")
+                return default
+            return bits
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            print(f"[ControlParams] Invalid value {value!r} for '{name}'. Using default {default}.")
+            return float(default)
+        if kind in ("delta", "duration", "gain") and number < 0:
+            print(f"[ControlParams] Negative value {number} for '{name}'. Using default {default}.")
+            return float(default)
+        return number
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ControlParams is immutable")
+
+    def display_temp(self, temp_f):
+        """Converts a Fahrenheit temperature to the user's display units."""
+        return temp_f if self.temp_units == "F" else (temp_f - 32) * 5/9
+
+    def display_delta(self, delta_f):
+        """Converts a Fahrenheit temperature difference to the user's display units."""
+        return delta_f if self.temp_units == "F" else delta_f * 5/9
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in CONTROL_PARAM_KEYS)
+        return f"ControlParams({fields})"
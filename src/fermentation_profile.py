@@ -0,0 +1,191 @@
+"""
+fermvault app
+fermentation_profile.py
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+
+# --- FERMENTATION PROFILES ---
+# A profile is an ordered list of steps (settings key "fermentation_profile"):
+#   {"name": "Ale", "steps": [
+#       {"type": "hold",  "target_f": 66.0, "hours": 72},
+#       {"type": "ramp",  "target_f": 70.0, "hours": 24},          # up or down, linear
+#       {"type": "wait",  "until": "beer_at_target", "tolerance_f": 0.3},
+#       {"type": "crash", "target_f": 34.0, "hours": 48},          # step change, crash envelope
+#   ]}
+# Temperatures are in F, durations in hours. A "wait" step holds the previous target
+# until its condition is met (or its optional "hours" timeout runs out):
+#   beer_at_target - beer within tolerance_f of the held target
+#   beer_below / beer_above - beer at or past target_f
+# When a run starts the steps are compiled into phases, one per stretch between waits.
+# Each phase is a segment table sorted by start offset, so the target at any time is a
+# bisect plus one interpolation. The run is persisted as one versioned record (steps,
+# latched start temperature, current phase and when it started); resume_profile()
+# rebuilds the run from that record and carries on from the same step.
+
+PROFILE_RECORD_VERSION = 1
+
+STEP_TYPES = ("hold", "ramp", "crash", "wait")
+WAIT_CONDITIONS = ("beer_at_target", "beer_below", "beer_above")
+DEFAULT_WAIT_TOLERANCE_F = 0.5
+
+# kind: one of STEP_TYPES; target_f: F (None for a hold/wait on the previous target)
+# duration_s: step length (a wait's timeout, 0 = none); until / tolerance_f: wait condition
+ProfileStep = namedtuple("ProfileStep", "kind target_f duration_s until tolerance_f")
+ProfileDefinition = namedtuple("ProfileDefinition", "name steps")
+
+# start_s / end_s: offsets into the phase; step: index into the profile's steps
+ProfileSegment = namedtuple("ProfileSegment", "start_s end_s start_f end_f kind step")
+# starts: segment start offsets (bisect key); duration_s: end of the timed segments
+# end_f / end_kind / end_step: held after the segments; wait: the ProfileStep ending the phase, or None
+ProfilePhase = namedtuple("ProfilePhase", "starts segments duration_s end_f end_kind end_step wait")
+ProfileTable = namedtuple("ProfileTable", "definition start_f phases")
+
+# phase: index into table.phases; phase_start_time: epoch seconds; finished: past the last step
+ProfileRun = namedtuple("ProfileRun", "table phase phase_start_time finished")
+
+# target_f: beer setpoint; kind: "hold", "ramp", "crash" or "wait"; step: index of the active step
+# end_f / end_time: where and when (epoch seconds) the active step ends; end_time is None while waiting or finished
+ProfilePoint = namedtuple("ProfilePoint", "target_f kind step end_f end_time")
+
+
+def parse_profile(definition):
+    """
+    Validates a profile definition (see above). Returns a ProfileDefinition; raises
+    ValueError naming the first bad step.
+    """
+    if not isinstance(definition, dict) or not isinstance(definition.get("steps"), list) or not definition["steps"]:
+        raise ValueError("a profile needs a non-empty 'steps' list")
+    steps = []
+    for number, raw in enumerate(definition["steps"], 1):
+        try:
+            kind = raw.get("type")
+            if kind not in STEP_TYPES:
+                raise ValueError(f"unknown type {kind!r}")
+            target_f = raw.get("target_f")
+            target_f = None if target_f is None else float(target_f)
+            duration_s = float(raw.get("hours", 0.0)) * 3600
+            if duration_s < 0:
+                raise ValueError("negative duration")
+            until, tolerance_f = None, None
+            if kind == "wait":
+                until = raw.get("until")
+                if until not in WAIT_CONDITIONS:
+                    raise ValueError(f"unknown wait condition {until!r}")
+                if until != "beer_at_target" and target_f is None:
+                    raise ValueError(f"'{until}' needs a target_f")
+                tolerance_f = float(raw.get("tolerance_f", DEFAULT_WAIT_TOLERANCE_F))
+                if tolerance_f < 0:
+                    raise ValueError("negative tolerance")
+            elif kind in ("ramp", "crash") and target_f is None:
+                raise ValueError(f"a {kind} step needs a target_f")
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"step {number}: {e}") from None
+        steps.append(ProfileStep(kind, target_f, duration_s, until, tolerance_f))
+    return ProfileDefinition(str(definition.get("name") or "Profile"), tuple(steps))
+
+
+def compile_profile(definition, start_f):
+    """
+    Compiles a ProfileDefinition into its ProfileTable. 'start_f' is where the first
+    ramp starts (and what a leading untargeted hold holds).
+    """
+    phases = []
+    segments, offset, temp, kind, step_index = [], 0.0, float(start_f), "hold", 0
+    for step_index, step in enumerate(definition.steps):
+        if step.kind == "wait":
+            phases.append(_phase(segments, offset, temp, kind, step_index, step))
+            segments, offset = [], 0.0
+            continue
+        start_temp = temp
+        temp = step.target_f if step.target_f is not None else temp
+        kind = step.kind
+        if step.duration_s > 0:
+            segments.append(ProfileSegment(offset, offset + step.duration_s,
+                                           start_temp if kind == "ramp" else temp, temp, kind, step_index))
+            offset += step.duration_s
+    phases.append(_phase(segments, offset, temp, kind, step_index, None))
+    return ProfileTable(definition, float(start_f), tuple(phases))
+
+
+def _phase(segments, duration_s, end_f, end_kind, end_step, wait):
+    return ProfilePhase(tuple(segment.start_s for segment in segments), tuple(segments), duration_s,
+                        end_f, end_kind, end_step, wait)
+
+
+def profile_point(run, now):
+    """The ProfilePoint of 'run' at 'now' (epoch seconds): a bisect into the current phase."""
+    phase = run.table.phases[run.phase]
+    elapsed = now - run.phase_start_time
+    if run.finished or elapsed >= phase.duration_s:
+        kind = "wait" if phase.wait is not None and not run.finished else phase.end_kind
+        return ProfilePoint(phase.end_f, kind, phase.end_step, phase.end_f, None)
+    segment = phase.segments[max(0, bisect_right(phase.starts, elapsed) - 1)]
+    target = segment.end_f
+    if segment.start_f != segment.end_f:
+        target = segment.start_f + (segment.end_f - segment.start_f) * (elapsed - segment.start_s) / (segment.end_s - segment.start_s)
+    return ProfilePoint(target, segment.kind, segment.step, segment.end_f, run.phase_start_time + segment.end_s)
+
+
+def _wait_met(wait, beer_temp, held_f):
+    if wait.until == "beer_below":
+        return beer_temp <= wait.target_f
+    if wait.until == "beer_above":
+        return beer_temp >= wait.target_f
+    return abs(beer_temp - held_f) <= wait.tolerance_f
+
+
+def start_profile(definition, start_f, now):
+    """A new ProfileRun of 'definition' from 'start_f', starting at 'now'."""
+    return ProfileRun(compile_profile(definition, start_f), 0, now, False)
+
+
+def advance_profile(run, beer_temp, now):
+    """
+    Moves 'run' on to 'now': past a met (or timed-out) wait into the next phase, or to
+    finished after the last step. Returns (run, ProfilePoint, event): event is None,
+    "advanced" or "finished"; on an event the run's record must be persisted again.
+    """
+    point = profile_point(run, now)
+    if run.finished or point.end_time is not None:
+        return run, point, None
+    phase = run.table.phases[run.phase]
+    if phase.wait is None:
+        run = run._replace(finished=True)
+        return run, profile_point(run, now), "finished"
+    waited = now - run.phase_start_time - phase.duration_s
+    if _wait_met(phase.wait, beer_temp, phase.end_f) or (phase.wait.duration_s > 0 and waited >= phase.wait.duration_s):
+        run = run._replace(phase=run.phase + 1, phase_start_time=now)
+        return run, profile_point(run, now), "advanced"
+    return run, point, None
+
+
+# --- PERSISTENCE ---
+def profile_record(run):
+    """The run as one JSON-ready, versioned record (settings key "profile_run")."""
+    definition = run.table.definition
+    return {
+        "version": PROFILE_RECORD_VERSION,
+        "name": definition.name,
+        "steps": [dict(step._asdict()) for step in definition.steps],
+        "start_f": run.table.start_f,
+        "phase": run.phase,
+        "phase_start_time": run.phase_start_time,
+        "finished": run.finished,
+    }
+
+
+def resume_profile(record):
+    """Rebuilds the ProfileRun saved by profile_record(), or None if 'record' is empty, stale or unreadable."""
+    if not record or record.get("version") != PROFILE_RECORD_VERSION:
+        return None
+    try:
+        definition = ProfileDefinition(record["name"], tuple(ProfileStep(**step) for step in record["steps"]))
+        table = compile_profile(definition, record["start_f"])
+        phase = int(record["phase"])
+        if not 0 <= phase < len(table.phases):
+            return None
+        return ProfileRun(table, phase, float(record["phase_start_time"]), bool(record["finished"]))
+    except (KeyError, TypeError, ValueError):
+        return None
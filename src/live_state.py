@@ -0,0 +1,119 @@
+"""
+fermvault app
+live_state.py
+"""
+
+import threading
+
+# --- LIVE TELEMETRY FIELDS ---
+# (name, startup value). These are runtime/UI values only and are never persisted.
+LIVE_FIELDS = (
+    ("beer_temp_actual", "--.-"),
+    ("amb_temp_actual", "--.-"),
+    ("beer_temp_timestamp", "--:--:--"),
+    ("amb_temp_timestamp", "--:--:--"),
+    ("og_timestamp_var", "--:--:--"),
+    ("sg_timestamp_var", "--:--:--"),
+
+    ("amb_min_setpoint", 0.0),
+    ("amb_max_setpoint", 0.0),
+    ("beer_setpoint_current", 0.0),
+    ("amb_target_setpoint", 0.0),
+
+    ("heat_state", "Heating OFF"),
+    ("cool_state", "Cooling OFF"),
+
+    ("cool_restriction_status", ""),
+    ("sensor_error_message", ""),
+
+    ("cooling_delay_message", "init"),
+    ("fan_state", "Fan OFF"),
+
+    ("og_display_var", "-.---"),
+    ("sg_display_var", "-.---"),
+
+    ("fg_status_var", ""),
+    ("fg_value_var", "-.---"),
+)
+
+LIVE_FIELD_NAMES = tuple(name for name, _ in LIVE_FIELDS)
+
+# One bit per field, used for change masks
+FIELD_BITS = {name: 1 << i for i, name in enumerate(LIVE_FIELD_NAMES)}
+ALL_FIELDS_MASK = (1 << len(LIVE_FIELD_NAMES)) - 1
+
+# Common field groups for consumers that only care about part of the state
+TEMPS_MASK = (FIELD_BITS["beer_temp_actual"] | FIELD_BITS["amb_temp_actual"]
+              | FIELD_BITS["beer_temp_timestamp"] | FIELD_BITS["amb_temp_timestamp"])
+SETPOINTS_MASK = (FIELD_BITS["amb_min_setpoint"] | FIELD_BITS["amb_max_setpoint"]
+                  | FIELD_BITS["beer_setpoint_current"] | FIELD_BITS["amb_target_setpoint"])
+RELAYS_MASK = (FIELD_BITS["heat_state"] | FIELD_BITS["cool_state"] | FIELD_BITS["fan_state"]
+               | FIELD_BITS["cool_restriction_status"])
+GRAVITY_MASK = (FIELD_BITS["og_display_var"] | FIELD_BITS["sg_display_var"]
+                | FIELD_BITS["og_timestamp_var"] | FIELD_BITS["sg_timestamp_var"]
+                | FIELD_BITS["fg_status_var"] | FIELD_BITS["fg_value_var"])
+
+
+class LiveState:
+    """
+    Typed store for live telemetry (temps, setpoints, relay/status text).
+    Kept separate from the persisted settings dictionary.
+
+    Every update that actually changes a value bumps 'version' once and records
+    that version against each changed field, so readers can ask which fields
+    changed since the version they last saw (see changes_since()).
+    """
+
+    __slots__ = LIVE_FIELD_NAMES + ("version", "_field_versions", "_lock")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Restores every field to its startup value."""
+        with self._lock:
+            for name, value in LIVE_FIELDS:
+                object.__setattr__(self, name, value)
+            self.version = 0
+            self._field_versions = [0] * len(LIVE_FIELD_NAMES)
+
+    def __setattr__(self, name, value):
+        # Direct assignment of a live field goes through update() so the version/mask stay correct
+        if name in FIELD_BITS:
+            self.update(**{name: value})
+        else:
+            object.__setattr__(self, name, value)
+
+    def update(self, **values):
+        """
+        Sets one or more fields. Returns the change mask (0 if nothing changed).
+        Unknown field names raise AttributeError.
+        """
+        mask = 0
+        with self._lock:
+            new_version = self.version + 1
+            for name, value in values.items():
+                bit = FIELD_BITS.get(name)
+                if bit is None:
+                    raise AttributeError(f"LiveState has no field '{name}'")
+                if getattr(self, name) != value:
+                    object.__setattr__(self, name, value)
+                    self._field_versions[bit.bit_length() - 1] = new_version
+                    mask |= bit
+            if mask:
+                self.version = new_version
+        return mask
+
+    def changes_since(self, version):
+        """Returns (current_version, mask of fields changed after 'version')."""
+        with self._lock:
+            mask = 0
+            for i, field_version in enumerate(self._field_versions):
+                if field_version > version:
+                    mask |= 1 << i
+            return self.version, mask
+
+    def as_dict(self, mask=ALL_FIELDS_MASK):
+        """Returns {field: value} for the fields selected by 'mask'."""
+        return {name: getattr(self, name) for name in LIVE_FIELD_NAMES if mask & FIELD_BITS[name]}
@@ -0,0 +1,111 @@
+"""
+fermvault app
+loop_rate.py
+"""
+
+from tick_scheduler import CONTROL_LOOP_PERIOD_S
+
+# --- ADAPTIVE LOOP RATE THRESHOLDS ---
+# Steady: error and its slope inside these bounds with both relays idle -> widen the interval.
+# A setpoint crossing only counts once the error leaves the +/- STEADY_ERROR_F band on the
+# other side, so probe quantization dithering around the setpoint does not pin the loop.
+STEADY_ERROR_F = 0.25
+STEADY_SLOPE_F_PER_MIN = 0.05
+# Tighten to the minimum interval when the error slope exceeds this...
+FAST_SLOPE_F_PER_MIN = 0.5
+# Error changes up to one DS18B20 step (1/16 C = 0.1125 F) are quantization, not slope
+SLOPE_NOISE_F = 0.125
+# ...or the ambient temperature is this close to (and heading for) an envelope edge
+ENVELOPE_MARGIN_F = 0.3
+# Growth per steady tick while widening
+WIDEN_FACTOR = 1.5
+
+
+class AdaptiveLoopRate:
+    """
+    Picks the monitor loop interval from the thermal state after each tick:
+      - tightens to the minimum interval on a relay demand change, a setpoint crossing
+        (out of the steady band on one side, then the other),
+        a fast-moving error, or the ambient temperature approaching an envelope edge
+        (an imminent relay transition);
+      - widens by WIDEN_FACTOR per tick, up to the maximum, while the error and its
+        slope are small and both relays are idle (a settled hold);
+      - otherwise (relays running, sensor faults, shutdown) uses the base interval.
+    """
+
+    def __init__(self, base_period_s=CONTROL_LOOP_PERIOD_S):
+        self.base_period_s = base_period_s
+        self.period_s = base_period_s
+        self.reset()
+
+    def reset(self):
+        self.period_s = self.base_period_s
+        self._last_time = None
+        self._last_error = None
+        self._error_side = 0            # +1 / -1: side of the steady band the error last left on
+        self._last_amb = None
+        self._last_demand = None
+        self.tightened = 0
+        self.widened = 0
+
+    def next_period(self, outputs, beer_temp, amb_temp, relays_on, tick_time, params):
+        """
+        Returns the interval (s) until the next tick, from this tick's KernelOutputs, the
+        conditioned readings, whether a relay is energised, and the tick's monotonic time.
+        """
+        if not params.adaptive_loop_rate:
+            self.period_s = self.base_period_s
+            return self.period_s
+        min_period = min(params.loop_min_period_s, self.base_period_s)
+        max_period = max(params.loop_max_period_s, self.base_period_s)
+
+        # Controlled variable: ambient in Ambient Hold and limp-home, beer otherwise
+        if outputs.current_mode == "Ambient Hold":
+            pv, setpoint = amb_temp, outputs.ambient_target
+        elif outputs.fail_safe_active:
+            pv, setpoint = amb_temp, outputs.beer_setpoint
+        else:
+            pv, setpoint = beer_temp, outputs.beer_setpoint
+        demand = (outputs.desired_heat, outputs.desired_cool)
+
+        if outputs.sensor_error_message or outputs.current_mode == "OFF" or pv is None:
+            period = self.base_period_s
+            error = None
+        else:
+            error = pv - setpoint
+            elapsed_min = (tick_time - self._last_time) / 60.0 if self._last_time is not None else 0.0
+            change = error - self._last_error if self._last_error is not None else 0.0
+            slope = change / elapsed_min if elapsed_min > 0 and abs(change) > SLOPE_NOISE_F else 0.0
+
+            demand_changed = self._last_demand is not None and demand != self._last_demand
+            side = 1 if error > STEADY_ERROR_F else -1 if error < -STEADY_ERROR_F else 0
+            crossed = side != 0 and self._error_side == -side
+            if side:
+                self._error_side = side
+            if demand_changed or crossed or abs(slope) >= FAST_SLOPE_F_PER_MIN or self._near_edge(outputs, amb_temp):
+                period = min_period
+                self.tightened += 1
+            elif not relays_on and not any(demand) and abs(error) <= STEADY_ERROR_F and abs(slope) <= STEADY_SLOPE_F_PER_MIN:
+                period = min(max_period, max(self.period_s, self.base_period_s) * WIDEN_FACTOR)
+                self.widened += 1
+            else:
+                period = self.base_period_s
+
+        self._last_time = tick_time
+        self._last_error = error
+        self._last_amb = amb_temp
+        self._last_demand = demand
+        self.period_s = period
+        return period
+
+    def _near_edge(self, outputs, amb_temp):
+        """True if ambient is within ENVELOPE_MARGIN_F of an envelope edge and moving toward it."""
+        if amb_temp is None or self._last_amb is None or outputs.amb_min >= outputs.amb_max:
+            return False
+        rising = amb_temp > self._last_amb
+        falling = amb_temp < self._last_amb
+        return ((rising and outputs.amb_max - amb_temp <= ENVELOPE_MARGIN_F) or
+                (falling and amb_temp - outputs.amb_min <= ENVELOPE_MARGIN_F))
+
+    def stats(self):
+        return {"period_s": self.period_s, "tightened": self.tightened, "widened": self.widened}
@@ -59,6 +59,7 @@ try:
     from api_manager import APIManager
     from notification_manager import NotificationManager
     from fg_calculator import FGCalculator
+    from live_state import GRAVITY_MASK
 except ImportError as e:
     print(f"CRITICAL IMPORT ERROR: {e}")
     SettingsManager = None
@@ -100,6 +101,7 @@ def failsafe_cleanup():
                 sm.set("relay_logic_configured", True) 
                 rc = RelayControl(sm, RELAY_PINS)
                 rc.cleanup_gpio()
+                sm.shutdown()
                 try: print("[System] GPIO cleaned up via Fresh Instance.")
                 except: pass
     except Exception:
@@ -121,7 +123,21 @@ def handle_signal(signum, frame):
     # 2. Execute Cleanup
     failsafe_cleanup()
     
-    # 3. Force Exit (Prevents Kivy/Python from hanging)
+    # 3. Release the sensor bus, then flush pending settings (write-behind) before the hard exit
+    try:
+        app = App.get_running_app()
+        if app and getattr(app, 'temp_controller', None):
+            app.temp_controller.shutdown_sensors()
+    except Exception:
+        pass
+    try:
+        app = App.get_running_app()
+        if app and getattr(app, 'settings_manager', None):
+            app.settings_manager.shutdown()
+    except Exception:
+        pass
+    
+    # 4. Force Exit (Prevents Kivy/Python from hanging)
     os._exit(0)
 
 signal.signal(signal.SIGTERM, handle_signal)
@@ -168,16 +184,17 @@ class KivyUIManagerAdapter:
         triggering a logic loop or passing empty parameters that cause UI defaults.
         """
         sm = self.app.settings_manager
-        
-        # Fetch current system parameters
-        beer_temp = sm.get("beer_temp_actual", "--.-")
-        amb_temp = sm.get("amb_temp_actual", "--.-")
-        amb_min = sm.get("amb_min_setpoint", 0.0)
-        amb_max = sm.get("amb_max_setpoint", 0.0)
-        beer_setpoint = sm.get("beer_setpoint_current", 0.0)
-        amb_target = sm.get("amb_target_setpoint", 0.0)
+        live = sm.live_state
+        
+        # Fetch current live values (LiveState) and the configured mode (settings)
+        beer_temp = live.beer_temp_actual
+        amb_temp = live.amb_temp_actual
+        amb_min = live.amb_min_setpoint
+        amb_max = live.amb_max_setpoint
+        beer_setpoint = live.beer_setpoint_current
+        amb_target = live.amb_target_setpoint
         current_mode = sm.get("control_mode", "Ambient Hold")
-        sensor_error_message = sm.get("sensor_error_message", "")
+        sensor_error_message = live.sensor_error_message
         
         # Safely fetch live hardware states to prevent flashing
         real_heat = False
@@ -358,6 +375,10 @@ class FermVaultApp(App):
     _standby_running = False
     _standby_thread = None
     
+    # --- LIVE STATE TRACKING ---
+    # Last LiveState version whose gravity fields were rendered (-1 forces the first render)
+    _gravity_seen_version = -1
+    
     def dismiss_splash(self, dt=None):
         """
         Kills the splash screen after the UI is fully rendered.
@@ -723,7 +744,7 @@ class FermVaultApp(App):
             return
 
         if hasattr(self, 'relay_control'):
-            restriction = self.settings_manager.get("cool_restriction_status", "")
+            restriction = self.settings_manager.live_state.cool_restriction_status
             if restriction:
                 self.warning_message = f"Protection: {restriction}"
                 self.warning_bg_color = [1, 0.6, 0, 1] # Orange
@@ -854,20 +875,26 @@ class FermVaultApp(App):
                 self.ambient_target_color = COL_LGRAY
                 self.beer_target_color = COL_AMBER
 
-        # --- 3. UPDATE GRAVITY WIDGETS (Unchanged) ---
+        # --- 3. UPDATE GRAVITY WIDGETS (Only when the gravity fields changed) ---
         if hasattr(self, 'settings_manager'):
-            og_val = self.settings_manager.get("og_display_var", "-.---")
-            og_time = self.settings_manager.get("og_timestamp_var", "--:--:--")
+            live = self.settings_manager.live_state
+            version, changed = live.changes_since(self._gravity_seen_version)
+            if self._gravity_seen_version >= 0 and not (changed & GRAVITY_MASK):
+                return
+            self._gravity_seen_version = version
+            
+            og_val = live.og_display_var
+            og_time = live.og_timestamp_var
             if og_time and isinstance(og_time, str) and " " in og_time: og_time = og_time.replace(" ", "\n")
             self.og_full_text = f"OG: {og_val}\n\n{og_time}"
 
-            sg_val = self.settings_manager.get("sg_display_var", "-.---")
-            sg_time = self.settings_manager.get("sg_timestamp_var", "--:--:--")
+            sg_val = live.sg_display_var
+            sg_time = live.sg_timestamp_var
             if sg_time and isinstance(sg_time, str) and " " in sg_time: sg_time = sg_time.replace(" ", "\n")
             self.sg_full_text = f"SG: {sg_val}\n\n{sg_time}"
 
-            fg_val = self.settings_manager.get("fg_value_var", "-.---")
-            fg_msg = self.settings_manager.get("fg_status_var", "--")
+            fg_val = live.fg_value_var
+            fg_msg = live.fg_status_var
             if not fg_msg: fg_msg = "--"
             has_valid_value = (fg_val != "-.---")
             if not has_valid_value and fg_msg not in ["--", ""]: self.fg_full_text = f"FG: {fg_msg}"
@@ -888,11 +915,10 @@ class FermVaultApp(App):
         if not hasattr(self, 'temp_controller') or not self.temp_controller: return
         self._refresh_all_settings_from_manager()
         self.log_system_message("Scanning for sensors...")
-        def _scan():
-            found = self.temp_controller.detect_ds18b20_sensors()
-            if "unassigned" not in found: found.insert(0, "unassigned")
-            Clock.schedule_once(lambda dt: setattr(self, 'available_sensors', found))
-        threading.Thread(target=_scan, daemon=True).start()
+        # Served from the background discovery cache; no bus scan or thread per click
+        found = self.temp_controller.detect_ds18b20_sensors()
+        if "unassigned" not in found: found.insert(0, "unassigned")
+        self.available_sensors = found
 
     def stage_setting_change(self, key, new_value):
         # DIRECT KEY USAGE: The key IS the property name.
@@ -1021,91 +1047,92 @@ class FermVaultApp(App):
         # Capture old frequency for rescheduling
         old_freq = int(self.settings_manager.get("frequency_hours", 0))
 
-        for key, val in self.staged_changes.items():
-            if key in cooling_keys:
-                cooling_update[key] = float(val) * 60.0
+        # Apply every staged change as one settings transaction (one write, no half-applied state)
+        with self.settings_manager.batch():
+            for key, val in self.staged_changes.items():
+                if key in cooling_keys:
+                    cooling_update[key] = float(val) * 60.0
             
-            elif key == "api_call_frequency_m":
-                api_update["api_call_frequency_s"] = int(float(val) * 60)
+                elif key == "api_call_frequency_m":
+                    api_update["api_call_frequency_s"] = int(float(val) * 60)
             
-            elif key in ["window_size", "max_outliers", "fg_check_frequency_h"]:
-                 api_update[key] = int(float(val))
+                elif key in ["window_size", "max_outliers", "fg_check_frequency_h"]:
+                     api_update[key] = int(float(val))
             
-            elif key == "tolerance":
-                 api_update[key] = float(val)
+                elif key == "tolerance":
+                     api_update[key] = float(val)
                  
-            elif key == "api_key":
-                 api_update[key] = str(val)
-
-            # --- NOTIFICATIONS HANDLING ---
-            elif key == "notif_frequency_hours":
-                new_freq = int(float(val))
-                self.settings_manager.set("frequency_hours", new_freq)
-                notif_update_freq = new_freq
+                elif key == "api_key":
+                     api_update[key] = str(val)
+
+                # --- NOTIFICATIONS HANDLING ---
+                elif key == "notif_frequency_hours":
+                    new_freq = int(float(val))
+                    self.settings_manager.set("frequency_hours", new_freq)
+                    notif_update_freq = new_freq
             
-            elif key in smtp_keys:
-                # Map Property Key -> Backend Key
-                if key == "smtp_recipient": smtp_update["email_recipient"] = str(val)
-                elif key == "smtp_sender": smtp_update["server_email"] = str(val)
-                elif key == "smtp_password": smtp_update["server_password"] = str(val)
-                elif key == "smtp_server": smtp_update["smtp_server"] = str(val)
-                elif key == "smtp_port": smtp_update["smtp_port"] = int(val)
+                elif key in smtp_keys:
+                    # Map Property Key -> Backend Key
+                    if key == "smtp_recipient": smtp_update["email_recipient"] = str(val)
+                    elif key == "smtp_sender": smtp_update["server_email"] = str(val)
+                    elif key == "smtp_password": smtp_update["server_password"] = str(val)
+                    elif key == "smtp_server": smtp_update["smtp_server"] = str(val)
+                    elif key == "smtp_port": smtp_update["smtp_port"] = int(val)
             
-            elif key in cond_keys:
-                # Map properties to backend keys
-                if key == "conditional_enabled": cond_update["conditional_enabled"] = bool(val)
-                elif key == "cond_amb_min": cond_update["conditional_amb_min"] = float(val)
-                elif key == "cond_amb_max": cond_update["conditional_amb_max"] = float(val)
-                elif key == "cond_beer_min": cond_update["conditional_beer_min"] = float(val)
-                elif key == "cond_beer_max": cond_update["conditional_beer_max"] = float(val)
-
-            # --- FIX: APPLY PID MAPPING ---
-            elif key in pid_key_map:
-                backend_key = pid_key_map[key]
-                self.settings_manager.set(backend_key, val)
-            # ------------------------------
+                elif key in cond_keys:
+                    # Map properties to backend keys
+                    if key == "conditional_enabled": cond_update["conditional_enabled"] = bool(val)
+                    elif key == "cond_amb_min": cond_update["conditional_amb_min"] = float(val)
+                    elif key == "cond_amb_max": cond_update["conditional_amb_max"] = float(val)
+                    elif key == "cond_beer_min": cond_update["conditional_beer_min"] = float(val)
+                    elif key == "cond_beer_max": cond_update["conditional_beer_max"] = float(val)
+
+                # --- FIX: APPLY PID MAPPING ---
+                elif key in pid_key_map:
+                    backend_key = pid_key_map[key]
+                    self.settings_manager.set(backend_key, val)
+                # ------------------------------
 
-            else:
-                self.settings_manager.set(key, val)
+                else:
+                    self.settings_manager.set(key, val)
                 
-        if cooling_update:
-            current = self.settings_manager.get_all_compressor_protection_settings()
-            current.update(cooling_update)
-            self.settings_manager.save_compressor_protection_settings(current)
-
-        if api_update:
-             current_api = self.settings_manager.get_all_api_settings()
-             current_api.update(api_update)
-             self.settings_manager.save_api_settings(current_api)
-        
-        # --- SAVE SMTP ---
-        if smtp_update:
-            current_smtp = self.settings_manager.get_all_smtp_settings()
-            current_smtp.update(smtp_update)
-            # We must set this directly back to the main settings dict
-            self.settings_manager.settings['smtp_settings'] = current_smtp
-            self.settings_manager._save_all_settings() # Force save
+            if cooling_update:
+                current = self.settings_manager.get_all_compressor_protection_settings()
+                current.update(cooling_update)
+                self.settings_manager.save_compressor_protection_settings(current)
+
+            if api_update:
+                 current_api = self.settings_manager.get_all_api_settings()
+                 current_api.update(api_update)
+                 self.settings_manager.save_api_settings(current_api)
+        
+            # --- SAVE SMTP ---
+            if smtp_update:
+                current_smtp = self.settings_manager.get_all_smtp_settings()
+                current_smtp.update(smtp_update)
+                # We must set this directly back to the main settings dict
+                self.settings_manager.settings['smtp_settings'] = current_smtp
+                self.settings_manager._save_all_settings() # Force save
             
-        # --- SAVE CONDITIONAL ---
-        if cond_update:
-            current_notif = self.settings_manager.settings.get('notification_settings', {})
-            current_notif.update(cond_update)
-            self.settings_manager.settings['notification_settings'] = current_notif
-            self.settings_manager._save_all_settings()
+            # --- SAVE CONDITIONAL ---
+            if cond_update:
+                current_notif = self.settings_manager.settings.get('notification_settings', {})
+                current_notif.update(cond_update)
+                self.settings_manager.settings['notification_settings'] = current_notif
+                self.settings_manager._save_all_settings()
 
         # --- RESCHEDULE IF FREQ CHANGED ---
         if notif_update_freq is not None:
              if self.notification_manager:
                  self.notification_manager.force_reschedule(old_freq, notif_update_freq)
 
-        if hasattr(self, 'temp_controller') and self.temp_controller and hasattr(self.temp_controller, 'pid'):
-            self.temp_controller.pid.Kp = float(self.settings_manager.get("pid_kp", 2.0))
-            self.temp_controller.pid.Ki = float(self.settings_manager.get("pid_ki", 0.03))
-            self.temp_controller.pid.Kd = float(self.settings_manager.get("pid_kd", 20.0))
+        # PID gain changes reach the controller through its settings subscription
 
         if "relay_active_high" in self.staged_changes:
             self.settings_manager.set("relay_logic_configured", True)
             self.relay_control.update_relay_logic()
+            if self.temp_controller:
+                self.temp_controller.chambers.update_relay_logic()
             
         self.staged_changes.clear()
         self.is_settings_dirty = False
@@ -1250,12 +1277,15 @@ class FermVaultApp(App):
         if not hasattr(self, 'settings_manager'): return
         map_ui_to_internal = {
             "AMBIENT": "Ambient Hold", "BEER": "Beer Hold",
-            "RAMP": "Ramp-Up", "CRASH": "Fast Crash"
+            "RAMP": "Ramp-Up", "CRASH": "Fast Crash", "TUNE": "Autotune",
+            "PROFILE": "Profile"
         }
         internal_mode = map_ui_to_internal.get(display_mode, "Ambient Hold")
         self.settings_manager.set("control_mode", internal_mode)
         if internal_mode != "Ramp-Up":
             self.temp_controller.reset_ramp_state()
+        if internal_mode != "Profile":
+            self.temp_controller.reset_profile_state()
 
     def _sync_control_mode_from_backend(self, internal_mode):
         # FIX: "OFF" is a runtime status, not a configuration mode.
@@ -1266,7 +1296,8 @@ class FermVaultApp(App):
 
         map_internal_to_ui = {
             "Ambient Hold": "AMBIENT", "Beer Hold": "BEER",
-            "Ramp-Up": "RAMP", "Fast Crash": "CRASH"
+            "Ramp-Up": "RAMP", "Fast Crash": "CRASH", "Autotune": "TUNE",
+            "Profile": "PROFILE"
         }
         
         # Default to current value instead of forcing AMBIENT if unknown
@@ -1313,14 +1344,23 @@ class FermVaultApp(App):
             # 3. Stop Standby Thread
             self.stop_standby_loop()
 
-            # 4. Hardware Safety (Relays OFF)
+            # 4. Hardware Safety (Relays OFF, including additional chambers)
+            if self.temp_controller:
+                self.temp_controller.chambers.cleanup()
             if self.relay_control:
                 self.relay_control.turn_off_all_relays()
 
-            # 5. Flag as Controlled Shutdown
+            # 5. Release the sensor bus (discovery poller, acquisition worker, backend handles)
+            if self.temp_controller:
+                self.temp_controller.shutdown_sensors()
+
+            # 6. Flag as Controlled Shutdown
             if hasattr(self, 'settings_manager') and self.settings_manager:
                 self.settings_manager.set_controlled_shutdown(True)
                 
+                # 7. Flush pending settings (write-behind) before the hard exit below
+                self.settings_manager.shutdown()
+                
             print("[App] Application closed gracefully.")
 
         except Exception as e:
@@ -1442,9 +1482,15 @@ class FermVaultApp(App):
         try:
             if hasattr(self, 'temp_controller') and self.temp_controller:
                 self.temp_controller.stop_monitoring()
+                self.temp_controller.chambers.cleanup()
+                self.temp_controller.shutdown_sensors()
                 
             if hasattr(self, 'relay_control') and self.relay_control:
                 self.relay_control.cleanup_gpio()
+                
+            # Flush pending settings (write-behind); execv does not run exit handlers
+            if hasattr(self, 'settings_manager') and self.settings_manager:
+                self.settings_manager.shutdown()
         except Exception as e:
             print(f"[System] Restart cleanup warning: {e}")
 
@@ -13,16 +13,25 @@ import email.header
 from datetime import datetime, timedelta, timezone 
 from email.mime.text import MIMEText
 
+from clock import SYSTEM_CLOCK
+
 # Constants
 MINUTES_TO_SECONDS = 60
 HOURS_TO_SECONDS = 3600
 STATUS_REQUEST_SUBJECT = "STATUS"
 ERROR_DEBOUNCE_INTERVAL_SECONDS = 3600
+CONDITIONAL_CHECK_INTERVAL_SECONDS = 60
+# Shortest scheduler sleep; also the retry delay when a due task failed (e.g. SMTP down)
+SCHEDULER_MIN_WAIT_SECONDS = 10.0
+
+# Settings that drive the scheduler; changes to these wake it via a subscription
+SCHEDULER_SETTING_KEYS = ("api_call_frequency_s", "fg_check_frequency_h", "frequency_hours", "active_api_service")
 
 class NotificationManager:
-    def __init__(self, settings_manager, ui_manager):
+    def __init__(self, settings_manager, ui_manager, clock=None):
         self.settings_manager = settings_manager
         self.ui = ui_manager  
+        self.clock = clock or SYSTEM_CLOCK # Schedule timers, alert cooldowns and report timestamps
         
         # --- SCHEDULER STATE ---
         self._scheduler_running = False
@@ -34,6 +43,11 @@ class NotificationManager:
         self.last_api_fetch_time = 0
         self.last_fg_calc_time = 0
         
+        # Cached scheduler settings, refreshed by the subscription callback (replaced, never mutated)
+        snap = self.settings_manager.snapshot()
+        self._schedule_settings = {key: snap.get(key) for key in SCHEDULER_SETTING_KEYS}
+        self.settings_manager.subscribe(SCHEDULER_SETTING_KEYS, self._on_schedule_settings_changed)
+        
         # --- STATUS REQUEST STATE (IMAP Listener) ---
         self._status_request_listener_thread = None
         self._status_request_running = False
@@ -43,7 +57,7 @@ class NotificationManager:
 
         # --- CONDITIONAL ALERT STATE ---
         # FIX: Initialize to current time to prevent instant firing on startup
-        self.last_conditional_check_time = time.time() 
+        self.last_conditional_check_time = self.clock.time() 
         self._fg_alert_sent = False 
         
         # Cooldown trackers 
@@ -100,78 +114,85 @@ class NotificationManager:
         if not lines:
             return "No commands found in email body."
 
-        for line in lines:
-            parts = line.split()
-            if not parts:
-                continue
+        # All commands in one email are applied as a single settings transaction
+        reschedule = None
+        with self.settings_manager.batch():
+            for line in lines:
+                parts = line.split()
+                if not parts:
+                    continue
 
-            command_key = " ".join(parts[:-1])
-            value_str = parts[-1] if len(parts) > 1 else None
+                command_key = " ".join(parts[:-1])
+                value_str = parts[-1] if len(parts) > 1 else None
 
-            try:
-                if line == "control mode ambient":
-                    self.settings_manager.set("control_mode", "Ambient Hold")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ambient")
-                    results.append(f"OK: Control Mode set to Ambient.")
-                    commands_processed += 1
-                elif line == "control mode beer":
-                    self.settings_manager.set("control_mode", "Beer Hold")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Beer")
-                    results.append(f"OK: Control Mode set to Beer.")
-                    commands_processed += 1
-                elif line == "control mode ramp":
-                    self.settings_manager.set("control_mode", "Ramp-Up")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ramp")
-                    results.append(f"OK: Control Mode set to Ramp.")
-                    commands_processed += 1
-                elif line == "control mode crash":
-                    self.settings_manager.set("control_mode", "Fast Crash")
-                    if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Crash")
-                    results.append(f"OK: Control Mode set to Crash.")
-                    commands_processed += 1
+                try:
+                    if line == "control mode ambient":
+                        self.settings_manager.set("control_mode", "Ambient Hold")
+                        if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ambient")
+                        results.append(f"OK: Control Mode set to Ambient.")
+                        commands_processed += 1
+                    elif line == "control mode beer":
+                        self.settings_manager.set("control_mode", "Beer Hold")
+                        if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Beer")
+                        results.append(f"OK: Control Mode set to Beer.")
+                        commands_processed += 1
+                    elif line == "control mode ramp":
+                        self.settings_manager.set("control_mode", "Ramp-Up")
+                        if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Ramp")
+                        results.append(f"OK: Control Mode set to Ramp.")
+                        commands_processed += 1
+                    elif line == "control mode crash":
+                        self.settings_manager.set("control_mode", "Fast Crash")
+                        if self.ui: self.ui.root.after(0, self.ui.control_mode_var.set, "Crash")
+                        results.append(f"OK: Control Mode set to Crash.")
+                        commands_processed += 1
                 
-                elif command_key in ["setpoint ambient", "setpoint beer", "setpoint ramp", "setpoint crash", "setpoint duration", "notification frequency"]:
-                    if not value_str:
-                        raise ValueError("missing value")
+                    elif command_key in ["setpoint ambient", "setpoint beer", "setpoint ramp", "setpoint crash", "setpoint duration", "notification frequency"]:
+                        if not value_str:
+                            raise ValueError("missing value")
                     
-                    value_f = self._parse_setpoint_value(value_str) 
+                        value_f = self._parse_setpoint_value(value_str) 
                     
-                    # Convert input C to F for storage, unless it's duration or frequency
-                    if command_key not in ["setpoint duration", "notification frequency"] and current_units == "C":
-                        value_f = (value_f * 9/5) + 32
-
-                    if command_key == "setpoint ambient":
-                        self.settings_manager.set("ambient_hold_f", value_f)
-                        results.append(f"OK: Ambient Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint beer":
-                        self.settings_manager.set("beer_hold_f", value_f)
-                        results.append(f"OK: Beer Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint ramp":
-                        self.settings_manager.set("ramp_up_hold_f", value_f)
-                        results.append(f"OK: Ramp-Up Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint crash":
-                        self.settings_manager.set("fast_crash_hold_f", value_f)
-                        results.append(f"OK: Fast Crash Hold set to {value_f:.1f} F.")
-                    elif command_key == "setpoint duration":
-                        self.settings_manager.set("ramp_up_duration_hours", value_f)
-                        results.append(f"OK: Ramp Duration set to {value_f:.1f} hours.")
+                        # Convert input C to F for storage, unless it's duration or frequency
+                        if command_key not in ["setpoint duration", "notification frequency"] and current_units == "C":
+                            value_f = (value_f * 9/5) + 32
+
+                        if command_key == "setpoint ambient":
+                            self.settings_manager.set("ambient_hold_f", value_f)
+                            results.append(f"OK: Ambient Hold set to {value_f:.1f} F.")
+                        elif command_key == "setpoint beer":
+                            self.settings_manager.set("beer_hold_f", value_f)
+                            results.append(f"OK: Beer Hold set to {value_f:.1f} F.")
+                        elif command_key == "setpoint ramp":
+                            self.settings_manager.set("ramp_up_hold_f", value_f)
+                            results.append(f"OK: Ramp-Up Hold set to {value_f:.1f} F.")
+                        elif command_key == "setpoint crash":
+                            self.settings_manager.set("fast_crash_hold_f", value_f)
+                            results.append(f"OK: Fast Crash Hold set to {value_f:.1f} F.")
+                        elif command_key == "setpoint duration":
+                            self.settings_manager.set("ramp_up_duration_hours", value_f)
+                            results.append(f"OK: Ramp Duration set to {value_f:.1f} hours.")
                     
-                    elif command_key == "notification frequency":
-                        old_freq = self.settings_manager.get("frequency_hours", 0)
-                        new_freq = int(value_f)
-                        if new_freq < 0: raise ValueError("Frequency cannot be negative.")
-                        self.settings_manager.set("frequency_hours", new_freq)
-                        self.force_reschedule(old_freq, new_freq)
-                        results.append(f"OK: Notification Frequency set to {new_freq} hours.")
-
-                    commands_processed += 1
-                else:
-                    results.append(f"Error: Unknown command '{line}'.")
+                        elif command_key == "notification frequency":
+                            old_freq = self.settings_manager.get("frequency_hours", 0)
+                            new_freq = int(value_f)
+                            if new_freq < 0: raise ValueError("Frequency cannot be negative.")
+                            self.settings_manager.set("frequency_hours", new_freq)
+                            reschedule = (reschedule[0] if reschedule else old_freq, new_freq)
+                            results.append(f"OK: Notification Frequency set to {new_freq} hours.")
+
+                        commands_processed += 1
+                    else:
+                        results.append(f"Error: Unknown command '{line}'.")
+
+                except ValueError as e:
+                    results.append(f"Error parsing '{line}': {e}.")
+                except Exception as e:
+                    results.append(f"Error processing '{line}': {e}.")
 
-            except ValueError as e:
-                results.append(f"Error parsing '{line}': {e}.")
-            except Exception as e:
-                results.append(f"Error processing '{line}': {e}.")
+        if reschedule:
+            # Reschedule only after the batch has committed the new frequency
+            self.force_reschedule(*reschedule)
 
         if commands_processed > 0:
             if self.ui and self.ui.temp_controller:
@@ -197,7 +218,7 @@ class NotificationManager:
             self._scheduler_event.clear()
             
             # --- FIX: Reset conditional timer to NOW to prevent startup alerts ---
-            self.last_conditional_check_time = time.time()
+            self.last_conditional_check_time = self.clock.time()
             
             # Handle startup logging and initial send delay
             try:
@@ -212,13 +233,13 @@ class NotificationManager:
                 
                 # Schedule initial notification in ~60s
                 interval_seconds = self._get_interval_seconds(freq_h)
-                self.last_notification_sent_time = time.time() + 60 - interval_seconds
+                self.last_notification_sent_time = self.clock.time() + 60 - interval_seconds
                 print("[NotificationManager] Scheduling initial notification in 60s.")
             else:
                 if self.ui:
                     self.ui.log_system_message("Push notifications disabled (Frequency is 'None').")
                 # Set timer normally (to NOW) so it doesn't trigger if logic fails
-                self.last_notification_sent_time = time.time()
+                self.last_notification_sent_time = self.clock.time()
 
             # Log Conditional Notification Status
             cond_enabled = self.settings_manager.get("conditional_enabled", False)
@@ -227,13 +248,13 @@ class NotificationManager:
                 self.ui.log_system_message(f"Conditional notifications {status}.")
             
             # Reset other timers
-            self.last_api_fetch_time = time.time()
+            self.last_api_fetch_time = self.clock.time()
             
             # --- FIX: Schedule first FG Calc for 1 minute after startup ---
             fg_freq_h = self.settings_manager.get("fg_check_frequency_h", 24)
             fg_freq_s = fg_freq_h * 3600
             # Initialize so that (now >= last + freq) becomes true in 60 seconds
-            self.last_fg_calc_time = time.time() - fg_freq_s + 60
+            self.last_fg_calc_time = self.clock.time() - fg_freq_s + 60
             # --------------------------------------------------------------
 
             # Start main scheduler loop
@@ -276,15 +297,15 @@ class NotificationManager:
             if (n_freq_safe > 0) and (o_freq_safe == 0):
                 # Schedule initial notification in ~60s
                 interval_seconds = self._get_interval_seconds(n_freq_safe)
-                self.last_notification_sent_time = time.time() + 60 - interval_seconds
+                self.last_notification_sent_time = self.clock.time() + 60 - interval_seconds
                 print("[NotificationManager] Scheduling initial notification in 60s.")
             else:
                 # Otherwise, just reset the timer normally
-                self.last_notification_sent_time = time.time()
+                self.last_notification_sent_time = self.clock.time()
             
             # Reset API/FG timers
-            self.last_api_fetch_time = time.time()
-            self.last_fg_calc_time = time.time()
+            self.last_api_fetch_time = self.clock.time()
+            self.last_fg_calc_time = self.clock.time()
             
             # FIX: Do NOT reset conditional timer here, or we risk delaying legitimate alerts.
             
@@ -298,8 +319,8 @@ class NotificationManager:
         """Resets the timers for API and FG tasks when settings change."""
         if self._scheduler_running:
             print("[NotificationManager] API/FG timers reset by settings change.")
-            self.last_api_fetch_time = time.time()
-            self.last_fg_calc_time = time.time()
+            self.last_api_fetch_time = self.clock.time()
+            self.last_fg_calc_time = self.clock.time()
             self._scheduler_event.set() # Wake up scheduler
             if self.ui:
                 self.ui.log_system_message("API/FG schedule reset and updated.")
@@ -314,14 +335,42 @@ class NotificationManager:
             # If actual garbage data, default to 24 hours
             return 24 * HOURS_TO_SECONDS 
             
+    def _on_schedule_settings_changed(self, changes):
+        """Subscription callback: refreshes the cached scheduler settings and wakes the scheduler."""
+        updated = dict(self._schedule_settings)
+        updated.update(changes)
+        self._schedule_settings = updated
+        self._scheduler_event.set()
+
+    def _next_scheduler_deadline(self, cfg):
+        """Returns the earliest time (epoch seconds) at which any scheduled task is due."""
+        deadlines = [self.last_conditional_check_time + CONDITIONAL_CHECK_INTERVAL_SECONDS]
+        api_enabled = cfg.get("active_api_service") != "OFF"
+        
+        api_freq_s = cfg.get("api_call_frequency_s") or 0
+        if api_enabled and api_freq_s > 0:
+            deadlines.append(self.last_api_fetch_time + api_freq_s)
+        
+        fg_freq_s = (cfg.get("fg_check_frequency_h") or 0) * 3600
+        if api_enabled and fg_freq_s > 0:
+            deadlines.append(self.last_fg_calc_time + fg_freq_s)
+        
+        notif_freq_s = self._get_interval_seconds(cfg.get("frequency_hours") or 0)
+        if notif_freq_s > 0:
+            deadlines.append(self.last_notification_sent_time + notif_freq_s)
+        
+        return min(deadlines)
+
     def _scheduler_loop(self):
         """The main loop for periodic data fetching, FG calcs, and notifications."""
         while self._scheduler_running:
-            now = time.time()
+            now = self.clock.time()
+            # Scheduler settings are cached and kept current by the settings subscription
+            cfg = self._schedule_settings
             
             # --- 1. API DATA FETCH LOGIC ---
-            api_freq_s = self.settings_manager.get("api_call_frequency_s", 1200)
-            if self.settings_manager.get("active_api_service") != "OFF" and api_freq_s > 0:
+            api_freq_s = cfg.get("api_call_frequency_s") or 0
+            if cfg.get("active_api_service") != "OFF" and api_freq_s > 0:
                 if now >= self.last_api_fetch_time + api_freq_s:
                     print(f"[NotificationManager] Scheduled time reached. Fetching API data.")
                     current_id = self.settings_manager.get("current_brew_session_id")
@@ -329,16 +378,16 @@ class NotificationManager:
                     self.last_api_fetch_time = now
             
             # --- 2. FG CALCULATION LOGIC ---
-            fg_freq_h = self.settings_manager.get("fg_check_frequency_h", 24)
+            fg_freq_h = cfg.get("fg_check_frequency_h") or 0
             fg_freq_s = fg_freq_h * 3600 
-            if self.settings_manager.get("active_api_service") != "OFF" and fg_freq_s > 0:
+            if cfg.get("active_api_service") != "OFF" and fg_freq_s > 0:
                 if now >= self.last_fg_calc_time + fg_freq_s:
                     print(f"[NotificationManager] Scheduled time reached. Running FG Calc.")
                     self._run_scheduled_fg_calc()
                     self.last_fg_calc_time = now
 
             # --- 3. PUSH NOTIFICATION LOGIC ---
-            notif_freq_h = self.settings_manager.get("frequency_hours", 0)
+            notif_freq_h = cfg.get("frequency_hours") or 0
             notif_freq_s = self._get_interval_seconds(notif_freq_h)
             
             # GUARD: Only proceed if frequency > 0
@@ -349,12 +398,15 @@ class NotificationManager:
                         self.last_notification_sent_time = now
 
             # --- 4. CONDITIONAL ALERT LOGIC (Every 60 seconds) ---
-            if now >= self.last_conditional_check_time + 60:
+            if now >= self.last_conditional_check_time + CONDITIONAL_CHECK_INTERVAL_SECONDS:
                 self._check_conditional_alerts()
                 self.last_conditional_check_time = now
             
             # --- 5. WAIT LOGIC ---
-            self._scheduler_event.wait(timeout=10.0) 
+            # Sleep until the next task is due; settings changes and reschedules wake us early.
+            wait_s = self._next_scheduler_deadline(cfg) - self.clock.time()
+            self.clock.wait(self._scheduler_event, max(SCHEDULER_MIN_WAIT_SECONDS, wait_s))
+            self._scheduler_event.clear()
             
             if not self._scheduler_running: break
         print("[NotificationManager] Scheduler loop stopped.")
@@ -365,7 +417,7 @@ class NotificationManager:
         if not self.settings_manager.get("conditional_enabled", False):
             return
 
-        now = time.time()
+        now = self.clock.time()
         
         def get_temp(val):
             try: return float(val)
@@ -437,7 +489,7 @@ class NotificationManager:
             return False
 
         full_subject = f"FermVault ALERT: {subject_prefix}"
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = self.clock.now().strftime('%Y-%m-%d %H:%M:%S')
         full_body = f"ALERT TRIGGERED AT: {timestamp}\n\n{message_body}\n\n--\nFermVault Monitoring System"
 
         try:
@@ -831,19 +883,22 @@ class NotificationManager:
         """Generates a structured status body for email/text."""
         units = self.settings_manager.get("temp_units", "F")
         
-        beer_set = self.settings_manager.get("beer_setpoint_current", "--.-")
-        amb_target = self.settings_manager.get("amb_setpoint_current", "--.-") 
-        amb_min = self.settings_manager.get("amb_min_setpoint", "--.-")
-        amb_max = self.settings_manager.get("amb_max_setpoint", "--.-")
+        # Read live values straight from the live telemetry store
+        live = self.settings_manager.live_state
+        
+        beer_set = live.beer_setpoint_current
+        amb_target = live.amb_target_setpoint
+        amb_min = live.amb_min_setpoint
+        amb_max = live.amb_max_setpoint
         
-        beer_actual = self.settings_manager.get("beer_temp_actual", "--.-")
-        amb_actual = self.settings_manager.get("amb_temp_actual", "--.-")
+        beer_actual = live.beer_temp_actual
+        amb_actual = live.amb_temp_actual
 
-        og_val = self.settings_manager.get("og_display_var", "-.---")
-        og_time = self.settings_manager.get("og_timestamp_var", "")
-        sg_val = self.settings_manager.get("sg_display_var", "-.---")
-        sg_time = self.settings_manager.get("sg_timestamp_var", "")
-        fg_val = self.settings_manager.get("fg_value_var", "-.---")
+        og_val = live.og_display_var
+        og_time = live.og_timestamp_var
+        sg_val = live.sg_display_var
+        sg_time = live.sg_timestamp_var
+        fg_val = live.fg_value_var
 
         def convert(temp_f):
              try:
@@ -859,16 +914,18 @@ class NotificationManager:
             "Beer Hold": "Beer",
             "Ramp-Up": "Ramp",
             "Fast Crash": "Crash",
+            "Autotune": "Autotune",
+            "Profile": "Profile",
         }
         internal_mode = self.settings_manager.get('control_mode')
         display_mode = INTERNAL_TO_DISPLAY_MAP.get(internal_mode, "Beer")
         
-        heat_state = self.settings_manager.get("heat_state", "Heating OFF")
-        cool_state = self.settings_manager.get("cool_state", "Cooling OFF")
+        heat_state = live.heat_state
+        cool_state = live.cool_state
         
         body_lines = [
             f"Fermentation Vault Status Report ({units})",
-            f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Timestamp: {self.clock.now().strftime('%Y-%m-%d %H:%M:%S')}",
             f"Mode: {display_mode}",
             f"Brew: {brew_session_title}",
             "",
@@ -971,7 +1028,7 @@ class NotificationManager:
             try:
                 fg_freq_h = self.settings_manager.get("fg_check_frequency_h", 24)
                 fg_freq_s = fg_freq_h * 3600
-                next_ts = time.time() + fg_freq_s
+                next_ts = self.clock.time() + fg_freq_s
                 dt_local = datetime.fromtimestamp(next_ts)
                 next_time_str = dt_local.strftime("%H:%M")
                 status_msg += f"\nNext check:\n{next_time_str}"
@@ -1066,7 +1123,7 @@ class NotificationManager:
 
     def _report_error(self, error_type, message):
         """Reports a configuration error once per hour."""
-        now = time.time()
+        now = self.clock.time()
         last_reported = self._last_error_time.get(error_type, 0.0)
         
         if now - last_reported > ERROR_DEBOUNCE_INTERVAL_SECONDS:
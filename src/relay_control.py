@@ -9,6 +9,9 @@ from datetime import datetime
 import os
 import sys
 
+from clock import SYSTEM_CLOCK
+from control_kernel import CoolingWindow
+
 # --- HARDWARE IMPORT: RPi.GPIO on Linux, MockGPIO on Windows ---
 try:
     import RPi.GPIO as GPIO
@@ -70,12 +73,15 @@ RELAY_ON = GPIO.LOW
 
 class RelayControl:
     
-    def __init__(self, settings_manager, relay_pins):
+    def __init__(self, settings_manager, relay_pins, clock=None, live_state=None):
         self.settings = settings_manager
+        self.clock = clock or SYSTEM_CLOCK # Dwell, max runtime and fail-safe timing
+        # Live telemetry (relay/status text); extra chambers pass their own LiveState
+        self.live_state = live_state if live_state is not None else settings_manager.live_state
         self.pins = relay_pins
         self.gpio = GPIO # Use the real GPIO library
         
-        self.last_cool_change = time.time()
+        self.last_cool_change = self.clock.time()
         self.cool_start_time = None
         self.cool_disabled_until = 0.0
         
@@ -100,7 +106,7 @@ class RelayControl:
             
             # Set the initial default message (Demand is OFF at startup)
             startup_msg = f"Demand OFF; DWELL until {dwell_end_time.strftime('%H:%M:%S')}"
-            self.settings.set("cool_restriction_status", startup_msg)
+            self.live_state.update(cool_restriction_status=startup_msg)
         except Exception as e:
             print(f"[ERROR] RelayControl init failed to set startup dwell message: {e}")
         # --- END NEW ---
@@ -120,6 +126,9 @@ class RelayControl:
         Refreshes High/Low definitions based on settings.
         Can be called live to switch logic without restart.
         """
+        was_configured = self.logic_configured
+        if not initial_setup:
+            self.logic_configured = self.settings.get("relay_logic_configured", False)
         is_active_high = self.settings.get("relay_active_high", False)
         
         if is_active_high:
@@ -135,6 +144,8 @@ class RelayControl:
 
         # If we are live (not booting) and configured, apply the new OFF state immediately for safety
         if not initial_setup and self.logic_configured:
+             if not was_configured:
+                 self._setup_gpio() # First configuration: pins were held as INPUTs until now
              self.turn_off_all_relays()
 
     def _setup_gpio(self):
@@ -190,13 +201,14 @@ class RelayControl:
     # --- RELAY CONTROL AND PROTECTION ENFORCEMENT ---
 
     # FIXED
-    def set_desired_states(self, desired_heat, desired_cool, control_mode, aux_override=False):
+    def set_desired_states(self, desired_heat, desired_cool, control_mode, aux_override=False, params=None):
         """
         Receives simple ON/OFF commands and executes them after enforcing constraints.
         Returns the final, enforced state of the relays.
         Added aux_override for Manual Test Mode.
+        'params' is the tick's ControlParams; fetched from settings if not given.
         """
-        current_time = time.time()
+        current_time = self.clock.time()
         
         # --- 1. State/Status Initialization ---
         is_currently_on = self._is_cooling_on()
@@ -204,10 +216,11 @@ class RelayControl:
         
         restriction_message = "" 
         
-        cool_settings = self.settings.get_all_compressor_protection_settings()
-        DWELL_TIME_S = cool_settings["cooling_dwell_time_s"]
-        MAX_RUNTIME_S = cool_settings["max_cool_runtime_s"]
-        FAIL_SAFE_SHUTDOWN_S = cool_settings["fail_safe_shutdown_time_s"]
+        if params is None:
+            params = self.settings.control_params()
+        DWELL_TIME_S = params.cooling_dwell_time_s
+        MAX_RUNTIME_S = params.max_cool_runtime_s
+        FAIL_SAFE_SHUTDOWN_S = params.fail_safe_shutdown_time_s
         
         # --- 2. Cooling Protection Checks (Priority Order) ---
         
@@ -255,7 +268,7 @@ class RelayControl:
         # --- NEW: AUX RELAY LOGIC WITH OVERRIDE ---
         # Determine Aux state based on the selected mode OR the override
         # UPDATE: Default changed to Uppercase to match KV
-        aux_mode = self.settings.get("aux_relay_mode", "MONITORING")
+        aux_mode = params.aux_relay_mode
         aux_state = False
         
         if aux_override:
@@ -289,16 +302,26 @@ class RelayControl:
         self.relay_state_cache["Fan"] = aux_state
         # -----------------------------------------------------
 
-        # --- 4. Update SettingsManager ---
-        self.settings.set("heat_state", "HEATING" if final_heat_state else "Heating OFF")
-        self.settings.set("cool_state", "COOLING" if final_cool_state else "Cooling OFF") 
-        self.settings.set("cool_restriction_status", restriction_message) 
-        
-        # Update transient fan state for UI
-        self.settings.set("fan_state", "Aux ON" if aux_state else "Aux OFF")
+        # --- 4. Update Live State (one version bump for the whole relay group) ---
+        self.live_state.update(
+            heat_state="HEATING" if final_heat_state else "Heating OFF",
+            cool_state="COOLING" if final_cool_state else "Cooling OFF",
+            cool_restriction_status=restriction_message,
+            fan_state="Aux ON" if aux_state else "Aux OFF" # Transient fan state for UI
+        )
         
         return final_heat_state, final_cool_state
         
+    def cooling_window(self, params):
+        """The compressor's current CoolingWindow under the tick's ControlParams."""
+        current_time = self.clock.time()
+        return CoolingWindow(
+            self._is_cooling_on(),
+            current_time - self.cool_start_time if self.cool_start_time else 0.0,
+            max(0.0, self.last_cool_change + params.cooling_dwell_time_s - current_time),
+            max(0.0, self.cool_disabled_until - current_time),
+        )
+
     # --- FAN CONTROL ---
     # FIXED
     def turn_on_fan(self):
@@ -307,14 +330,14 @@ class RelayControl:
             # --- SAFETY GUARD ---
             if self.logic_configured:
                 self.gpio.output(self.pins["Fan"], self.RELAY_ON)
-            self.settings.set("fan_state", "Fan ON")
+            self.live_state.update(fan_state="Fan ON")
 
     # FIXED
     def turn_off_fan(self):
         # --- SAFETY GUARD ---
         if self.logic_configured:
             self.gpio.output(self.pins["Fan"], self.RELAY_OFF)
-        self.settings.set("fan_state", "Fan OFF")
+        self.live_state.update(fan_state="Fan OFF")
         
     # FIXED
     def turn_off_all_relays(self, skip_aux=False): # Renamed parameter for clarity
@@ -334,10 +357,9 @@ class RelayControl:
         # -----------------------------------------------------
 
         if not skip_aux: 
-            self.settings.set("fan_state", "Aux OFF")
+            self.live_state.update(fan_state="Aux OFF")
         
-        self.settings.set("heat_state", "Heating OFF")
-        self.settings.set("cool_state", "Cooling OFF")
+        self.live_state.update(heat_state="Heating OFF", cool_state="Cooling OFF")
         
     # --- UI UPDATE HELPERS ---
     
@@ -364,35 +386,33 @@ class RelayControl:
         return
         
     def update_ui_data(self, beer_temp, amb_temp, amb_min, amb_max, current_mode, ramp_target, ambient_target):
-        """Updates UI's display variables in SettingsManager with calculated and actual values."""
+        """Updates the UI's live display values with calculated and actual values."""
         
         # --- DEBUG PRINT ---
         # print(f"[DEBUG] RC: Received Actuals: {beer_temp} ({type(beer_temp)}), Setpoint Min: {amb_min}")
         # -------------------
 
-        # 1. ACTUAL TEMPS
-        # beer_temp/amb_temp are passed as float or the string "--.-"
-        self.settings.set("beer_temp_actual", beer_temp)
-        self.settings.set("amb_temp_actual", amb_temp)
-             
-        # 2. SETPOINTS (Numeric values)
-        self.settings.set("amb_min_setpoint", amb_min)
-        self.settings.set("amb_max_setpoint", amb_max)
-        self.settings.set("amb_target_setpoint", ambient_target) # <-- NEW LINE
-        
-        # 3. BEER SETPOINT (Dynamic based on mode)
+        # BEER SETPOINT (Dynamic based on mode)
         beer_target = 0.0
-        if current_mode == "Ramp-Up":
+        if current_mode in ("Ramp-Up", "Profile"):
              beer_target = ramp_target
-        elif current_mode == "Beer Hold":
-             beer_target = self.settings.get("beer_hold_f") 
         elif current_mode == "Fast Crash":
              beer_target = self.settings.get("fast_crash_hold_f")
-        else: # Ambient Hold or initial state
+        else: # Beer Hold, Ambient Hold or initial state
              beer_target = self.settings.get("beer_hold_f") 
              
-        # Use the actual calculated target if available, otherwise the primary hold setting
-        self.settings.set("beer_setpoint_current", beer_target)
+        # Single update: unchanged fields are not flagged, so readers only see real changes
+        self.live_state.update(
+            # 1. ACTUAL TEMPS (float or the string "--.-")
+            beer_temp_actual=beer_temp,
+            amb_temp_actual=amb_temp,
+            # 2. SETPOINTS (Numeric values)
+            amb_min_setpoint=amb_min,
+            amb_max_setpoint=amb_max,
+            amb_target_setpoint=ambient_target,
+            # 3. Use the actual calculated target if available, otherwise the primary hold setting
+            beer_setpoint_current=beer_target
+        )
 
     # --- SAFETY CLEANUP ---
     def cleanup_gpio(self):
@@ -0,0 +1,248 @@
+"""
+fermvault app
+sensor_acquisition.py
+"""
+
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from sensor_backends import default_backend
+from clock import SYSTEM_CLOCK
+
+# Default freshness bound for cached readings. Callers asking within this window
+# share the last acquisition instead of starting another 1-Wire conversion.
+SENSOR_CACHE_MAX_AGE_S = 2.0
+
+# Default deadline for one acquisition. A faulted 1-Wire bus can hang a read for
+# seconds; past this the caller gets a failed (None) reading and moves on.
+SENSOR_READ_TIMEOUT_S = 2.0
+
+# temp_f is None for a failed read; monotonic_ts drives freshness, wall_ts is for display/logs
+SensorReading = namedtuple("SensorReading", "sensor_id temp_f monotonic_ts wall_ts")
+
+
+def c_to_f(temp_c):
+    return temp_c * 9.0 / 5.0 + 32.0
+
+
+class SensorAcquisition:
+    """
+    Shared acquisition service: owns the sensor bus and serves every consumer
+    (monitor loop, standby loop, email commands, UI refreshes) from one cache of
+    timestamped readings.
+
+    A caller gets cached readings that are no older than its freshness bound; only
+    stale probes are read from the backend, and only one acquisition runs at a time,
+    so concurrent callers wait for it and then share its results. Bus traffic scales
+    with the sampling rate, not with the number of callers.
+
+    Backend reads run on a dedicated worker thread and every caller waits at most
+    its deadline. A read that misses the deadline is reported as a failure (None);
+    if it later completes, its result still lands in the cache. While a read is hung
+    no new one is started, so a faulted bus never piles up threads.
+
+    The sysfs backends acquire several probes at once (bulk conversion trigger, or
+    concurrent reads), so an acquisition costs about one conversion time.
+
+    Reading timestamps and cache freshness follow 'clock' (simulated time under a
+    VirtualClock); read deadlines always use real time, since they bound a real thread.
+    """
+
+    def __init__(self, backend=None, max_age_s=SENSOR_CACHE_MAX_AGE_S, read_timeout_s=SENSOR_READ_TIMEOUT_S, clock=None):
+        self.backend = backend or default_backend()
+        self.clock = clock or SYSTEM_CLOCK
+        self.max_age_s = max_age_s
+        self.read_timeout_s = read_timeout_s
+        self._lock = threading.Lock()       # Guards the cache and the in-flight acquisition
+        self._readings = {}                 # sensor_id -> SensorReading (replaced, never mutated)
+        # The worker is the only thread that touches the bus (the watchdog executor)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor-acq")
+        self._closed = False                # Set by shutdown() at app exit
+        self._inflight = None               # Future of the acquisition currently on the bus
+        # sensor_id -> resolution bits last written (or that failed to write), so
+        # apply_resolutions() only touches the bus when a setting actually changes
+        self._applied_resolutions = {}
+        # --- METRICS ---
+        self.acquisitions = 0
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.probe_timeouts = {}            # sensor_id -> reads that missed their deadline
+
+    # --- CACHED READS ---
+    def get_readings(self, sensor_ids, max_age_s=None, timeout_s=None):
+        """
+        Returns {sensor_id: SensorReading} for every assigned ID, reading from the
+        bus only the probes whose cached reading is older than max_age_s. Blocks at
+        most timeout_s; probes not read by then come back as failed readings.
+        """
+        if max_age_s is None:
+            max_age_s = self.max_age_s
+        if timeout_s is None:
+            timeout_s = self.read_timeout_s
+        pending = [sid for sid in dict.fromkeys(sensor_ids) if sid and sid != 'unassigned']
+        if not pending:
+            return {}
+
+        deadline = time.monotonic() + timeout_s
+        results = {}
+        used_bus = False
+        timed_out = False
+        while pending:
+            with self._lock:
+                results.update(self._fresh(pending, max_age_s))
+                pending = [sid for sid in pending if sid not in results]
+                if not pending:
+                    break
+                if self._inflight is None or self._inflight.done():
+                    if self._closed:
+                        break # Shutting down: remaining probes come back as failures
+                    self._inflight = self._executor.submit(self._acquire, pending)
+                future = self._inflight
+            used_bus = True
+            try:
+                acquired = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                timed_out = True
+                break
+            except Exception as e:
+                self.errors += 1
+                print(f"[SensorAcquisition] Sensor read failed: {e}")
+                break
+            # Take what this acquisition read directly (it may be too old for max_age_s=0)
+            for sid in pending:
+                if sid in acquired:
+                    results[sid] = acquired[sid]
+            pending = [sid for sid in pending if sid not in results]
+
+        if pending:
+            # Deadline missed (or backend error): report failures to the fail-safe logic
+            now = self.clock.monotonic()
+            wall = self.clock.time()
+            for sid in pending:
+                results[sid] = SensorReading(sid, None, now, wall)
+                if timed_out:
+                    self.probe_timeouts[sid] = self.probe_timeouts.get(sid, 0) + 1
+            if timed_out:
+                self.timeouts += 1
+                print(f"[SensorAcquisition] Read of {', '.join(pending)} exceeded {timeout_s:.1f}s deadline.")
+        elif not used_bus:
+            self.cache_hits += 1
+        return results
+
+    def _acquire(self, ids):
+        """Runs on the worker thread: reads 'ids' from the backend and caches the results."""
+        readings = self.backend.read_many(ids)
+        now = self.clock.monotonic()
+        wall = self.clock.time()
+        acquired = {}
+        for sid in ids:
+            temp_c = readings.get(sid)
+            acquired[sid] = SensorReading(sid, None if temp_c is None else c_to_f(temp_c), now, wall)
+        with self._lock:
+            updated = dict(self._readings)
+            updated.update(acquired)
+            self._readings = updated
+            self.acquisitions += 1
+        return acquired
+
+    def _fresh(self, ids, max_age_s):
+        now = self.clock.monotonic()
+        readings = self._readings
+        results = {}
+        for sid in ids:
+            reading = readings.get(sid)
+            if reading is not None and now - reading.monotonic_ts <= max_age_s:
+                results[sid] = reading
+        return results
+
+    def latest(self, sensor_id):
+        """Returns the most recent cached SensorReading for a probe (no bus access), or None."""
+        return self._readings.get(sensor_id)
+
+    def invalidate(self, sensor_id=None):
+        """Drops cached readings (one probe, or all) so the next caller re-reads the bus."""
+        with self._lock:
+            if sensor_id is None:
+                self._readings = {}
+            else:
+                updated = dict(self._readings)
+                updated.pop(sensor_id, None)
+                self._readings = updated
+
+    def read_all(self, sensor_ids, max_age_s=None, timeout_s=None):
+        """
+        Returns {sensor_id: temp_f or None} for every assigned probe in 'sensor_ids',
+        served from the cache when fresh enough. Unassigned IDs are skipped.
+        """
+        return {sid: reading.temp_f for sid, reading in self.get_readings(sensor_ids, max_age_s, timeout_s).items()}
+
+    def read_temp_f(self, sensor_id, max_age_s=None, timeout_s=None):
+        """Reads one probe (Fahrenheit). Returns None if unassigned, missing, unreadable or timed out."""
+        return self.read_all((sensor_id,), max_age_s, timeout_s).get(sensor_id)
+
+    def stats(self):
+        """Returns acquisition metrics (counts since startup)."""
+        return {
+            "acquisitions": self.acquisitions,
+            "cache_hits": self.cache_hits,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "probe_timeouts": dict(self.probe_timeouts),
+        }
+
+    # --- RESOLUTION ---
+    def apply_resolutions(self, resolutions):
+        """
+        Applies {sensor_id: bits} (0 = leave as configured). Only writes when the
+        requested value differs from the last one attempted for that probe, so it is
+        cheap to call every tick; failed writes are not retried until the value changes.
+        The write is queued on the bus worker and never blocks the caller.
+        """
+        for sensor_id, bits in resolutions.items():
+            if not sensor_id or sensor_id == 'unassigned' or not bits:
+                continue
+            if self._applied_resolutions.get(sensor_id) == bits:
+                continue
+            self._applied_resolutions[sensor_id] = bits
+            with self._lock:
+                if not self._closed:
+                    self._executor.submit(self._set_resolution, sensor_id, bits)
+
+    def _set_resolution(self, sensor_id, bits):
+        if self.backend.set_resolution(sensor_id, bits):
+            print(f"[SensorAcquisition] {sensor_id} set to {bits}-bit resolution.")
+
+    def device_removed(self, sensor_id):
+        """Forgets a probe that left the bus (cached reading and backend handles)."""
+        self.invalidate(sensor_id)
+        self._applied_resolutions.pop(sensor_id, None) # Re-apply resolution if it comes back
+        with self._lock:
+            if not self._closed:
+                self._executor.submit(self.backend.device_removed, sensor_id)
+
+    def list_devices(self):
+        """Returns the IDs of all probes the backend can see."""
+        return self.backend.list_devices()
+
+    def shutdown(self):
+        """
+        Stops the bus worker and releases the backend (app exit; the service is not
+        usable afterwards). The backend is closed on the worker, after any read still
+        in flight, so no read runs against closed handles. Waits at most read_timeout_s
+        for that, so a hung bus cannot hold up the exit.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            closed = self._executor.submit(self.backend.close)
+        self._executor.shutdown(wait=False)
+        try:
+            closed.result(timeout=self.read_timeout_s)
+        except FutureTimeout:
+            print("[SensorAcquisition] Bus still busy at shutdown; backend left open.")
+        except Exception as e:
+            print(f"[SensorAcquisition] Backend close failed: {e}")
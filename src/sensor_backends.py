@@ -0,0 +1,394 @@
+"""
+fermvault app
+sensor_backends.py
+"""
+
+import os
+import sys
+import csv
+import glob
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 1-WIRE SYSFS LAYOUT ---
+W1_DEVICES_DIR = "/sys/bus/w1/devices"
+W1_MASTER_GLOB = "w1_bus_master*"
+W1_BULK_READ_FILE = "therm_bulk_read"   # Kernel w1_therm: write "trigger" to start a bus-wide conversion
+W1_SLAVE_FILE = "w1_slave"
+W1_TEMPERATURE_FILE = "temperature"    # Kernel w1_therm: single integer, millidegrees C (no CRC text)
+W1_RESOLUTION_FILE = "resolution"      # Kernel w1_therm: read/write conversion resolution (9-12 bits)
+W1_MASTER_SLAVES_FILE = "w1_master_slaves"  # Bus master: one slave ID per line ("not found." when empty)
+DS18B20_FAMILY_PREFIX = "28-"
+
+# Worker threads for concurrent probe reads (used when bulk conversion is unavailable)
+SENSOR_READ_WORKERS = 4
+
+# Mock probes for Windows (no 1-Wire bus): 68.0 F beer, 70.0 F ambient (stored in C)
+MOCK_SENSOR_TEMPS_C = {"28-MOCK-BEER001": (68.0 - 32.0) * 5.0 / 9.0, "28-MOCK-AMBIENT1": (70.0 - 32.0) * 5.0 / 9.0}
+
+
+def parse_w1_slave(lines):
+    """Parses the two-line w1_slave output. Returns degrees C, or None on CRC failure/garbage."""
+    if len(lines) < 2 or lines[0].strip()[-3:] != 'YES':
+        return None
+    equals_pos = lines[1].find('t=')
+    if equals_pos == -1:
+        return None
+    return float(lines[1][equals_pos+2:]) / 1000.0
+
+
+class SensorBackend(ABC):
+    """
+    Source of DS18B20-style probe readings. All temperatures are degrees C.
+    Subclasses implement read_one(); read_many() may be overridden to acquire
+    several probes in one operation.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def read_one(self, sensor_id):
+        """Returns one probe's temperature (C), or None if missing/unreadable."""
+
+    def read_many(self, sensor_ids):
+        """Returns {sensor_id: temp_c or None} for every ID given."""
+        return {sid: self.read_one(sid) for sid in sensor_ids}
+
+    def list_devices(self):
+        """Returns the IDs of all probes this backend can see."""
+        return []
+
+    def set_resolution(self, sensor_id, bits):
+        """Sets a probe's conversion resolution. Returns True if applied."""
+        return False
+
+    def get_resolution(self, sensor_id):
+        return None
+
+    def device_removed(self, sensor_id):
+        """Called when discovery sees a probe leave the bus (drop any per-probe state)."""
+        pass
+
+    def close(self):
+        pass
+
+
+class SysfsW1Backend(SensorBackend):
+    """
+    Common base for the kernel w1 sysfs interface: device listing, resolution
+    control, and multi-probe reads via bulk conversion or a thread pool.
+    """
+
+    def __init__(self, devices_dir=W1_DEVICES_DIR, max_workers=SENSOR_READ_WORKERS, use_bulk_conversion=True):
+        self.devices_dir = devices_dir
+        self.max_workers = max_workers
+        self.use_bulk_conversion = use_bulk_conversion
+        self._executor = None
+
+    def _device_path(self, sensor_id, attribute):
+        return os.path.join(self.devices_dir, sensor_id, attribute)
+
+    def list_devices(self):
+        """
+        Lists DS18B20 IDs from the bus masters' w1_master_slaves (one small read per
+        master); falls back to globbing the devices directory if no master is visible.
+        """
+        master_files = glob.glob(os.path.join(self.devices_dir, W1_MASTER_GLOB, W1_MASTER_SLAVES_FILE))
+        if not master_files:
+            device_folders = glob.glob(os.path.join(self.devices_dir, DS18B20_FAMILY_PREFIX + '*'))
+            return [os.path.basename(f) for f in device_folders]
+        devices = []
+        for path in master_files:
+            try:
+                with open(path, 'r') as f:
+                    devices.extend(line.strip() for line in f if line.strip().startswith(DS18B20_FAMILY_PREFIX))
+            except OSError as e:
+                print(f"[SensorBackend] Could not read {path}: {e}")
+        return devices
+
+    # --- RESOLUTION ---
+    def set_resolution(self, sensor_id, bits):
+        """
+        Writes a probe's conversion resolution (9-12 bits) through the w1 'resolution'
+        attribute. Lower resolution converts faster (9-bit ~94 ms vs 12-bit ~750 ms).
+        Writing needs root (or a udev rule) on most systems.
+        """
+        try:
+            with open(self._device_path(sensor_id, W1_RESOLUTION_FILE), 'w') as f:
+                f.write(f"{int(bits)}\n")
+            return True
+        except OSError as e:
+            print(f"[SensorBackend] Could not set {sensor_id} to {bits}-bit resolution: {e}")
+            return False
+
+    def get_resolution(self, sensor_id):
+        try:
+            with open(self._device_path(sensor_id, W1_RESOLUTION_FILE), 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    # --- BULK CONVERSION ---
+    def trigger_bulk_conversion(self):
+        """
+        Starts a conversion on every probe of every bus master. Returns True if any master
+        accepted it. If every trigger write fails (therm_bulk_read is root-owned on a normal
+        install), bulk conversion is turned off once, logged, and concurrent reads take over.
+        """
+        triggered = False
+        error = None
+        for path in glob.glob(os.path.join(self.devices_dir, W1_MASTER_GLOB, W1_BULK_READ_FILE)):
+            try:
+                with open(path, 'w') as f:
+                    f.write("trigger\n")
+                triggered = True
+            except OSError as e:
+                error = (path, e)
+        if error and not triggered:
+            self.use_bulk_conversion = False
+            print(f"[SensorBackend] Bulk conversion trigger failed on {error[0]}: {error[1]}. "
+                  f"Using concurrent reads from now on.")
+        return triggered
+
+    def read_many(self, sensor_ids):
+        """
+        Acquires several probes in one operation: one bulk-conversion trigger and
+        then fast read-backs, or concurrent reads when the kernel has no bulk read.
+        """
+        ids = list(sensor_ids)
+        if len(ids) <= 1:
+            return {sid: self.read_one(sid) for sid in ids}
+
+        if self.use_bulk_conversion and self.trigger_bulk_conversion():
+            # Conversions are already running in parallel on the probes; read back in turn
+            return {sid: self.read_one(sid) for sid in ids}
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="w1-read")
+        return dict(zip(ids, self._executor.map(self.read_one, ids)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class W1SlaveBackend(SysfsW1Backend):
+    """Reads the classic two-line 'w1_slave' file (CRC line + 't=' line)."""
+
+    name = "w1_slave"
+
+    def read_one(self, sensor_id):
+        try:
+            with open(self._device_path(sensor_id, W1_SLAVE_FILE), 'r') as f: lines = f.readlines()
+            return parse_w1_slave(lines)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[SensorBackend] Error reading sensor {sensor_id}: {e}")
+        return None
+
+
+class W1TemperatureBackend(SysfsW1Backend):
+    """
+    Reads the kernel's single-integer 'temperature' attribute (millidegrees C; the
+    driver has already checked the CRC). The attribute is kept open per probe and
+    re-read with pread at offset 0. Probes without the attribute (older kernels)
+    fall back to 'w1_slave'.
+    """
+
+    name = "temperature"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fds = {}
+        self._fd_lock = threading.Lock()
+        self._fallback = W1SlaveBackend(self.devices_dir, use_bulk_conversion=False)
+
+    def _get_fd(self, sensor_id):
+        with self._fd_lock:
+            fd = self._fds.get(sensor_id)
+            if fd is None:
+                fd = os.open(self._device_path(sensor_id, W1_TEMPERATURE_FILE), os.O_RDONLY)
+                self._fds[sensor_id] = fd
+            return fd
+
+    def _drop_fd(self, sensor_id):
+        with self._fd_lock:
+            fd = self._fds.pop(sensor_id, None)
+        if fd is not None:
+            try: os.close(fd)
+            except OSError: pass
+
+    def device_removed(self, sensor_id):
+        self._drop_fd(sensor_id)
+
+    def read_one(self, sensor_id):
+        try:
+            fd = self._get_fd(sensor_id)
+        except FileNotFoundError:
+            return self._fallback.read_one(sensor_id)
+        except OSError as e:
+            print(f"[SensorBackend] Error opening sensor {sensor_id}: {e}")
+            return None
+        try:
+            return int(os.pread(fd, 32, 0).strip()) / 1000.0
+        except (OSError, ValueError) as e:
+            # Conversion/CRC failures surface as EIO; drop the handle so an unplugged probe reopens cleanly
+            self._drop_fd(sensor_id)
+            print(f"[SensorBackend] Error reading sensor {sensor_id}: {e}")
+            return None
+
+    def close(self):
+        with self._fd_lock:
+            fds = list(self._fds.values())
+            self._fds.clear()
+        for fd in fds:
+            try: os.close(fd)
+            except OSError: pass
+        super().close()
+
+
+class FakeSysfsBackend(W1SlaveBackend):
+    """
+    W1SlaveBackend over a fake sysfs tree in a temporary directory, for development
+    and tests without hardware. Probes can be changed, added and removed at runtime.
+    """
+
+    name = "fake_sysfs"
+
+    def __init__(self, temps_c=None, root_dir=None, bulk_read=True, **kwargs):
+        self._owns_root = root_dir is None
+        root_dir = root_dir or tempfile.mkdtemp(prefix="fermvault-w1-")
+        build_fake_w1_tree(root_dir, temps_c or {}, bulk_read=bulk_read)
+        super().__init__(devices_dir=root_dir, **kwargs)
+
+    def set_temp(self, sensor_id, temp_c):
+        """Sets (or adds) a probe; temp_c=None simulates a CRC failure."""
+        write_fake_w1_slave(self.devices_dir, sensor_id, temp_c)
+        self._write_master_slaves()
+
+    def remove_probe(self, sensor_id):
+        shutil.rmtree(os.path.join(self.devices_dir, sensor_id), ignore_errors=True)
+        self._write_master_slaves()
+
+    def _write_master_slaves(self):
+        device_folders = glob.glob(os.path.join(self.devices_dir, DS18B20_FAMILY_PREFIX + '*'))
+        ids = sorted(os.path.basename(f) for f in device_folders)
+        for master in glob.glob(os.path.join(self.devices_dir, W1_MASTER_GLOB)):
+            with open(os.path.join(master, W1_MASTER_SLAVES_FILE), 'w') as f:
+                f.write("".join(f"{sensor_id}\n" for sensor_id in ids) or "not found.\n")
+
+    def close(self):
+        super().close()
+        if self._owns_root:
+            shutil.rmtree(self.devices_dir, ignore_errors=True)
+
+
+class ScriptedBackend(SensorBackend):
+    """
+    Serves readings from in-memory scripts: {sensor_id: iterable of temp_c (None = failed read)}.
+    Each read advances that probe's script; when a script runs out the last value
+    repeats (or the script restarts if loop=True). Plain numbers are constant probes.
+    """
+
+    name = "scripted"
+
+    def __init__(self, scripts, loop=False):
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._scripts = {}
+        self._positions = {}
+        for sensor_id, values in scripts.items():
+            self._scripts[sensor_id] = [values] if isinstance(values, (int, float)) or values is None else list(values)
+            self._positions[sensor_id] = 0
+        self._resolutions = {}
+
+    @classmethod
+    def from_csv(cls, path, columns, fahrenheit=False, loop=False):
+        """
+        Replays recorded temperatures, e.g. from pid_log.csv:
+            ScriptedBackend.from_csv(path, {"28-beer": "MeasuredTemp"}, fahrenheit=True)
+        'columns' maps sensor_id -> CSV column name. Blank/invalid cells replay as failed reads.
+        """
+        scripts = {sensor_id: [] for sensor_id in columns}
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                for sensor_id, column in columns.items():
+                    try:
+                        value = float(row.get(column, ""))
+                        if fahrenheit:
+                            value = (value - 32.0) * 5.0 / 9.0
+                    except (ValueError, TypeError):
+                        value = None
+                    scripts[sensor_id].append(value)
+        return cls(scripts, loop=loop)
+
+    def read_one(self, sensor_id):
+        with self._lock:
+            script = self._scripts.get(sensor_id)
+            if not script:
+                return None
+            position = self._positions[sensor_id]
+            if position >= len(script):
+                position = 0 if self._loop else len(script) - 1
+            value = script[position]
+            self._positions[sensor_id] = position + 1
+            return value
+
+    def list_devices(self):
+        return list(self._scripts)
+
+    def set_resolution(self, sensor_id, bits):
+        self._resolutions[sensor_id] = bits
+        return True
+
+    def get_resolution(self, sensor_id):
+        return self._resolutions.get(sensor_id, 12)
+
+
+def default_backend(devices_dir=W1_DEVICES_DIR):
+    """
+    Picks the backend for this machine: mock probes on Windows (no 1-Wire bus),
+    otherwise the kernel 'temperature' attribute (falls back to w1_slave per probe).
+    """
+    if sys.platform == 'win32':
+        return ScriptedBackend(MOCK_SENSOR_TEMPS_C)
+    return W1TemperatureBackend(devices_dir)
+
+
+# --- FAKE SYSFS TREE (development/testing without hardware) ---
+def build_fake_w1_tree(root_dir, temps_c, master="w1_bus_master1", bulk_read=True):
+    """
+    Writes a minimal /sys/bus/w1/devices lookalike under 'root_dir':
+    one <id>/w1_slave file per probe ({sensor_id: temp_c, or None for a CRC failure}),
+    plus a bus master directory with w1_master_slaves (and therm_bulk_read if requested).
+    Returns root_dir.
+    """
+    os.makedirs(os.path.join(root_dir, master), exist_ok=True)
+    for sensor_id, temp_c in temps_c.items():
+        write_fake_w1_slave(root_dir, sensor_id, temp_c)
+    with open(os.path.join(root_dir, master, W1_MASTER_SLAVES_FILE), 'w') as f:
+        f.write("".join(f"{sensor_id}\n" for sensor_id in temps_c) or "not found.\n")
+    if bulk_read:
+        with open(os.path.join(root_dir, master, W1_BULK_READ_FILE), 'w') as f:
+            f.write("0\n")
+    return root_dir
+
+
+def write_fake_w1_slave(root_dir, sensor_id, temp_c):
+    """Creates/updates one fake probe's w1_slave file (temp_c=None writes a CRC failure)."""
+    device_dir = os.path.join(root_dir, sensor_id)
+    os.makedirs(device_dir, exist_ok=True)
+    crc = "NO" if temp_c is None else "YES"
+    millideg = 0 if temp_c is None else int(round(temp_c * 1000))
+    with open(os.path.join(device_dir, W1_SLAVE_FILE), 'w') as f:
+        f.write(f"72 01 4b 46 7f ff 0e 10 57 : crc=57 {crc}\n")
+        f.write(f"72 01 4b 46 7f ff 0e 10 57 t={millideg}\n")
+    resolution_file = os.path.join(device_dir, W1_RESOLUTION_FILE)
+    if not os.path.exists(resolution_file):
+        with open(resolution_file, 'w') as f:
+            f.write("12\n")
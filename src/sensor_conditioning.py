@@ -0,0 +1,166 @@
+"""
+fermvault app
+sensor_conditioning.py
+"""
+
+from array import array
+from bisect import insort, bisect_left
+
+
+class RingBuffer:
+    """Fixed-size ring of floats backed by array('d'). append() is O(1)."""
+
+    __slots__ = ("_data", "_size", "_index", "count")
+
+    def __init__(self, size):
+        self._size = max(1, int(size))
+        self._data = array('d', [0.0] * self._size)
+        self._index = 0
+        self.count = 0
+
+    def append(self, value):
+        """Adds a value; returns the value it overwrote (or None while filling)."""
+        evicted = self._data[self._index] if self.count == self._size else None
+        self._data[self._index] = value
+        self._index = (self._index + 1) % self._size
+        if self.count < self._size:
+            self.count += 1
+        return evicted
+
+    def clear(self):
+        self._index = 0
+        self.count = 0
+
+
+class RollingMedian:
+    """
+    Median of the last 'window' samples. Keeps the window sorted alongside the
+    ring buffer, so each sample is one insert and one removal in a fixed-size
+    list (constant cost for a fixed window).
+    """
+
+    __slots__ = ("_ring", "_sorted")
+
+    def __init__(self, window):
+        self._ring = RingBuffer(window)
+        self._sorted = []
+
+    def update(self, value):
+        evicted = self._ring.append(value)
+        if evicted is not None:
+            del self._sorted[bisect_left(self._sorted, evicted)]
+        insort(self._sorted, value)
+        n = len(self._sorted)
+        mid = n // 2
+        return self._sorted[mid] if n % 2 else (self._sorted[mid - 1] + self._sorted[mid]) / 2.0
+
+    def reset(self):
+        self._ring.clear()
+        self._sorted = []
+
+
+class ConditioningConfig:
+    """
+    Per-probe conditioning settings:
+      median_window        - samples in the rolling median (1 = off)
+      ema_alpha            - exponential smoothing weight of the newest sample (1.0 = off)
+      max_rate_f_per_min   - larger jumps are rejected as spikes (0 = off)
+      max_rejects          - consecutive rejections before a jump is accepted as a real step
+    """
+
+    __slots__ = ("median_window", "ema_alpha", "max_rate_f_per_min", "max_rejects")
+
+    def __init__(self, median_window=1, ema_alpha=1.0, max_rate_f_per_min=0.0, max_rejects=3):
+        self.median_window = median_window
+        self.ema_alpha = ema_alpha
+        self.max_rate_f_per_min = max_rate_f_per_min
+        self.max_rejects = max_rejects
+
+    def __eq__(self, other):
+        return isinstance(other, ConditioningConfig) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+
+class ProbeConditioner:
+    """
+    Streaming pipeline for one probe: spike rejection -> rolling median -> EMA.
+    Each stage is O(1) per sample. Failed reads (None) pass through unchanged and
+    do not disturb the filter state.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._median = RollingMedian(config.median_window) if config.median_window > 1 else None
+        self._ema = None
+        self._last_raw = None
+        self._last_ts = None        # Timestamp of the last accepted sample
+        self._last_seen_ts = None   # Timestamp of the last sample fed (accepted or rejected)
+        self._last_output = None
+        self._rejects = 0
+        self.spikes_rejected = 0
+
+    def reset(self):
+        if self._median: self._median.reset()
+        self._ema = None
+        self._last_raw = None
+        self._last_ts = None
+        self._last_seen_ts = None
+        self._last_output = None
+        self._rejects = 0
+
+    def update(self, temp_f, timestamp):
+        """
+        Feeds one raw reading (F) taken at 'timestamp' (monotonic seconds) and returns
+        the conditioned value. Re-feeding the same timestamp (a cached reading) returns
+        the previous output without counting the sample twice.
+        """
+        if temp_f is None:
+            return None
+        if timestamp == self._last_seen_ts:
+            return self._last_output
+        self._last_seen_ts = timestamp
+
+        cfg = self.config
+        # --- 1. Rate-of-change spike rejection ---
+        if cfg.max_rate_f_per_min > 0 and self._last_raw is not None and self._last_ts is not None:
+            elapsed_min = max(timestamp - self._last_ts, 1e-3) / 60.0
+            if abs(temp_f - self._last_raw) / elapsed_min > cfg.max_rate_f_per_min:
+                self._rejects += 1
+                if self._rejects <= cfg.max_rejects:
+                    self.spikes_rejected += 1
+                    return self._last_output
+                # Persistent jump: accept it as a real step and restart the filters from it
+                if self._median: self._median.reset()
+                self._ema = None
+        self._rejects = 0
+        self._last_raw = temp_f
+        self._last_ts = timestamp
+
+        # --- 2. Rolling median ---
+        value = self._median.update(temp_f) if self._median else temp_f
+
+        # --- 3. Exponential smoothing ---
+        if self._ema is None or cfg.ema_alpha >= 1.0:
+            self._ema = value
+        else:
+            self._ema += cfg.ema_alpha * (value - self._ema)
+
+        self._last_output = self._ema
+        return self._ema
+
+
+def condition_reading(conditioners, role, sensor_id, reading, config):
+    """
+    Runs a SensorReading through the conditioner kept in 'conditioners' (role -> (sensor_id,
+    ProbeConditioner)), rebuilding it when the probe or config changes. Returns F or None.
+    """
+    if reading is None:
+        return None
+    entry = conditioners.get(role)
+    if entry is None or entry[0] != sensor_id or entry[1].config != config:
+        entry = (sensor_id, ProbeConditioner(config))
+        conditioners[role] = entry
+    return entry[1].update(reading.temp_f, reading.monotonic_ts)
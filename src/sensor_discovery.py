@@ -0,0 +1,86 @@
+"""
+fermvault app
+sensor_discovery.py
+"""
+
+import threading
+
+# How often the bus master's slave list is re-checked
+SENSOR_DISCOVERY_INTERVAL_S = 5.0
+
+SENSOR_ADDED = "added"
+SENSOR_REMOVED = "removed"
+
+
+class SensorDiscovery:
+    """
+    Background 1-Wire discovery. Polls the backend's device list (for sysfs, the
+    bus masters' w1_master_slaves files), keeps an incremental set of probe IDs and
+    calls listeners with (SENSOR_ADDED | SENSOR_REMOVED, sensor_id) on changes.
+
+    devices() answers from the cached set, so UI re-scans cost nothing when the
+    bus is unchanged.
+    """
+
+    def __init__(self, backend, interval_s=SENSOR_DISCOVERY_INTERVAL_S):
+        self.backend = backend
+        self.interval_s = interval_s
+        self._devices = frozenset()
+        self._scan_lock = threading.Lock()
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._scanned = False
+
+    def add_listener(self, callback):
+        """Registers callback(event, sensor_id). Called on the discovery thread."""
+        self._listeners.append(callback)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._discovery_loop, daemon=True, name="SensorDiscovery")
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _discovery_loop(self):
+        while not self._stop_event.is_set():
+            self.rescan()
+            self._stop_event.wait(self.interval_s)
+
+    def devices(self):
+        """Returns the known probe IDs (sorted). Scans once if discovery has not run yet."""
+        if not self._scanned:
+            return self.rescan()
+        return sorted(self._devices)
+
+    def rescan(self):
+        """Re-reads the bus device list, emits add/remove events, and returns the sorted IDs."""
+        with self._scan_lock:
+            try:
+                current = frozenset(self.backend.list_devices())
+            except Exception as e:
+                print(f"[SensorDiscovery] Device scan failed: {e}")
+                return sorted(self._devices)
+            previous = self._devices
+            self._devices = current
+            first_scan = not self._scanned
+            self._scanned = True
+
+        if current != previous and not first_scan:
+            for sensor_id in sorted(current - previous):
+                print(f"[SensorDiscovery] Sensor added: {sensor_id}")
+                self._emit(SENSOR_ADDED, sensor_id)
+            for sensor_id in sorted(previous - current):
+                print(f"[SensorDiscovery] Sensor removed: {sensor_id}")
+                self._emit(SENSOR_REMOVED, sensor_id)
+        return sorted(current)
+
+    def _emit(self, event, sensor_id):
+        for callback in list(self._listeners):
+            try:
+                callback(event, sensor_id)
+            except Exception as e:
+                print(f"[ERROR] SensorDiscovery: Listener failed for {event} {sensor_id}: {e}")
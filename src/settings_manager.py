@@ -5,27 +5,53 @@ settings_manager.py
 
 import json
 import os
+import copy
 import time
 import uuid
 import sys 
+import queue
 import hmac
 import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
+from contextlib import contextmanager
+from types import MappingProxyType
 import threading 
 
+from live_state import LiveState, LIVE_FIELD_NAMES
+from control_params import (ControlParams, DEFAULT_CONTROL_MODE, DEFAULT_AMBIENT_HOLD_F, DEFAULT_BEER_HOLD_F,
+                            DEFAULT_RAMP_UP_HOLD_F, DEFAULT_RAMP_UP_DURATION_HOURS, DEFAULT_FAST_CRASH_HOLD_F)
+
 # --- MODIFIED: Use the filename from our plan ---
 SETTINGS_FILE = "fermvault_settings.json"
+
+# --- WRITE-BEHIND PERSISTENCE ---
+# Bursts of set() calls inside this window are coalesced into a single disk write.
+SETTINGS_SAVE_DEBOUNCE_S = 2.0
+# fsync the temp file before the atomic rename (protects against power loss on SD cards).
+SETTINGS_FSYNC_ON_SAVE = True
+
+# --- APPEND-ONLY JOURNAL ---
+# In journal mode set() appends a small key/value record instead of rewriting the whole file.
+# Startup replays snapshot + journal; the writer compacts once the journal passes the threshold.
+SETTINGS_JOURNAL_FILE_SUFFIX = ".journal"
+SETTINGS_JOURNAL_MODE = True
+SETTINGS_JOURNAL_COMPACT_BYTES = 64 * 1024
+# Top-level snapshot key recording the last journal sequence folded into the snapshot
+JOURNAL_SEQ_KEY = "_journal_seq"
 # --- MODIFIED: Removed BREW_SESSIONS_FILE (it's saved in the main settings) ---
 
-# --- CONTROL MODE DEFAULTS ---
-DEFAULT_CONTROL_MODE = "Beer Hold"
-DEFAULT_AMBIENT_HOLD_F = 68.0
-DEFAULT_BEER_HOLD_F = 55.0
-DEFAULT_RAMP_UP_HOLD_F = 68.0
-DEFAULT_RAMP_UP_DURATION_HOURS = 30.0
-DEFAULT_FAST_CRASH_HOLD_F = 34.0
-# --- END CONTROL MODE DEFAULTS ---
+# (Control mode defaults, DEFAULT_*, live in control_params.py: one source for the
+# settings defaults and the compiled ControlParams)
+
+# Sentinel for snapshot misses (None is a legitimate settings value)
+_MISSING = object()
+
+# --- TRANSIENT KEYS ---
+# Live/UI values live in LiveState (live_state.py), not in the persisted settings.
+# get()/set() still accept these keys and route them to the live store.
+# ("monitoring_state" is intentionally NOT transient so it persists across restarts.)
+TRANSIENT_KEYS = frozenset(LIVE_FIELD_NAMES)
 
 
 class SettingsManager:
@@ -51,6 +77,7 @@ class SettingsManager:
             "ramp_up_hold_f": DEFAULT_RAMP_UP_HOLD_F,
             "ramp_up_duration_hours": DEFAULT_RAMP_UP_DURATION_HOURS,
             "fast_crash_hold_f": DEFAULT_FAST_CRASH_HOLD_F,
+            "fermentation_profile": None, # {"name", "steps": [...]} run by the "Profile" mode (fermentation_profile.py)
             "temp_units": "F", # F or C
         }
 
@@ -62,6 +89,32 @@ class SettingsManager:
             "ds18b20_ambient_sensor": "unassigned",
             "ds18b20_beer_sensor": "unassigned",
             
+            # --- Probe resolution (bits 9-12; 0 = leave the probe as configured) ---
+            "ds18b20_ambient_resolution_bits": 0,
+            "ds18b20_beer_resolution_bits": 0,
+            # "PROBE SETTINGS" uses the two values above; "FAST AMBIENT" runs the ambient
+            # probe at 9-bit (~94 ms) and the beer probe at 12-bit (~750 ms)
+            "sensor_timing_mode": "PROBE SETTINGS",
+            # Readings younger than this are shared by all callers instead of re-reading the bus
+            "sensor_cache_max_age_s": 2.0,
+            # A probe read that takes longer than this is reported as a failed read
+            "sensor_read_timeout_s": 2.0,
+
+            # --- Adaptive monitor loop interval (wide on a settled hold, tight near a transition) ---
+            "adaptive_loop_rate": True,
+            "loop_min_period_s": 2.0,
+            "loop_max_period_s": 30.0,
+
+            # --- Per-probe conditioning (spike rejection -> rolling median -> EMA) ---
+            # median window 1 = off, EMA alpha 1.0 = off, max rate 0 = off
+            "beer_filter_median_window": 3,
+            "beer_filter_ema_alpha": 1.0,
+            "beer_filter_max_rate_f_per_min": 2.0,
+            "ambient_filter_median_window": 3,
+            "ambient_filter_ema_alpha": 1.0,
+            "ambient_filter_max_rate_f_per_min": 10.0,
+            "filter_max_rejects": 3,
+            
             # --- NEW: Relay Logic Defaults ---
             "relay_logic_configured": False, # Forces wizard on first run
             "relay_active_high": False,      # Default to Active Low (Standard)
@@ -100,6 +153,20 @@ class SettingsManager:
             "ramp_pid_landing_zone": 0.5,
             "crash_pid_envelope_width": 2.0,
             
+            # --- Autotune (relay-feedback) ---
+            "autotune_relay_f": 4.0,            # PID output swing (F) around the beer setpoint
+            "autotune_hysteresis_f": 0.1,
+            "autotune_cycles": 3,
+            "autotune_max_hours": 48.0,
+            "autotune_rule": "tyreus-luyben",   # ziegler-nichols / tyreus-luyben / no-overshoot
+            "autotune_result": None,            # Last proposal (see autotune.AutotuneResult)
+            
+            # --- Predictive cooling (compressor_planner.py; needs an identified thermal model) ---
+            "predictive_cooling": False,
+            "mpc_horizon_s": 10800.0,           # Planning horizon (3 hours)
+            "mpc_beer_tolerance_f": 0.5,        # Beer band the plan must stay inside
+            "mpc_room_f": 70.0,                 # Temperature around the chamber
+            
             "show_eula_on_launch": True,
             "eula_agreed": False, 
             
@@ -107,38 +174,19 @@ class SettingsManager:
             "ramp_start_time": 0.0,
             "ramp_latched_start_temp": 0.0,
             "ramp_is_finished": False,
+            "profile_run": None, # Fermentation profile run in progress (one versioned record)
             # -----------------------------------
             
-            # Transient Keys
-            "beer_temp_actual": "--.-",
-            "amb_temp_actual": "--.-",
-            "beer_temp_timestamp": "--:--:--",
-            "amb_temp_timestamp": "--:--:--",
-            "og_timestamp_var": "--:--:--",
-            "sg_timestamp_var": "--:--:--",
-            
-            "amb_min_setpoint": 0.0,
-            "amb_max_setpoint": 0.0,
-            "beer_setpoint_current": 0.0,
-            "amb_target_setpoint": 0.0,
-            
-            "heat_state": "Heating OFF",
-            "cool_state": "Cooling OFF",
-            
-            "cool_restriction_status": "",
-            "sensor_error_message": "",
-            
-            "cooling_delay_message": "init", 
+            # (Live/transient values such as temps and relay status live in LiveState)
             "monitoring_state": "OFF",
             
-            "og_display_var": "-.---",
-            "sg_display_var": "-.---",
-            
-            "fg_status_var": "", 
-            "fg_value_var": "-.---",
-            
             "aux_relay_mode": "MONITORING",
-            "fan_state": "Fan OFF", 
+            
+            # Additional chambers driven by this Pi (see chambers.py). Each entry:
+            # {"id", "name", "relay_pins": {"Heat", "Cool", "Fan"}, "settings": {control overrides},
+            #  "monitoring": "ON"/"OFF", "ramp": {ramp persistence keys}, "autotune_result": {...},
+            #  "profile_run": {...}}
+            "chambers": [],
         }
             
     def _get_default_compressor_protection_settings(self):
@@ -208,7 +256,8 @@ class SettingsManager:
         ]
     
     # --- INITIALIZATION ---
-    def __init__(self, settings_file_path=None):
+    def __init__(self, settings_file_path=None, save_debounce_s=SETTINGS_SAVE_DEBOUNCE_S, fsync_on_save=SETTINGS_FSYNC_ON_SAVE,
+                 journal_mode=SETTINGS_JOURNAL_MODE, journal_compact_bytes=SETTINGS_JOURNAL_COMPACT_BYTES):
         
         # --- MODIFICATION: Define the user data directory ---
         self.data_dir = os.path.join(os.path.expanduser('~'), 'fermvault-data')
@@ -231,6 +280,58 @@ class SettingsManager:
         self.settings = {}
         self._data_lock = threading.RLock()
         
+        # Live telemetry store (never persisted). The TemperatureController is its primary writer.
+        self.live_state = LiveState()
+        
+        # --- WRITE-BEHIND STATE ---
+        # set() only marks the settings dirty; a background writer thread coalesces
+        # bursts and performs one atomic write per debounce window.
+        self.save_debounce_s = save_debounce_s
+        self.fsync_on_save = fsync_on_save
+        self._dirty = False
+        self._write_lock = threading.Lock()      # Serializes actual file writes (writer thread vs flush())
+        self._save_event = threading.Event()     # Signals the writer that there is pending data
+        self._writer_stop = threading.Event()
+        self._writer_thread = None
+        
+        # --- JOURNAL STATE ---
+        self.journal_mode = journal_mode
+        self.journal_compact_bytes = journal_compact_bytes
+        self.journal_file = self.settings_file + SETTINGS_JOURNAL_FILE_SUFFIX
+        self._journal_seq = 0            # Sequence number of the newest journal record (in memory)
+        self._journal_bytes = 0          # Current journal size on disk
+        self._pending_journal = {}       # key -> (seq, category, value), coalesced per key
+        
+        # Flat key -> category name index (built at load time) so get()/set() are O(1)
+        self._key_index = {}
+        
+        # --- COPY-ON-WRITE SNAPSHOT ---
+        # Immutable flat {key: value} view, rebuilt on every mutation and published by a
+        # single reference swap. get() reads it without taking _data_lock.
+        self._snapshot_data = {}   # Backing dict of the published view; never mutated after publish
+        self._snapshot = MappingProxyType(self._snapshot_data)
+        self.snapshot_version = 0
+        
+        # --- BATCH (TRANSACTION) STATE ---
+        # While a batch is open its thread holds _data_lock; snapshot publishing is deferred
+        # until the outermost batch exits so readers see all of its changes or none.
+        self._batch_depth = 0
+        self._batch_owner = None
+        self._batch_publish_pending = False
+        self._batch_write_count = 0
+        
+        # Compiled ControlParams and the snapshot they were built from: (snapshot, params)
+        self._control_params_cache = (None, None)
+        
+        # --- CHANGE SUBSCRIPTIONS ---
+        # Callbacks registered via subscribe() run on a dedicated notifier thread,
+        # never on the thread that called set() and never under _data_lock.
+        self._subscribers = {}           # subscription id -> (frozenset of keys, callback)
+        self._key_subscribers = {}       # key -> set of subscription ids
+        self._next_subscription_id = 1
+        self._notify_queue = queue.Queue()
+        self._notifier_thread = None
+        
         self.brew_sessions = [""] * 10
         
         self.was_controlled_shutdown = False
@@ -241,6 +342,7 @@ class SettingsManager:
 
     # FIXED
     def _load_settings(self):
+        snapshot_seq = 0
         try:
             with self._data_lock:
                 # 1. Check if the file exists in the desired new location
@@ -250,10 +352,11 @@ class SettingsManager:
 
                     print(f"[SettingsManager] No settings file found at {self.settings_file}. Creating new one with defaults.")
                     self.settings = self._get_default_settings()
-                    self._save_all_settings() # This performs the first write to the correct path
+                    self._dirty = True # First write to the correct path happens below via flush()
                 else:
                     with open(self.settings_file, 'r') as f:
                         self.settings = json.load(f)
+                    snapshot_seq = self.settings.pop(JOURNAL_SEQ_KEY, 0)
                     
                     # --- FIX: Ensure all default categories exist ---
                     default_settings = self._get_default_settings()
@@ -278,6 +381,12 @@ class SettingsManager:
                                         self.settings[key][sub_key] = sub_value
                                     # --- MIGRATION LOGIC END ---
                                     
+                    # --- MIGRATION: Drop live values saved by older versions ---
+                    for category_data in self.settings.values():
+                        if isinstance(category_data, dict):
+                            for transient_key in TRANSIENT_KEYS.intersection(category_data):
+                                del category_data[transient_key]
+                                    
                 # --- MODIFICATION START: Load brew sessions from main settings ---
                 self.brew_sessions = self.settings['system_settings'].get('brew_sessions_list', [""] * 10)
                 # --- MODIFICATION END ---
@@ -302,17 +411,383 @@ class SettingsManager:
             self.settings['system_settings']['controlled_shutdown'] = False
             # --- END MODIFICATION ---
 
-    def _save_all_settings(self):
+        # New journal records continue after the snapshot's sequence, even when there is no
+        # journal to replay (a clean shutdown truncates it); otherwise they would be numbered
+        # from 1 again and the next replay would skip them as already folded in.
+        self._journal_seq = snapshot_seq
+        # Replay any journal records newer than the snapshot (recovers changes made after the last compaction)
+        if self._replay_journal(snapshot_seq):
+            self._dirty = True # Fold the journal into a fresh snapshot right away
+        
+        self._rebuild_key_index()
+
+        # A brand-new settings file (or a replayed journal) is written synchronously.
+        if self._dirty:
+            self.flush()
+
+    def _rebuild_key_index(self):
+        """
+        Rebuilds the flat key -> category index.
+        Categories are walked in dict order and the FIRST owner wins, matching the
+        original linear-scan semantics (e.g. 'active_api_service' resolves to api_settings).
+        """
+        with self._data_lock:
+            index = {}
+            for category_name, category_data in self.settings.items():
+                if isinstance(category_data, dict):
+                    for key in category_data:
+                        index.setdefault(key, category_name)
+            self._key_index = index
+            self._publish_snapshot()
+
+    def _publish_snapshot(self):
+        """Rebuilds the flat snapshot from self.settings and swaps it in. Caller should hold _data_lock."""
+        with self._data_lock:
+            if self._batch_depth:
+                self._batch_publish_pending = True # Published once when the batch commits
+                return
+            flat = {}
+            for category_data in self.settings.values():
+                if isinstance(category_data, dict):
+                    for key, value in category_data.items():
+                        flat.setdefault(key, value)
+            old_flat = self._snapshot_data
+            self._snapshot_data = flat
+            self._snapshot = MappingProxyType(flat)
+            self.snapshot_version += 1
+            if self._key_subscribers:
+                changes = {}
+                for key in self._key_subscribers:
+                    value = flat.get(key, _MISSING)
+                    if value is not _MISSING and old_flat.get(key, _MISSING) != value:
+                        changes[key] = value
+                if changes:
+                    self._notify_queue.put(changes)
+
+    def _publish_key(self, key, value):
+        """Copy-on-write update of a single key in the snapshot. Caller must hold _data_lock."""
+        if self._batch_depth:
+            self._batch_publish_pending = True
+            return
+        old_value = self._snapshot_data.get(key, _MISSING)
+        flat = self._snapshot_data.copy()
+        flat[key] = value
+        self._snapshot_data = flat
+        self._snapshot = MappingProxyType(flat)
+        self.snapshot_version += 1
+        if key in self._key_subscribers and old_value != value:
+            self._notify_queue.put({key: value})
+
+    def snapshot(self):
+        """
+        Returns the current immutable settings view (flat, read-only mapping).
+        Never blocks; hold on to it for a consistent read of several keys.
+        """
+        return self._snapshot
+
+    def control_params(self):
+        """
+        Returns the ControlParams compiled from the current snapshot. Rebuilt only
+        when the snapshot has changed; otherwise a lock-free identity check.
+        """
+        snap = self._snapshot
+        cached_snap, params = self._control_params_cache
+        if cached_snap is not snap:
+            params = ControlParams.from_settings(snap)
+            self._control_params_cache = (snap, params)
+        return params
+
+    def subscribe(self, keys, callback):
+        """
+        Calls callback(changes) whenever any of 'keys' changes value, where 'changes'
+        is a {key: new_value} dict of just the subscribed keys that changed. A batch
+        produces one call. Callbacks run on the settings notifier thread, so they
+        should be quick (cache a value, set an Event). Returns a subscription id for
+        unsubscribe(). Live telemetry keys cannot be subscribed to (use live_state).
+        """
+        if isinstance(keys, str):
+            keys = (keys,)
+        keys = frozenset(keys)
+        transient = keys & TRANSIENT_KEYS
+        if transient:
+            print(f"[SettingsManager] Warning: Ignoring subscription to live keys {sorted(transient)}.")
+            keys = keys - transient
+        with self._data_lock:
+            subscription_id = self._next_subscription_id
+            self._next_subscription_id += 1
+            self._subscribers[subscription_id] = (keys, callback)
+            for key in keys:
+                self._key_subscribers.setdefault(key, set()).add(subscription_id)
+            if self._notifier_thread is None or not self._notifier_thread.is_alive():
+                self._notifier_thread = threading.Thread(target=self._notifier_loop, daemon=True, name="SettingsNotifier")
+                self._notifier_thread.start()
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        """Removes a subscription created by subscribe(). Unknown ids are ignored."""
+        with self._data_lock:
+            entry = self._subscribers.pop(subscription_id, None)
+            if entry is None:
+                return
+            for key in entry[0]:
+                ids = self._key_subscribers.get(key)
+                if ids:
+                    ids.discard(subscription_id)
+                    if not ids:
+                        del self._key_subscribers[key]
+
+    def _notifier_loop(self):
+        """Delivers queued change sets to subscribers (runs on its own daemon thread)."""
+        while True:
+            changes = self._notify_queue.get()
+            if changes is None:
+                break
+            with self._data_lock:
+                targets = set()
+                for key in changes:
+                    targets.update(self._key_subscribers.get(key, ()))
+                deliveries = [self._subscribers[i] for i in sorted(targets) if i in self._subscribers]
+            for keys, callback in deliveries:
+                relevant = {key: value for key, value in changes.items() if key in keys}
+                try:
+                    callback(relevant)
+                except Exception as e:
+                    print(f"[ERROR] SettingsManager: Subscriber callback failed: {e}")
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups several set()/save_*() calls into one transaction:
+
+            with settings_manager.batch():
+                settings_manager.set("ramp_start_time", now)
+                settings_manager.set("ramp_is_finished", False)
+
+        Changes are applied in memory, become visible to other threads all at once
+        on exit, and are persisted by a single write. If the block raises, every
+        change made inside it is rolled back. Batches may be nested.
+        """
+        with self._data_lock:
+            self._batch_depth += 1
+            if self._batch_depth == 1:
+                self._batch_owner = threading.get_ident()
+                self._batch_publish_pending = False
+                self._batch_write_count = 0
+                saved_settings = copy.deepcopy(self.settings)
+                saved_pending = dict(self._pending_journal)
+                saved_dirty = self._dirty
+            try:
+                yield self
+            except BaseException:
+                if self._batch_depth == 1:
+                    # Roll back memory and any persistence queued inside the batch
+                    self.settings = saved_settings
+                    self._pending_journal = saved_pending
+                    self._dirty = saved_dirty
+                    self._batch_publish_pending = False
+                    self._batch_depth = 0
+                    self._batch_owner = None
+                    self._rebuild_key_index() # Also republishes the snapshot
+                    raise
+                self._batch_depth -= 1
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._batch_owner = None
+                if self._batch_publish_pending:
+                    self._publish_snapshot()
+                if self.journal_mode and self._batch_write_count > 1:
+                    # Persist the whole batch with one atomic snapshot write (a torn journal
+                    # append could otherwise leave only part of the batch on disk)
+                    self._dirty = True
+                    self._ensure_writer_running()
+                    self._save_event.set()
+
+    def _lookup_category(self, key):
+        """Returns the category dict that owns 'key', or None. Caller must hold _data_lock."""
+        category_name = self._key_index.get(key)
+        if category_name is not None:
+            category_data = self.settings.get(category_name)
+            if isinstance(category_data, dict) and key in category_data:
+                return category_data
+        # Index miss or stale (category replaced externally): fall back to a scan and repair
+        for category_name, category_data in self.settings.items():
+            if isinstance(category_data, dict) and key in category_data:
+                self._key_index[key] = category_name
+                return category_data
+        return None
+
+    def _replay_journal(self, snapshot_seq):
+        """
+        Applies journal records with seq > snapshot_seq on top of self.settings.
+        A torn final line (power cut mid-append) is skipped. Returns the number of records applied.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        applied = 0
         try:
             with self._data_lock:
-                # --- MODIFICATION: File path is now correct from __init__ ---
-                with open(self.settings_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.settings, f, indent=4)
-            # --- MODIFICATION START: Remove comment ---
-            # (Brew sessions are now saved with all settings)
-            # --- MODIFICATION END ---
+                with open(self.journal_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                            seq, category, key, value = record["seq"], record["cat"], record["key"], record["val"]
+                        except (ValueError, KeyError, TypeError):
+                            continue # Partial/corrupt record
+                        self._journal_seq = max(self._journal_seq, seq)
+                        if seq <= snapshot_seq:
+                            continue # Already folded into the snapshot
+                        category_data = self.settings.get(category)
+                        if isinstance(category_data, dict) and key in category_data:
+                            category_data[key] = value
+                            applied += 1
+                self._journal_bytes = os.path.getsize(self.journal_file)
+            if applied:
+                print(f"[SettingsManager] Replayed {applied} journal record(s) from {self.journal_file}.")
+        except Exception as e:
+            print(f"[ERROR] Failed to replay settings journal {self.journal_file}: {e}")
+        return applied
+
+    # --- WRITE-BEHIND PERSISTENCE ---
+
+    def _journal_key(self, category_name, key, value):
+        """Queues a single key/value journal record for the writer. Caller must hold _data_lock."""
+        self._journal_seq += 1
+        self._pending_journal[key] = (self._journal_seq, category_name, value)
+        self._batch_write_count += 1
+        self._ensure_writer_running()
+        self._save_event.set()
+
+    def _save_all_settings(self):
+        """
+        Marks the settings dirty and wakes the background writer.
+        The actual disk write is deferred and coalesced (see flush()).
+        """
+        with self._data_lock:
+            self._dirty = True
+            self._batch_write_count += 1
+            # Callers may have mutated category dicts directly; republish the full view
+            self._publish_snapshot()
+        self._ensure_writer_running()
+        self._save_event.set()
+
+    def _ensure_writer_running(self):
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            if self._writer_stop.is_set():
+                return # Writer was shut down; callers must flush() explicitly
+            self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer_thread.start()
+
+    def _writer_loop(self):
+        """Background thread: waits for dirty state, lets the burst settle, then writes once."""
+        while not self._writer_stop.is_set():
+            self._save_event.wait()
+            if self._writer_stop.is_set():
+                break
+            # Coalesce: any set() calls during this window are folded into the same write
+            self._writer_stop.wait(self.save_debounce_s)
+            self._save_event.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Writes pending settings to disk immediately (if dirty).
+        Called by the writer thread, and directly on shutdown/signal paths.
+        Full rewrites (and compactions) go through the atomic snapshot; single-key
+        changes in journal mode are appended to the journal instead.
+        Returns True if the data on disk is up to date.
+        """
+        with self._write_lock:
+            with self._data_lock:
+                if not self._dirty and not self._pending_journal:
+                    return True
+                full_write = self._dirty or not self.journal_mode
+                records = self._pending_journal
+                self._pending_journal = {}
+                self._dirty = False
+                # Serialize under the lock (fast, in-memory); disk I/O happens outside it
+                if full_write:
+                    snapshot = dict(self.settings)
+                    snapshot[JOURNAL_SEQ_KEY] = self._journal_seq
+                    payload = json.dumps(snapshot, indent=4)
+                else:
+                    payload = "".join(
+                        json.dumps({"seq": seq, "cat": category, "key": key, "val": value}) + "\n"
+                        for key, (seq, category, value) in sorted(records.items(), key=lambda item: item[1][0])
+                    )
+
+            if full_write:
+                ok = self._write_file_atomic(payload)
+                if ok and self.journal_mode:
+                    self._truncate_journal()
+            else:
+                ok = self._append_journal(payload)
+                if ok and self._journal_bytes >= self.journal_compact_bytes:
+                    # Background compaction: the writer folds the journal into a new snapshot
+                    with self._data_lock:
+                        self._dirty = True
+                    self._ensure_writer_running()
+                    self._save_event.set()
+
+            if ok:
+                return True
+
+            # Keep the data marked dirty so the next flush retries (newer pending records win)
+            with self._data_lock:
+                if full_write:
+                    self._dirty = True
+                for key, record in records.items():
+                    self._pending_journal.setdefault(key, record)
+            return False
+
+    def _append_journal(self, payload):
+        """Appends records to the journal (one JSON object per line)."""
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                if self.fsync_on_save:
+                    os.fsync(f.fileno())
+                self._journal_bytes = f.tell()
+            return True
+        except Exception as e:
+            print(f"[ERROR] Failed to append settings journal {self.journal_file}: {e}")
+            return False
+
+    def _truncate_journal(self):
+        """Removes the journal after a snapshot write has folded it in."""
+        try:
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self._journal_bytes = 0
+        except Exception as e:
+            # Harmless: stale records are skipped on replay by their sequence number
+            print(f"[ERROR] Failed to truncate settings journal {self.journal_file}: {e}")
+
+    def _write_file_atomic(self, payload):
+        """Writes to a temp file, optionally fsyncs, then renames over the real file."""
+        tmp_path = self.settings_file + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                if self.fsync_on_save:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.settings_file)
+            return True
         except Exception as e:
             print(f"[ERROR] Failed to save settings to {self.settings_file}: {e}")
+            return False
+
+    def shutdown(self):
+        """Stops the background writer and notifier and flushes any pending settings to disk."""
+        if self._notifier_thread and self._notifier_thread.is_alive():
+            self._notify_queue.put(None)
+        self._writer_stop.set()
+        self._save_event.set()
+        if self._writer_thread and self._writer_thread.is_alive() and self._writer_thread is not threading.current_thread():
+            self._writer_thread.join(timeout=2)
+        return self.flush()
 
     # ... (rest of the file is unchanged and correct) ...
     
@@ -349,7 +824,9 @@ class SettingsManager:
     def reset_all_settings_to_defaults(self):
         # Reset all internal settings and save
         # --- MODIFICATION: Call _get_default_settings() directly ---
-        self.settings = self._get_default_settings()
+        with self._data_lock:
+            self.settings = self._get_default_settings()
+            self._rebuild_key_index()
         # --- END MODIFICATION ---
         self.brew_sessions = self._get_default_brew_session_settings()
         self._save_all_settings()
@@ -366,49 +843,39 @@ class SettingsManager:
     
     def get(self, key, default=None):
         # A simplified getter that flattens the nested dictionaries for easy access
-        # --- FIX: Acquire lock for safe read from multiple threads ---
+        if key in TRANSIENT_KEYS:
+            return getattr(self.live_state, key)
+        # Lock-free fast path: read the published copy-on-write snapshot
+        # (skipped by the thread inside an open batch so it sees its own uncommitted changes)
+        if not (self._batch_depth and self._batch_owner == threading.get_ident()):
+            value = self._snapshot.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        # Slow path (key not in the snapshot): fall back to a locked lookup
         with self._data_lock:
-            for category in self.settings.values():
-                if isinstance(category, dict) and key in category:
-                    return category[key]
+            category_data = self._lookup_category(key)
+            if category_data is not None:
+                return category_data[key]
         return default
 
     def set(self, key, value):
         # A simplified setter that finds the key in nested dictionaries and updates it
+        # Transient data is only updated in memory (LiveState), which is what the monitoring loop needs.
+        if key in TRANSIENT_KEYS:
+            self.live_state.update(**{key: value})
+            return True
+        
         # --- FIX: Acquire lock for safe write from multiple threads ---
         with self._data_lock:
-            for category_name, category_data in self.settings.items():
-                if isinstance(category_data, dict) and key in category_data:
-                    category_data[key] = value
-                    
-                    # --- CRITICAL FIX: Only save persistent settings to disk (avoiding disk I/O in the monitor loop) ---
-                    transient_keys = [
-                        "beer_temp_actual", "amb_temp_actual", "beer_temp_timestamp", "amb_temp_timestamp", 
-                        "og_timestamp_var", "sg_timestamp_var",
-                        "amb_min_setpoint", "amb_max_setpoint", "beer_setpoint_current", "amb_target_setpoint",
-                        "heat_state", "cool_state", 
-                        
-                        # --- NEW KEY: Add the restriction status key ---
-                        "cool_restriction_status", 
-                        # --- END NEW KEY ---
-                        
-                        # --- NEW KEY: Add sensor error message ---
-                        "sensor_error_message",
-                        # --- END NEW KEY ---
-
-                        "cooling_delay_message", "fan_state", 
-                        # "monitoring_state", <--- REMOVED from transient list to enable persistence
-                        "og_display_var", "sg_display_var", 
-                        
-                        # --- MODIFICATION: Added FG vars ---
-                        "fg_status_var", "fg_value_var"
-                        # --- END MODIFICATION ---
-                    ]
-                    
-                    if key not in transient_keys:
-                         self._save_all_settings() # Save persistent data to disk
-                    # Transient data is only updated in memory, which is what the monitoring loop needs.
-                    return True
+            category_data = self._lookup_category(key)
+            if category_data is not None:
+                category_data[key] = value
+                self._publish_key(key, value)
+                if self.journal_mode:
+                    self._journal_key(self._key_index.get(key), key, value) # O(1) append
+                else:
+                    self._save_all_settings() # Save persistent data to disk
+                return True
         
         # If key was not found, log an error
         print(f"[ERROR] SettingsManager: Key '{key}' not found in any category. Set failed.")
@@ -479,4 +946,5 @@ class SettingsManager:
         with self._data_lock: # FIX: Acquire lock
             if key in self.settings['control_settings']:
                  self.settings['control_settings'][key] = value
+                 self._publish_snapshot()
             # Note: No save to disk is performed here.
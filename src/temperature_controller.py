@@ -3,87 +3,71 @@ fermvault app
 temperature_controller.py
 """
 
-import requests
-import json
 import threading
-import time
-from datetime import datetime
-import glob
 import os
-import sys
-import csv
 
-# Mock temps for Windows (no DS18B20 hardware)
-MOCK_BEER_TEMP_F = 68.0
-MOCK_AMBIENT_TEMP_F = 70.0
-MOCK_SENSOR_IDS = ["28-MOCK-BEER001", "28-MOCK-AMBIENT1"]
+from sensor_acquisition import SensorAcquisition
+from sensor_discovery import SensorDiscovery, SENSOR_ADDED
+from sensor_conditioning import condition_reading
+from tick_scheduler import TickScheduler, CONTROL_LOOP_PERIOD_S
+from clock import SYSTEM_CLOCK
+from control_kernel import (KernelInputs, control_step, initial_state, reset_ramp, resume_ramp, reset_profile,
+                            resume_profile_run, append_pid_log_row)
+from control_params import CONTROL_PARAM_KEYS
+from loop_rate import AdaptiveLoopRate
+from chambers import ChamberRegistry
+from thermal_model import load_model, model_path
+from compressor_planner import CompressorPlanner
 
-# --- PID CLASS DEFINITION ---
-class PID:
-    def __init__(self, Kp, Ki, Kd, setpoint, out_min=-10.0, out_max=5.0):
-        self.Kp = Kp; self.Ki = Ki; self.Kd = Kd; self.setpoint = setpoint
-        self.out_min = out_min; self.out_max = out_max
-        self._last_error = 0; self._integral = 0
 
-    def update(self, process_variable, dt):
-        error = self.setpoint - process_variable
-        
-        # Calculate P and D terms first so we can use them for anti-windup
-        p_term = self.Kp * error
-        derivative = (error - self._last_error) / dt if dt > 0 else 0
-        d_term = self.Kd * derivative
-        
-        # Add to integral and calculate provisional output
-        self._integral += error * dt
-        i_term = self.Ki * self._integral
-        
-        output = p_term + i_term + d_term
-        
-        # Output Clamping and Anti-Windup (Back-calculation)
-        if output > self.out_max:
-            output = self.out_max
-            # Stop the integral from ballooning invisibly
-            if self.Ki != 0:
-                self._integral = (output - p_term - d_term) / self.Ki
-        elif output < self.out_min:
-            output = self.out_min
-            if self.Ki != 0:
-                self._integral = (output - p_term - d_term) / self.Ki
-
-        self._last_error = error
-        return output
-
-    def set_setpoint(self, setpoint):
-        self.setpoint = setpoint
-        self._integral = 0
-        self._last_error = 0
-# --- END PID CLASS DEFINITION ---
-        
 class TemperatureController:
     
-    def __init__(self, settings_manager, relay_control):
+    def __init__(self, settings_manager, relay_control, sensor_backend=None, clock=None):
         self.settings_manager = settings_manager
         self.relay_control = relay_control
         self.notification_manager = None
         
-        # Read PID values from settings
-        kp = self.settings_manager.get("pid_kp", 2.0)
-        ki = self.settings_manager.get("pid_ki", 0.03)
-        kd = self.settings_manager.get("pid_kd", 20.0)
+        # Time source for ticks, PID dt, ramp timing and log timestamps.
+        # Defaults to the relay controller's clock so dwell timing and control agree.
+        self.clock = clock or getattr(relay_control, "clock", None) or SYSTEM_CLOCK
+        
+        # Live telemetry (temps, setpoints, status text); this controller is its primary writer
+        self.live_state = settings_manager.live_state
         
-        self.pid = PID(Kp=kp, Ki=ki, Kd=kd, setpoint=0.0) 
-        print(f"[TempController] PID initialized with Kp={kp}, Ki={ki}, Kd={kd}")
+        params = self.settings_manager.control_params()
+        print(f"[TempController] PID initialized with Kp={params.pid_kp}, Ki={params.pid_ki}, Kd={params.pid_kd}")
         
-        self.last_pid_update_time = time.time()
+        # Control state (PID, ramp, sensor/fail-safe latches) carried between kernel passes.
+        # Replaced, never mutated; the lock makes each step-and-commit atomic against UI resets.
+        self.kernel_state = initial_state()
+        self._kernel_lock = threading.Lock()
+        self.tick_scheduler = TickScheduler(CONTROL_LOOP_PERIOD_S, clock=self.clock)
+        # Interval between monitor ticks follows the thermal state (wide on steady holds)
+        self.loop_rate = AdaptiveLoopRate(CONTROL_LOOP_PERIOD_S)
+        # A control setting change runs the next tick now instead of after a widened interval
+        self.settings_manager.subscribe(CONTROL_PARAM_KEYS, self._on_control_settings_changed)
         
         self._monitoring = False
         self._monitor_thread = None
         self._stop_event = threading.Event()
         
-        # Sensor state tracking
-        self._beer_sensor_ok = True
-        self._amb_sensor_ok = True
-        self._fail_safe_logged = False
+        # Reads all assigned probes in one (bulk or concurrent) acquisition per tick.
+        # The backend defaults to the kernel w1 interface (mock probes on Windows).
+        self.sensor_acquisition = SensorAcquisition(sensor_backend, clock=self.clock)
+        
+        # Per-probe conditioning between acquisition and control: role -> (sensor_id, ProbeConditioner)
+        self._conditioners = {}
+        
+        # Background bus discovery: hotplug events instead of globbing on every scan
+        self.sensor_discovery = SensorDiscovery(self.sensor_acquisition.backend)
+        self.sensor_discovery.add_listener(self._on_sensor_event)
+        self.sensor_discovery.start()
+        
+        # Additional chambers: share this acquisition service, the GPIO driver, the clock and the UI log
+        self.chambers = ChamberRegistry(settings_manager, self.sensor_acquisition, clock=self.clock,
+                                        reserved_pins=getattr(relay_control, "pins", {}).values(),
+                                        log_message=self._log_ui_message)
+        self.chambers.start()
         
         # --- RAMP STATE (With Persistence Check) ---
         saved_start_time = self.settings_manager.get("ramp_start_time", 0.0)
@@ -92,28 +76,19 @@ class TemperatureController:
         
         if saved_start_time > 0:
             print(f"[TempController] RESTORING RAMP STATE from timestamp {saved_start_time}")
-            self.ramp_state = {
-                "current_target": 0.0, # Will be fixed by _pre_calculate_ramp_target immediately
-                "last_step_time": 0.0, 
-                "start_time": saved_start_time,
-                "latched_start_temp": saved_latched_temp,
-                "is_finished": saved_is_finished,
-                "is_in_pre_ramp": False, # Skipped because we are resuming
-                "ramp_logging_done": False
-            }
-            # --- FIX: Pre-calculate target NOW to prevent 0.0 bouncing ---
-            self._pre_calculate_ramp_target()
-            # -------------------------------------------------------------
-        else:
-            # Default initialization (Fresh Start)
-            self.ramp_state = {
-                "current_target": 0.0, 
-                "last_step_time": 0.0, 
-                "start_time": 0.0, 
-                "is_finished": False,
-                "is_in_pre_ramp": True,
-                "ramp_logging_done": False
-            }
+            # Target is computed NOW so it never reads 0.0 during the sensor warm-up phase
+            self.kernel_state = resume_ramp(self.kernel_state, params, self.clock.time(),
+                                            saved_start_time, saved_latched_temp, saved_is_finished)
+            print(f"[TempController] Pre-calculated Ramp Target: {self.kernel_state.ramp_target:.2f} F")
+        
+        # --- PROFILE RUN (one persisted record; resumes at the step it was on) ---
+        saved_profile_run = self.settings_manager.get("profile_run")
+        if saved_profile_run:
+            self.kernel_state = resume_profile_run(self.kernel_state, saved_profile_run, self.clock.time())
+            if self.kernel_state.profile is not None:
+                print(f"[TempController] RESTORING PROFILE '{saved_profile_run.get('name')}' at phase {self.kernel_state.profile.phase}")
+            else:
+                print("[TempController] Ignoring unreadable profile run record.")
         # -------------------------------------------
         
         # --- CRITICAL FIX: Use the SAME directory as SettingsManager ---
@@ -123,46 +98,15 @@ class TemperatureController:
             # Fallback only if attribute is missing
             self.data_dir = os.path.join(os.path.expanduser('~'), 'fermvault_data')
         # ----------------------------------------------------------------
+        
+        # Identified beer model (thermal_model.py), if one has been fitted from the PID log
+        self.thermal_model = load_model(model_path(self.data_dir))
+        if self.thermal_model:
+            print(f"[TempController] Thermal model loaded: tau {self.thermal_model.tau_s / 3600:.2f} h, "
+                  f"dead time {self.thermal_model.dead_time_s / 60:.0f} min.")
+        # Plans the compressor from that model when predictive cooling is enabled
+        self.compressor_planner = CompressorPlanner(self.thermal_model)
 
-    def _pre_calculate_ramp_target(self):
-        """
-        Calculates the current ramp target immediately based on timestamps.
-        This prevents the 'current_target' from being 0.0 during the sensor warm-up phase.
-        """
-        try:
-            if self.ramp_state["is_finished"]:
-                end_temp = self.settings_manager.get("ramp_up_hold_f", 68.0)
-                self.ramp_state["current_target"] = end_temp
-                self.pid.setpoint = end_temp # Prime the PID
-                return
-
-            current_time = time.time()
-            duration_hours = self.settings_manager.get("ramp_up_duration_hours", 30.0)
-            end_temp = self.settings_manager.get("ramp_up_hold_f", 68.0)
-            start_temp = self.ramp_state.get("latched_start_temp", 65.0)
-
-            if duration_hours > 0:
-                time_elapsed_seconds = current_time - self.ramp_state["start_time"]
-                total_duration_seconds = duration_hours * 3600
-                
-                if time_elapsed_seconds >= total_duration_seconds:
-                    self.ramp_state["current_target"] = end_temp
-                    self.ramp_state["is_finished"] = True
-                else:
-                    total_rise = end_temp - start_temp
-                    fraction_complete = time_elapsed_seconds / total_duration_seconds
-                    increment = total_rise * fraction_complete
-                    self.ramp_state["current_target"] = start_temp + increment
-            else:
-                 self.ramp_state["current_target"] = end_temp
-            
-            # Prime the PID so it doesn't see a 0->Target jump
-            self.pid.setpoint = self.ramp_state["current_target"]
-            print(f"[TempController] Pre-calculated Ramp Target: {self.ramp_state['current_target']:.2f} F")
-
-        except Exception as e:
-            print(f"[TempController] Error pre-calculating ramp target: {e}")
-    
     def startup_persistence_check(self):
         """
         Called by the UI (Main App) after the GUI is fully built.
@@ -189,11 +133,11 @@ class TemperatureController:
             # 2. Start the logic thread
             self.start_monitoring()
     
-    def _log_pid_data(self, setpoint, measured_temp, pid_output, amb_min, amb_max):
-        """Logs temperature data to a CSV file if enabled in settings."""
+    def _log_pid_data(self, params, pid_log, amb_temp=None):
+        """Logs one PID data row (KernelOutputs.pid_log) to a CSV file if enabled in settings."""
         
         # Guard clause: Check if logging is enabled
-        if not self.settings_manager.get("pid_logging_enabled", False):
+        if not params.pid_logging_enabled:
             return
             
         try:
@@ -203,33 +147,16 @@ class TemperatureController:
             # 2. Define the log file path (MATCHING UI LABEL)
             log_file_path = os.path.join(self.data_dir, "pid_log.csv") 
 
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            file_exists = os.path.isfile(log_file_path)
-            
-            # Get relay states and control mode
-            cool_state = "ON" if "COOLING" in self.settings_manager.get("cool_state") else "OFF"
-            heat_state = "ON" if "HEATING" in self.settings_manager.get("heat_state") else "OFF"
-            control_mode = self.settings_manager.get("control_mode", "Unknown")
-
-            # 3. Write Data
-            with open(log_file_path, 'a', newline='') as csvfile:
-                fieldnames = ['Timestamp', 'ControlMode', 'Setpoint', 'MeasuredTemp', 'PID_Output', 'AmbientSetpoint_Min', 'AmbientSetpoint_Max', 'CoolState', 'HeatState']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-                if not file_exists:
-                    writer.writeheader()
-                
-                writer.writerow({
-                    'Timestamp': timestamp,
-                    'ControlMode': control_mode,
-                    'Setpoint': f"{setpoint:.2f}",
-                    'MeasuredTemp': f"{measured_temp:.3f}",
-                    'PID_Output': f"{pid_output:.4f}",
-                    'AmbientSetpoint_Min': f"{amb_min:.2f}",
-                    'AmbientSetpoint_Max': f"{amb_max:.2f}",
-                    'CoolState': cool_state,
-                    'HeatState': heat_state
-                })
+            # 3. Write Data (with relay states and control mode)
+            append_pid_log_row(
+                log_file_path,
+                self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
+                params.control_mode,
+                pid_log,
+                "ON" if "COOLING" in self.live_state.cool_state else "OFF",
+                "ON" if "HEATING" in self.live_state.heat_state else "OFF",
+                amb_temp,
+            )
         
         except (PermissionError, IOError) as e:
             log_msg = f"[CRITICAL ERROR] Failed to write PID log to {self.data_dir}: {e}"
@@ -243,547 +170,195 @@ class TemperatureController:
             if self.notification_manager and self.notification_manager.ui:
                 self.notification_manager.ui.log_system_message(log_msg)
 
-    def ambient_hold_logic(self, amb_temp):
-        """Controls Ambient Temp to the Ambient Hold Setpoint (Simple Thermostat)."""
-        target_amb_temp = self.settings_manager.get("ambient_hold_f", 37.0) 
-        DEADBAND = self.settings_manager.get("ambient_deadband", 1.0)
-        amb_min = target_amb_temp - DEADBAND
-        amb_max = target_amb_temp + DEADBAND
-        
-        # --- NEW: Log data even in Ambient Mode ---
-        # We pass target_amb_temp as Setpoint, amb_temp as Measured, and 0 for PID Output
-        if amb_temp is not None:
-            self._log_pid_data(target_amb_temp, amb_temp, 0.0, amb_min, amb_max)
-        # ------------------------------------------
-        
-        return amb_min, amb_max
-                
     # --- SENSOR READING ---
     def _read_temp_from_id(self, sensor_id):
         """Reads the temperature from a DS18B20 sensor given its ID (in Fahrenheit)."""
-        # Removed the 'is_hardware_available' check, assuming hardware is present.
-        if not sensor_id or sensor_id == 'unassigned':
-            return None 
+        return self.sensor_acquisition.read_temp_f(sensor_id)
 
-        device_file = f'/sys/bus/w1/devices/{sensor_id}/w1_slave'
-        if not os.path.exists(device_file): return None
-        
-        try:
-            with open(device_file, 'r') as f: lines = f.readlines()
-            if lines[0].strip()[-3:] != 'YES': return None
-            
-            equals_pos = lines[1].find('t=')
-            if equals_pos != -1:
-                temp_string = lines[1][equals_pos+2:]
-                temp_c = float(temp_string) / 1000.0
-                temp_f = temp_c * 9.0 / 5.0 + 32.0
-                return temp_f
-            
-        except Exception as e:
-            print(f"TemperatureController: Error reading sensor {sensor_id}: {e}")
-        return None
+    def read_temperatures(self, params):
+        """
+        Reads the beer and ambient probes in a single (possibly cached) acquisition.
+        Returns (beer_temp, amb_temp) in Fahrenheit; None for a failed/unassigned probe.
+        """
+        beer_id = params.ds18b20_beer_sensor
+        amb_id = params.ds18b20_ambient_sensor
+        # Per-probe resolution (no-op unless the setting/timing mode changed)
+        self.sensor_acquisition.apply_resolutions({
+            beer_id: params.beer_resolution_bits,
+            amb_id: params.ambient_resolution_bits,
+        })
+        # Served from the shared cache when another caller read the bus recently enough
+        # Never blocks past the read deadline; a timed-out probe comes back as None (fail-safe path)
+        readings = self.sensor_acquisition.get_readings(
+            (beer_id, amb_id),
+            max_age_s=params.sensor_cache_max_age_s,
+            timeout_s=params.sensor_read_timeout_s,
+        )
+        beer_temp = condition_reading(self._conditioners, "beer", beer_id, readings.get(beer_id), params.beer_conditioning)
+        amb_temp = condition_reading(self._conditioners, "ambient", amb_id, readings.get(amb_id), params.ambient_conditioning)
+        return beer_temp, amb_temp
 
     def read_ambient_temperature(self):
         """Reads the ambient temperature (F) from the assigned sensor."""
         sensor_id = self.settings_manager.get("ds18b20_ambient_sensor", "unassigned")
-        if sensor_id == 'unassigned':
-            return None
-        # Windows: No DS18B20 hardware - return mock temp for UX demo
-        if sys.platform == 'win32':
-            return MOCK_AMBIENT_TEMP_F
         return self._read_temp_from_id(sensor_id)
 
     def read_beer_temperature(self):
         """Reads the beer temperature (F) from the assigned sensor."""
         sensor_id = self.settings_manager.get("ds18b20_beer_sensor", "unassigned")
-        if sensor_id == 'unassigned':
-            return None
-        # Windows: No DS18B20 hardware - return mock temp for UX demo
-        if sys.platform == 'win32':
-            return MOCK_BEER_TEMP_F
         return self._read_temp_from_id(sensor_id)
 
     def detect_ds18b20_sensors(self):
-        """Finds all available DS18B20 sensors (for settings popup)."""
-        # Windows: No 1-Wire bus - return mock IDs for UX demo
-        if sys.platform == 'win32':
-            return list(MOCK_SENSOR_IDS)
-        base_dir = '/sys/bus/w1/devices/'
-        device_folders = glob.glob(base_dir + '28-*')
-        return [os.path.basename(f) for f in device_folders]
+        """Returns all available DS18B20 sensors (for settings popup) from the discovery cache."""
+        return self.sensor_discovery.devices()
+
+    def _on_sensor_event(self, event, sensor_id):
+        """Discovery callback: drop stale state for a plugged/unplugged probe so the next tick re-reads it."""
+        if event == SENSOR_ADDED:
+            self.sensor_acquisition.invalidate(sensor_id)
+        else:
+            self.sensor_acquisition.device_removed(sensor_id)
+        
+        params = self.settings_manager.control_params()
+        if sensor_id in (params.ds18b20_beer_sensor, params.ds18b20_ambient_sensor):
+            state = "re-connected" if event == SENSOR_ADDED else "removed from bus"
+            print(f"[TempController] Assigned sensor {sensor_id} {state}.")
+
+    def _on_control_settings_changed(self, changes):
+        """Settings subscription callback: applies control changes on an immediate tick."""
+        if self._monitoring:
+            self.tick_scheduler.wake()
 
-    # --- CONTROL MODES (Logic only, no GPIO or Safety enforcement) ---
+    def _log_ui_message(self, message):
+        """Writes a line to the UI system log (if the UI is up)."""
+        if self.notification_manager and self.notification_manager.ui:
+            self.notification_manager.ui.log_system_message(message)
 
+    # --- RAMP STATE ---
     def reset_ramp_state(self):
-        """Resets the internal ramp state variables AND clears disk persistence."""
+        """Resets the ramp state AND clears disk persistence."""
         print("Ramp state reset by UI.")
         
         # 1. Reset Memory State
-        self.ramp_state = {
-            "current_target": 0.0, 
-            "last_step_time": 0.0, 
-            "start_time": 0.0, 
-            "is_finished": False,
-            "is_in_pre_ramp": True,
-            "ramp_logging_done": False
-        }
+        with self._kernel_lock:
+            self.kernel_state = reset_ramp(self.kernel_state)
         
         # 2. Reset Disk Persistence (Clear the saved file keys)
         # We write 0/False so __init__ sees them as empty next time.
-        self.settings_manager.set("ramp_start_time", 0.0)
-        self.settings_manager.set("ramp_latched_start_temp", 0.0)
-        self.settings_manager.set("ramp_is_finished", False)
-
-    def beer_hold_logic(self, beer_temp, amb_temp):
-        """Controls Beer Temp to the Beer Hold Setpoint (PID-Assisted)."""
-        target_beer_temp = self.settings_manager.get("beer_hold_f", 55.0)
-        self.pid.set_setpoint(target_beer_temp)
-        dt = time.time() - self.last_pid_update_time
-        self.last_pid_update_time = time.time()
-        
-        IDLE_ZONE = self.settings_manager.get("pid_idle_zone", 0.5) # <-- MODIFIED
-        if abs(beer_temp - target_beer_temp) <= IDLE_ZONE:
-            self.pid._integral = 0
-
-        pid_output = self.pid.update(beer_temp, dt)
-        
-        ambient_setpoint = target_beer_temp + pid_output
-        
-        ENVELOPE_WIDTH = self.settings_manager.get("beer_pid_envelope_width", 1.0) # <-- MODIFIED
-        amb_min = ambient_setpoint - ENVELOPE_WIDTH
-        amb_max = ambient_setpoint + ENVELOPE_WIDTH
-        
-        amb_min = max(-10.0, min(100.0, amb_min))
-        amb_max = max(-10.0, min(100.0, amb_max))
-        
-        # --- MODIFICATION: Call logging function ---
-        self._log_pid_data(target_beer_temp, beer_temp, pid_output, amb_min, amb_max)
-        # --- END MODIFICATION ---
-
-        return amb_min, amb_max
-        
-    def ramp_up_logic(self, beer_temp, amb_temp):
+        with self.settings_manager.batch():
+            self.settings_manager.set("ramp_start_time", 0.0)
+            self.settings_manager.set("ramp_latched_start_temp", 0.0)
+            self.settings_manager.set("ramp_is_finished", False)
+
+    # --- PROFILE STATE ---
+    def reset_profile_state(self):
+        """Drops the profile run AND its persisted record (the Profile mode starts over)."""
+        with self._kernel_lock:
+            if self.kernel_state.profile is None and not self.settings_manager.get("profile_run"):
+                return
+            self.kernel_state = reset_profile(self.kernel_state)
+        print("Profile run reset.")
+        self.settings_manager.set("profile_run", None)
+
+    # --- AUTOTUNE ---
+    def apply_autotune_gains(self):
+        """Copies the gains proposed by the last Autotune run into the PID settings. Returns True if applied."""
+        result = self.settings_manager.get("autotune_result")
+        if not result:
+            return False
+        with self.settings_manager.batch():
+            self.settings_manager.set("pid_kp", round(result["kp"], 4))
+            self.settings_manager.set("pid_ki", round(result["ki"], 6))
+            self.settings_manager.set("pid_kd", round(result["kd"], 2))
+        self._log_ui_message(f"Autotune gains applied: Kp={result['kp']:.3f}, Ki={result['ki']:.5f}, Kd={result['kd']:.1f}.")
+        return True
+
+    # --- CONTROL PASS (I/O around the pure control kernel) ---
+    def _control_pass(self, params, mono_time, drives_relays):
         """
-        Controls beer temp in three stages:
-        1. [Pre-Ramp]: Holds at start_temp until beer is stable (PID).
-        2. [Main Ramp]: Uses PID to force beer to follow the moving target.
-        3. [PID Landing]: Switches back to static PID to "soft land" at the end_temp.
+        Reads the probes, runs one control_step() and carries out its effects
+        (UI/console messages, PID log row, ramp persistence, live timestamps).
+        Only a relay-driving pass (the monitor loop) commits the PID and ramp state.
+        Returns (outputs, beer_temp, amb_temp).
         """
-        # Read current settings
-        # Note: We use these for Pre-Ramp, but we will LATCH start_temp for the Main Ramp.
-        live_start_temp = self.settings_manager.get("beer_hold_f", 55.0)
-        end_temp = self.settings_manager.get("ramp_up_hold_f", 68.0)
-        duration_hours = self.settings_manager.get("ramp_up_duration_hours", 30.0)
-        
-        # --- NEW: Define the tolerance zones ---
-        PRE_RAMP_TOLERANCE = self.settings_manager.get("ramp_pre_ramp_tolerance", 0.2) 
-        END_RAMP_PID_ZONE = self.settings_manager.get("ramp_pid_landing_zone", 0.5) 
-        # --- END NEW ---
-
-        # --- Ramp Increment Logic ---
-        current_time = time.time()
-        
-        # Determine which Start Temp to use (Live vs Latched)
-        if self.ramp_state["is_in_pre_ramp"]:
-            calc_start_temp = live_start_temp
-        else:
-            # FIX: Use the latched start temp if available, otherwise fallback to live
-            calc_start_temp = self.ramp_state.get("latched_start_temp", live_start_temp)
-
-        # Check if ramp is finished
-        if self.ramp_state["is_finished"]:
-             self.ramp_state["current_target"] = end_temp
-        
-        # Check if ramp is in progress and duration is valid
-        elif duration_hours > 0:
-            time_elapsed_seconds = current_time - self.ramp_state["start_time"]
-            total_duration_seconds = duration_hours * 3600
-            
-            if time_elapsed_seconds >= total_duration_seconds:
-                # Ramp is finished
-                self.ramp_state["current_target"] = end_temp
-                
-                # --- PERSISTENCE: Save Finished State (Once) ---
-                if not self.ramp_state["is_finished"]:
-                    self.ramp_state["is_finished"] = True
-                    self.settings_manager.set("ramp_is_finished", True)
-                # -----------------------------------------------
-
-            else:
-                # Ramp is in progress, calculate new target using LATCHED start temp
-                total_rise = end_temp - calc_start_temp
-                fraction_complete = time_elapsed_seconds / total_duration_seconds
-                increment = total_rise * fraction_complete
-                self.ramp_state["current_target"] = calc_start_temp + increment
-        
-        else: # duration_hours is 0 or less, just hold at end_temp
-             self.ramp_state["current_target"] = end_temp
-             
-             # --- PERSISTENCE: Save Finished State (Once) ---
-             if not self.ramp_state["is_finished"]:
-                 self.ramp_state["is_finished"] = True
-                 self.settings_manager.set("ramp_is_finished", True)
-             # -----------------------------------------------
-             
-        # Get the continuously updating moving target
-        target_beer_temp = self.ramp_state["current_target"]
-        
-        # --- STATE 1: Pre-Ramp (Waiting to hit start temp) ---
-        if self.ramp_state["is_in_pre_ramp"]:
-            
-            # Log the pre-condition message (once)
-            if not self.ramp_state["ramp_logging_done"]:
-                if self.notification_manager and self.notification_manager.ui:
-                    self.notification_manager.ui.log_system_message("Ramp pre-condition: bringing beer to setpoint before starting ramp.")
-                self.ramp_state["ramp_logging_done"] = True 
-
-            # Calculate PID for a simple hold at the start_temp
-            if self.pid.setpoint != live_start_temp:
-                self.pid.set_setpoint(live_start_temp) 
-            
-            dt = current_time - self.last_pid_update_time
-            self.last_pid_update_time = current_time
-            IDLE_ZONE = self.settings_manager.get("pid_idle_zone", 0.5) 
-            if abs(beer_temp - live_start_temp) <= IDLE_ZONE: self.pid._integral = 0
-            pid_output = self.pid.update(beer_temp, dt)
-            
-            ambient_setpoint = live_start_temp + pid_output
-            ENVELOPE_WIDTH = self.settings_manager.get("beer_pid_envelope_width", 1.0) 
-            amb_min = ambient_setpoint - ENVELOPE_WIDTH
-            amb_max = ambient_setpoint + ENVELOPE_WIDTH
-            
-            amb_min = max(-10.0, min(100.0, amb_min))
-            amb_max = max(-10.0, min(100.0, amb_max))
-            
-            ramp_target_message = "Ramp pre-condition"
-            
-            # Check for transition to Ramping state
-            if abs(beer_temp - live_start_temp) <= PRE_RAMP_TOLERANCE:
-                print(f"[TempController] Ramp pre-condition met. Starting ramp from {live_start_temp}F.")
-                self.ramp_state["is_in_pre_ramp"] = False
-                self.ramp_state["ramp_logging_done"] = False 
-                
-                # FIX: Latch the start parameters NOW
-                self.ramp_state["current_target"] = live_start_temp
-                self.ramp_state["latched_start_temp"] = live_start_temp 
-                
-                self.ramp_state["last_step_time"] = current_time
-                self.ramp_state["start_time"] = current_time
-                self.ramp_state["is_finished"] = False
-                
-                # --- PERSISTENCE: Save Start State to Disk ---
-                self.settings_manager.set("ramp_start_time", current_time)
-                self.settings_manager.set("ramp_latched_start_temp", live_start_temp)
-                self.settings_manager.set("ramp_is_finished", False)
-                # ---------------------------------------------
-            
-            return amb_min, amb_max, ramp_target_message
-
-        # --- Calculate the continuous message ---
-        ramp_target_message = ""
-        if self.ramp_state["is_finished"]:
-            ramp_target_message = "Ramp Finished"
-        else:
-            try:
-                units = self.settings_manager.get("temp_units", "F")
-                ramp_duration_s = duration_hours * 3600
-                end_timestamp = self.ramp_state["start_time"] + ramp_duration_s
-                end_dt = datetime.fromtimestamp(end_timestamp)
-                end_time_str = end_dt.strftime("%m-%d %H:%M:%S")
-                
-                end_temp_f = end_temp
-                display_end_target = end_temp_f if units == "F" else ((end_temp_f - 32) * 5/9)
-                display_end_target_str = f"{display_end_target:.1f}"
-                
-                ramp_target_message = f"Target {display_end_target_str} {units} at {end_time_str}"
-            except Exception:
-                ramp_target_message = "Ramping..."
-                
-        # --- STATE 3: PID Landing ---
-        if not self.ramp_state["is_finished"] and (end_temp - target_beer_temp) < END_RAMP_PID_ZONE:
-            
-            if not self.ramp_state["ramp_logging_done"]:
-                if self.notification_manager and self.notification_manager.ui:
-                    self.notification_manager.ui.log_system_message("Ramp-Up: Entering final PID landing zone.")
-                self.ramp_state["ramp_logging_done"] = True 
-
-            if self.pid.setpoint != end_temp:
-                self.pid.set_setpoint(end_temp) 
-
-            dt = current_time - self.last_pid_update_time
-            if dt == 0: dt = 1.0 
-            self.last_pid_update_time = current_time
-            
-            IDLE_ZONE = self.settings_manager.get("pid_idle_zone", 0.5) 
-            if abs(beer_temp - end_temp) <= IDLE_ZONE:
-                self.pid._integral = 0
-            
-            pid_output = self.pid.update(beer_temp, dt)
-            ambient_setpoint = end_temp + pid_output
-            
-            ENVELOPE_WIDTH = self.settings_manager.get("beer_pid_envelope_width", 1.0) 
-            amb_min = ambient_setpoint - ENVELOPE_WIDTH
-            amb_max = ambient_setpoint + ENVELOPE_WIDTH
-
-            amb_min = max(-10.0, min(100.0, amb_min))
-            amb_max = max(-10.0, min(100.0, amb_max))
-            
-            self._log_pid_data(end_temp, beer_temp, pid_output, amb_min, amb_max)
-            ramp_target_message = "Ramp Landing..."
-            return amb_min, amb_max, ramp_target_message
-            
-        # --- STATE 2: Main Ramp (PID Driven) ---
-        if not self.ramp_state["ramp_logging_done"]:
-            try:
-                if self.notification_manager and self.notification_manager.ui:
-                    units = self.settings_manager.get("temp_units", "F")
-                    
-                    # FIX: Calculate rate using LATCHED start temp
-                    calc_start_temp = self.ramp_state.get("latched_start_temp", live_start_temp)
-                    total_rise_f = end_temp - calc_start_temp
-                    
-                    if duration_hours > 0:
-                        total_rise_display = total_rise_f if units == "F" else (total_rise_f * 5/9)
-                        rate_per_hour = total_rise_display / duration_hours
-                        message_2 = f"Ramp started: {rate_per_hour:.2f} {units} degree change every hour."
-                        self.notification_manager.ui.log_system_message(message_2)
-                    
-            except Exception as e:
-                print(f"[ERROR] Failed to log ramp-up start messages: {e}")
-            
-            self.ramp_state["ramp_logging_done"] = True 
-
-        # PID Control for Moving Target
-        self.pid.setpoint = target_beer_temp
-        
-        dt = current_time - self.last_pid_update_time
-        if dt == 0: dt = 1.0
-        self.last_pid_update_time = current_time
-
-        IDLE_ZONE = self.settings_manager.get("pid_idle_zone", 0.5)
-        if abs(beer_temp - target_beer_temp) <= IDLE_ZONE:
-            self.pid._integral = 0
-            
-        pid_output = self.pid.update(beer_temp, dt)
-        
-        ambient_setpoint = target_beer_temp + pid_output
-        ENVELOPE_WIDTH = self.settings_manager.get("beer_pid_envelope_width", 1.0)
-        amb_min = ambient_setpoint - ENVELOPE_WIDTH
-        amb_max = ambient_setpoint + ENVELOPE_WIDTH
-        
-        amb_min = max(-10.0, min(100.0, amb_min))
-        amb_max = max(-10.0, min(100.0, amb_max))
-        
-        self._log_pid_data(target_beer_temp, beer_temp, pid_output, amb_min, amb_max)
-
-        return amb_min, amb_max, ramp_target_message
-        
-    def fast_crash_logic(self, beer_temp, amb_temp):
-        """Controls Beer Temp aggressively to the Fast Crash Hold Setpoint (Aggressive PID)."""
-        target_crash_temp = self.settings_manager.get("fast_crash_hold_f", 34.0)
-        
-        self.pid.set_setpoint(target_crash_temp)
-        
-        dt = time.time() - self.last_pid_update_time
-        self.last_pid_update_time = time.time()
-        
-        IDLE_ZONE = self.settings_manager.get("pid_idle_zone", 0.5) # <-- MODIFIED
-        if abs(beer_temp - target_crash_temp) <= IDLE_ZONE:
-            self.pid._integral = 0
+        beer_temp, amb_temp = self.read_temperatures(params)
+        
+        with self._kernel_lock:
+            inputs = KernelInputs(beer_temp, amb_temp, self.clock.time(), mono_time,
+                                  self._monitoring, drives_relays)
+            outputs, self.kernel_state = control_step(inputs, params, self.kernel_state)
+        
+        for line in outputs.console:
+            print(line)
+        for message in outputs.messages:
+            self._log_ui_message(message)
+        if outputs.pid_log is not None:
+            self._log_pid_data(params, outputs.pid_log, amb_temp)
+        if outputs.persist:
+            # --- PERSISTENCE: ramp start/finish, profile run record (one transaction) ---
+            with self.settings_manager.batch():
+                for key, value in outputs.persist.items():
+                    self.settings_manager.set(key, value)
+        
+        # --- Update timestamps and sensor status ---
+        current_time_str = self.clock.now().strftime("%H:%M:%S")
+        if beer_temp is not None:
+             self.live_state.update(beer_temp_timestamp=current_time_str)
+        if amb_temp is not None:
+             self.live_state.update(amb_temp_timestamp=current_time_str)
+        self.live_state.update(sensor_error_message=outputs.sensor_error_message)
         
-        pid_output = self.pid.update(beer_temp, dt)
+        return outputs, beer_temp, amb_temp
 
-        ambient_setpoint = target_crash_temp + pid_output
-
-        ENVELOPE_WIDTH = self.settings_manager.get("crash_pid_envelope_width", 2.0) # <-- MODIFIED
-        amb_min = ambient_setpoint - ENVELOPE_WIDTH
-        amb_max = ambient_setpoint + ENVELOPE_WIDTH
-
-        amb_min = max(-10.0, min(100.0, amb_min))
-        amb_max = max(-10.0, min(100.0, amb_max))
-        
-        # --- MODIFICATION: Call logging function ---
-        self._log_pid_data(target_crash_temp, beer_temp, pid_output, amb_min, amb_max)
-        # --- END MODIFICATION ---
+    def _push_ui_data(self, outputs, beer_temp, amb_temp, heat_on, cool_on, **overrides):
+        """Pushes one pass's readings, setpoints and relay states to the UI."""
+        if not (self.notification_manager and self.notification_manager.ui):
+            return
+        data = dict(
+            beer_temp=beer_temp if beer_temp is not None else "--.-",
+            amb_temp=amb_temp if amb_temp is not None else "--.-",
+            amb_min=outputs.amb_min,
+            amb_max=outputs.amb_max,
+            beer_setpoint=outputs.beer_setpoint,
+            heat_state="HEATING" if heat_on else "Heating OFF",
+            cool_state="COOLING" if cool_on else "Cooling OFF",
+            amb_target=outputs.ambient_target,
+            current_mode=outputs.current_mode,
+            ramp_end_target=outputs.ramp_end_target,
+            ramp_start_time=outputs.ramp_start_time,
+            ramp_is_finished=outputs.ramp_is_finished,
+            ramp_target_message=outputs.ramp_target_message,
+            sensor_error_message=outputs.sensor_error_message,
+        )
+        data.update(overrides)
+        self.notification_manager.ui.push_data_update(**data)
 
-        return amb_min, amb_max
-        
     # --- MONITORING HELPER (FOR IMMEDIATE UI/Setpoint Update) ---
     def update_control_logic_and_ui_data(self):
-        """Forces a single pass of control logic calculation, saves settings, 
-        and PUSHES ALL DATA to the UI.
+        """Forces a single pass of control logic calculation and PUSHES ALL DATA to the UI.
         
-        This function is now stateful and includes latched logging.
-        It does NOT control relays.
+        This is a preview pass: it reports setpoints and sensor status but does NOT
+        control relays or advance the PID/ramp state (only the monitor loop does).
         """
         
-        # --- 1. READ SENSORS AND MANAGE LATCHED LOGGING ---
-        beer_temp = self.read_beer_temperature()
-        amb_temp = self.read_ambient_temperature()
-        
-        current_beer_ok = (beer_temp is not None)
-        current_amb_ok = (amb_temp is not None)
-        
-        # --- Latching Log Logic (with specific messages) ---
-        if self.notification_manager and self.notification_manager.ui:
-            # Beer Sensor State Change
-            if current_beer_ok and not self._beer_sensor_ok:
-                self.notification_manager.ui.log_system_message("Beer sensor re-connected.")
-            elif not current_beer_ok and self._beer_sensor_ok:
-                if self.settings_manager.get("ds18b20_beer_sensor") == "unassigned":
-                    self.notification_manager.ui.log_system_message("Beer sensor is unassigned. Please set in System Settings.")
-                else:
-                    self.notification_manager.ui.log_system_message("Beer sensor reading failed. Check connection.")
-            
-            # Ambient Sensor State Change
-            if current_amb_ok and not self._amb_sensor_ok:
-                self.notification_manager.ui.log_system_message("Ambient sensor re-connected.")
-            elif not current_amb_ok and self._amb_sensor_ok:
-                if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                    self.notification_manager.ui.log_system_message("Ambient sensor is unassigned. Please set in System Settings.")
-                else:
-                    self.notification_manager.ui.log_system_message("Ambient sensor reading failed. Check connection.")
-        
-        # Update the stored state
-        self._beer_sensor_ok = current_beer_ok
-        self._amb_sensor_ok = current_amb_ok
-        
-        # --- Update timestamps in settings ---
-        current_time_str = datetime.now().strftime("%H:%M:%S")
-        if current_beer_ok:
-             self.settings_manager.set("beer_temp_timestamp", current_time_str)
-        if current_amb_ok:
-             self.settings_manager.set("amb_temp_timestamp", current_time_str)
-        
-        # --- 2. VALIDATE SENSORS BASED ON CONTROL MODE (with specific messages) ---
-        current_mode = self.settings_manager.get("control_mode")
-        sensor_error_message = ""
-        
-        if current_mode == "Ambient Hold":
-            if not current_amb_ok:
-                if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                    sensor_error_message = "FAIL: Ambient Sensor Unassigned"
-                else:
-                    sensor_error_message = "FAIL: Ambient Sensor Missing"
-            # Note: A missing beer sensor is logged above, but is not a critical error here.
-        
-        elif current_mode in ["Beer Hold", "Ramp-Up", "Fast Crash"]:
-            if not current_beer_ok and not current_amb_ok:
-                sensor_error_message = "FAIL: Both Sensors Failed" # Generic, as this is a total failure
-            elif not current_beer_ok:
-                if self.settings_manager.get("ds18b20_beer_sensor") == "unassigned":
-                    sensor_error_message = "FAIL: Beer Sensor Unassigned"
-                else:
-                    sensor_error_message = "FAIL: Beer Sensor Missing"
-            elif not current_amb_ok:
-                if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                    sensor_error_message = "FAIL: Ambient Sensor Unassigned"
-                else:
-                    sensor_error_message = "FAIL: Ambient Sensor Missing"
-        
-        self.settings_manager.set("sensor_error_message", sensor_error_message)
-
-        # --- 3. CALCULATE SETPOINTS (Even if sensors failed) ---
-        # These are needed to populate the UI correctly
-        
-        amb_min, amb_max = 0.0, 0.0
-        ambient_target_setpoint = self.settings_manager.get("ambient_hold_f")
-        ramp_target_message = ""
-        ramp_end_target = 0.0
-        ramp_start_time = 0.0
-        ramp_is_finished = False
-
-        if current_mode == "Ramp-Up":
-            if self._monitoring: # Use live moving target
-                beer_setpoint_current = self.ramp_state["current_target"]
-            else: # Use starting temp
-                beer_setpoint_current = self.settings_manager.get("beer_hold_f")
-                
-            ramp_end_target = self.settings_manager.get("ramp_up_hold_f")
-            ramp_start_time = self.ramp_state["start_time"]
-            ramp_is_finished = self.ramp_state["is_finished"]
-            # Call ramp_up_logic just to get the correct message
-            if current_beer_ok and current_amb_ok:
-                 _, _, ramp_target_message = self.ramp_up_logic(beer_temp, amb_temp)
-            
-        elif current_mode == "Fast Crash":
-            beer_setpoint_current = self.settings_manager.get("fast_crash_hold_f")
-        else: # Beer Hold, Ambient Hold, or Off
-            beer_setpoint_current = self.settings_manager.get("beer_hold_f")
+        # Settings for this pass, compiled once per settings change
+        params = self.settings_manager.control_params()
+        outputs, beer_temp, amb_temp = self._control_pass(params, self.clock.monotonic(), drives_relays=False)
 
-        # --- 4. CHECK FOR FAIL-SAFE AMBIENT MODE ---
-        # This condition is (Beer Sensor Failed/Unassigned) AND (Ambient Sensor OK) AND (Mode is "Beer")
-        fail_safe_active = ("FAIL: Beer Sensor" in sensor_error_message) and current_amb_ok
-        
-        if fail_safe_active:
-            # We are in fail-safe. Calculate ambient envelope to hold beer setpoint
-            target_amb_temp = beer_setpoint_current
-            DEADBAND = 1.0 
-            amb_min = target_amb_temp - DEADBAND
-            amb_max = target_amb_temp + DEADBAND
-            
-            if not self._fail_safe_logged:
-                if self.notification_manager and self.notification_manager.ui:
-                    self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer sensor failed. Holding chamber at {target_amb_temp:.1f} F.")
-                self._fail_safe_logged = True
-        
-        elif not sensor_error_message:
-            # No errors. Calculate logic normally.
-            if self._fail_safe_logged:
-                if self.notification_manager and self.notification_manager.ui:
-                    self.notification_manager.ui.log_system_message("FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
-                self._fail_safe_logged = False
-            
-            if current_mode == "Ambient Hold": amb_min, amb_max = self.ambient_hold_logic(amb_temp)
-            elif current_mode == "Beer Hold": amb_min, amb_max = self.beer_hold_logic(beer_temp, amb_temp)
-            elif current_mode == "Ramp-Up": amb_min, amb_max, ramp_target_message = self.ramp_up_logic(beer_temp, amb_temp)
-            elif current_mode == "Fast Crash": amb_min, amb_max = self.fast_crash_logic(beer_temp, amb_temp)
-        
-        else:
-            # A different, critical error is active (e.g., Ambient sensor missing/unassigned)
-            if self._fail_safe_logged:
-                if self.notification_manager and self.notification_manager.ui:
-                    self.notification_manager.ui.log_system_message("FAIL-SAFE: Resuming normal shutdown (other sensor failed).")
-                self._fail_safe_logged = False
-            
-            # amb_min/max are already 0.0 (shutdown state)
-            pass 
-
-        # --- 5. UPDATE UI (No relay control) ---
+        # --- UPDATE UI (No relay control) ---
         self.relay_control.update_ui_data(
-            beer_temp if current_beer_ok else "--.-", 
-            amb_temp if current_amb_ok else "--.-", 
-            amb_min if amb_min is not None else 0.0, 
-            amb_max if amb_max is not None else 0.0,
-            current_mode, beer_setpoint_current,
-            ambient_target_setpoint 
+            beer_temp if beer_temp is not None else "--.-", 
+            amb_temp if amb_temp is not None else "--.-", 
+            outputs.amb_min, outputs.amb_max,
+            outputs.current_mode, outputs.beer_setpoint,
+            outputs.ambient_target 
         )
         
-        if self.notification_manager and self.notification_manager.ui:
-            # FIX: Read the LIVE hardware state directly from the Relay Controller's cache
-            # This prevents "stale" settings text from causing a flash.
-            real_heat = self.relay_control.relay_state_cache.get("Heat", False)
-            real_cool = self.relay_control.relay_state_cache.get("Cool", False)
-
-            self.notification_manager.ui.push_data_update( 
-                beer_temp=beer_temp if current_beer_ok else "--.-",
-                amb_temp=amb_temp if current_amb_ok else "--.-",
-                amb_min=amb_min if amb_min is not None else 0.0, 
-                amb_max=amb_max if amb_max is not None else 0.0,
-                beer_setpoint=beer_setpoint_current,
-                
-                # DIRECT SIGNAL MAPPING
-                heat_state="HEATING" if real_heat else "Heating OFF",
-                cool_state="COOLING" if real_cool else "Cooling OFF",
-                
-                amb_target=ambient_target_setpoint,
-                current_mode=current_mode,
-                ramp_end_target=ramp_end_target,
-                ramp_start_time=ramp_start_time,
-                ramp_is_finished=ramp_is_finished,
-                ramp_target_message=ramp_target_message,
-                sensor_error_message=sensor_error_message
-            )
+        # FIX: Read the LIVE hardware state directly from the Relay Controller's cache
+        # This prevents "stale" settings text from causing a flash.
+        self._push_ui_data(outputs, beer_temp, amb_temp,
+                           self.relay_control.relay_state_cache.get("Heat", False),
+                           self.relay_control.relay_state_cache.get("Cool", False))
         
     # --- MONITORING THREAD ---
     def start_monitoring(self):
@@ -811,246 +386,82 @@ class TemperatureController:
             # Just set the flag. The loop will see this and enter shutdown mode.
             self._monitoring = False
             self.settings_manager.set("monitoring_state", "OFF")
+            self.tick_scheduler.wake() # Don't wait out a widened interval
             
             if self.notification_manager and self.notification_manager.ui:
                 self.notification_manager.ui.monitoring_var.set("OFF") 
 
+    def shutdown_sensors(self):
+        """
+        Stops bus discovery and releases the acquisition worker and backend (app exit).
+        Both run for the app's lifetime: standby previews, the chambers and the settings
+        Scan keep reading the bus while monitoring is OFF.
+        """
+        self.sensor_discovery.stop()
+        self.sensor_acquisition.shutdown()
+
     def _monitor_loop(self):
+        # PID dt starts at the first tick, not at whenever the PID last ran; an autotune run starts over
+        with self._kernel_lock:
+            self.kernel_state = self.kernel_state._replace(pid_last_time=None, autotune=None)
+        self.compressor_planner.reset()
+        
+        # Ticks on absolute monotonic deadlines (work time does not stretch the period);
+        # the period itself is chosen after each tick by the adaptive loop rate
+        self.loop_rate.reset()
+        self.tick_scheduler.reset()
+        self.tick_scheduler.set_period(self.loop_rate.period_s)
         while True:
-            # --- 1. READ SENSORS AND MANAGE LATCHED LOGGING ---
-            beer_temp = self.read_beer_temperature()
-            amb_temp = self.read_ambient_temperature()
-            
-            current_beer_ok = (beer_temp is not None)
-            current_amb_ok = (amb_temp is not None)
-            
-            # --- Latching Log Logic (with specific messages) ---
-            if self.notification_manager and self.notification_manager.ui:
-                # Beer Sensor State Change
-                if current_beer_ok and not self._beer_sensor_ok:
-                    self.notification_manager.ui.log_system_message("Beer sensor re-connected.")
-                elif not current_beer_ok and self._beer_sensor_ok:
-                    if self.settings_manager.get("ds18b20_beer_sensor") == "unassigned":
-                        self.notification_manager.ui.log_system_message("Beer sensor is unassigned. Please set in System Settings.")
-                    else:
-                        self.notification_manager.ui.log_system_message("Beer sensor reading failed. Check connection.")
-
-                # Ambient Sensor State Change
-                if current_amb_ok and not self._amb_sensor_ok:
-                    self.notification_manager.ui.log_system_message("Ambient sensor re-connected.")
-                elif not current_amb_ok and self._amb_sensor_ok:
-                    if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                        self.notification_manager.ui.log_system_message("Ambient sensor is unassigned. Please set in System Settings.")
-                    else:
-                        self.notification_manager.ui.log_system_message("Ambient sensor reading failed. Check connection.")
-            
-            # Update the stored state
-            self._beer_sensor_ok = current_beer_ok
-            self._amb_sensor_ok = current_amb_ok
-            
-            # --- Update timestamps in settings ---
-            current_time_str = datetime.now().strftime("%H:%M:%S")
-            if current_beer_ok:
-                 self.settings_manager.set("beer_temp_timestamp", current_time_str)
-            if current_amb_ok:
-                 self.settings_manager.set("amb_temp_timestamp", current_time_str)
-            
-            # --- 2. VALIDATE SENSORS BASED ON CONTROL MODE (with specific messages) ---
-            current_mode = self.settings_manager.get("control_mode")
-            sensor_error_message = ""
-            
-            if current_mode == "Ambient Hold":
-                if not current_amb_ok:
-                    if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                        sensor_error_message = "FAIL: Ambient Sensor Unassigned"
-                    else:
-                        sensor_error_message = "FAIL: Ambient Sensor Missing"
-            
-            elif current_mode in ["Beer Hold", "Ramp-Up", "Fast Crash"]:
-                if not current_beer_ok and not current_amb_ok:
-                    sensor_error_message = "FAIL: Both Sensors Failed" # Generic, as this is a total failure
-                elif not current_beer_ok:
-                    if self.settings_manager.get("ds18b20_beer_sensor") == "unassigned":
-                        sensor_error_message = "FAIL: Beer Sensor Unassigned"
-                    else:
-                        sensor_error_message = "FAIL: Beer Sensor Missing"
-                elif not current_amb_ok:
-                    if self.settings_manager.get("ds18b20_ambient_sensor") == "unassigned":
-                        sensor_error_message = "FAIL: Ambient Sensor Unassigned"
-                    else:
-                        sensor_error_message = "FAIL: Ambient Sensor Missing"
-            
-            self.settings_manager.set("sensor_error_message", sensor_error_message)
-
-            # --- 3. DETERMINE LOGIC & SETPOINTS ---
-            desired_heat = False
-            desired_cool = False
-            amb_min, amb_max = 0.0, 0.0
-            ambient_target_setpoint = self.settings_manager.get("ambient_hold_f")
-            ramp_target_message = ""
-            ramp_end_target = 0.0
-            ramp_start_time = 0.0
-            ramp_is_finished = False
-
-            # --- Calculate Beer Setpoint (always needed for UI) ---
-            if current_mode == "Ramp-Up":
-                if self.ramp_state["is_in_pre_ramp"]:
-                    beer_setpoint_current = self.settings_manager.get("beer_hold_f")
-                else:
-                    beer_setpoint_current = self.ramp_state["current_target"]
-                    
-                ramp_end_target = self.settings_manager.get("ramp_up_hold_f")
-                ramp_start_time = self.ramp_state["start_time"]
-                ramp_is_finished = self.ramp_state["is_finished"]
-            elif current_mode == "Fast Crash":
-                beer_setpoint_current = self.settings_manager.get("fast_crash_hold_f")
-            else: # Beer Hold, Ambient Hold, or Off
-                beer_setpoint_current = self.settings_manager.get("beer_hold_f")
-
-            # --- 4. CHECK FOR FAIL-SAFE OR ERROR CONDITIONS ---
-            
-            # Condition 1: "Limp-Home" Mode (Beer Sensor Failed/Unassigned, Ambient OK)
-            fail_safe_active = ("FAIL: Beer Sensor" in sensor_error_message) and current_amb_ok
-            
-            if fail_safe_active:
-                if not self._fail_safe_logged:
-                    if self.notification_manager and self.notification_manager.ui:
-                        self.notification_manager.ui.log_system_message(f"FAIL-SAFE: Beer sensor failed. Holding chamber at {beer_setpoint_current:.1f} F.")
-                    self._fail_safe_logged = True
-                
-                # Override: Use simple thermostatic control on AMBIENT
-                target_amb_temp = beer_setpoint_current
-                DEADBAND = self.settings_manager.get("ambient_deadband", 1.0) 
-                amb_min = target_amb_temp - DEADBAND
-                amb_max = target_amb_temp + DEADBAND
-                
-                desired_heat = amb_temp < amb_min
-                desired_cool = amb_temp > amb_max
-
-            # Condition 2: Other Critical Sensor Error (Shutdown)
-            elif sensor_error_message:
-                if self._fail_safe_logged:
-                    if self.notification_manager and self.notification_manager.ui:
-                        self.notification_manager.ui.log_system_message("FAIL-SAFE: Resuming normal shutdown (other sensor failed).")
-                    self._fail_safe_logged = False
-                
-                desired_heat = False
-                desired_cool = False
-            
-            # Condition 3: No Errors (Normal Operation)
-            else:
-                if self._fail_safe_logged:
-                    if self.notification_manager and self.notification_manager.ui:
-                        self.notification_manager.ui.log_system_message("FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
-                    self._fail_safe_logged = False
-                
-                # --- RUN NORMAL LOGIC FUNCTION ---
-                if current_mode == "Ambient Hold": amb_min, amb_max = self.ambient_hold_logic(amb_temp)
-                elif current_mode == "Beer Hold": amb_min, amb_max = self.beer_hold_logic(beer_temp, amb_temp)
-                elif current_mode == "Ramp-Up": amb_min, amb_max, ramp_target_message = self.ramp_up_logic(beer_temp, amb_temp)
-                elif current_mode == "Fast Crash": amb_min, amb_max = self.fast_crash_logic(beer_temp, amb_temp)
-
-                # --- DETERMINE RELAY ACTIONS ---
-                if current_mode == "Ramp-Up" and amb_min is None:
-                    # STATE 2: We are in the Main Ramp (Thermostatic) phase
-                    THERMOSTAT_DEADBAND = self.settings_manager.get("ramp_thermo_deadband", 0.1) 
-                    target = beer_setpoint_current # The moving target
-                    
-                    if beer_temp < (target - THERMOSTAT_DEADBAND):
-                        desired_heat = True
-                        desired_cool = False
-                    elif beer_temp > (target + THERMOSTAT_DEADBAND):
-                        desired_heat = False
-                        desired_cool = True
-                
-                else:
-                    # All other modes (PID-driven ambient envelope)
-                    desired_heat = amb_temp < amb_min
-                    desired_cool = amb_temp > amb_max
-            
-            # --- 5. CHECK MONITORING STATE (THE SHUTDOWN OVERRIDE) ---
-            if not self._monitoring:
-                print("[Monitor Loop] Shutdown requested. Sending OFF commands.")
-                desired_heat = False
-                desired_cool = False
-                current_mode = "OFF" # Set mode to off for relay_control (This triggers Aux OFF too)
-                sensor_error_message = "" 
-                if self._fail_safe_logged:
-                    if self.notification_manager and self.notification_manager.ui:
-                        self.notification_manager.ui.log_system_message("FAIL-SAFE: Monitoring stopped. Resuming normal shutdown.")
-                    self._fail_safe_logged = False
-            
-            # --- 6. APPLY STATES (This section runs in ALL modes) ---
-            # The relay_control now handles the Aux relay automatically here
+            tick = self.tick_scheduler.next_tick(self._stop_event)
+            if tick is None:
+                break
+            if tick.skipped:
+                print(f"[Monitor Loop] Tick overran; skipped {tick.skipped} tick(s).")
+            
+            # Settings for this tick, compiled once per settings change
+            params = self.settings_manager.control_params()
+            
+            # --- 1. READ SENSORS, RUN THE CONTROL KERNEL ---
+            outputs, beer_temp, amb_temp = self._control_pass(params, tick.start, drives_relays=True)
+            
+            # --- 2. APPLY STATES (The relay_control handles the Aux relay too) ---
+            # With predictive cooling the compressor follows the planner instead of the envelope
+            desired_cool = outputs.desired_cool
+            planner_message = self.compressor_planner.unavailable_message(params)
+            if planner_message:
+                self._log_ui_message(planner_message)
+            if self._monitoring and self.compressor_planner.applies(outputs, params):
+                desired_cool = self.compressor_planner.decide(outputs, params, beer_temp, amb_temp,
+                                                              self.relay_control.cooling_window(params), tick.start)
             final_heat, final_cool = self.relay_control.set_desired_states(
-                desired_heat, desired_cool, current_mode
+                outputs.desired_heat, desired_cool, outputs.current_mode, params=params
             )
 
             self.relay_control.update_ui_data(
-                beer_temp if current_beer_ok else "--.-",
-                amb_temp if current_amb_ok else "--.-",
-                amb_min if amb_min is not None else 0.0, 
-                amb_max if amb_max is not None else 0.0, 
-                current_mode, beer_setpoint_current,
-                ambient_target_setpoint
+                beer_temp if beer_temp is not None else "--.-",
+                amb_temp if amb_temp is not None else "--.-",
+                outputs.amb_min, outputs.amb_max,
+                outputs.current_mode, outputs.beer_setpoint,
+                outputs.ambient_target
             )
             
-            # --- 7. PUSH DATA TO UI (ALWAYS) ---
-            if self.notification_manager and self.notification_manager.ui:
-                 self.notification_manager.ui.push_data_update(
-                    beer_temp=beer_temp if current_beer_ok else "--.-",
-                    amb_temp=amb_temp if current_amb_ok else "--.-",
-                    amb_min=amb_min if amb_min is not None else 0.0, 
-                    amb_max=amb_max if amb_max is not None else 0.0,
-                    beer_setpoint=beer_setpoint_current,
-                    
-                    # DIRECT SIGNAL: Use the exact variables (final_heat/final_cool) 
-                    # that were calculated in this loop to drive the hardware.
-                    heat_state="HEATING" if final_heat else "Heating OFF",
-                    cool_state="COOLING" if final_cool else "Cooling OFF",
-                    
-                    amb_target=ambient_target_setpoint,
-                    current_mode=current_mode,
-                    ramp_end_target=ramp_end_target,
-                    ramp_start_time=ramp_start_time,
-                    ramp_is_finished=ramp_is_finished,
-                    ramp_target_message=ramp_target_message,
-                    sensor_error_message=sensor_error_message
-                 )
+            # --- 3. PUSH DATA TO UI (ALWAYS) ---
+            # DIRECT SIGNAL: the exact states that were just driven to the hardware
+            self._push_ui_data(outputs, beer_temp, amb_temp, final_heat, final_cool)
 
-            # --- 8. CHECK FOR SAFE EXIT ---
+            # --- 4. CHECK FOR SAFE EXIT ---
             if not self._monitoring:
                 if not final_cool and not final_heat:
                     print("[Monitor Loop] Relays are safely OFF. Shutting down fan.")
-                    # --- MODIFICATION: Explicit call removed; Aux handled by set_desired_states("OFF") above ---
-                    # self.relay_control.turn_off_fan()
-                    
-                    # Ensure final OFF state is sent to UI
-                    if self.notification_manager and self.notification_manager.ui:
-                         self.notification_manager.ui.push_data_update(
-                            beer_temp=beer_temp if current_beer_ok else "--.-",
-                            amb_temp=amb_temp if current_amb_ok else "--.-",
-                            amb_min=amb_min if amb_min is not None else 0.0,
-                            amb_max=amb_max if amb_max is not None else 0.0,
-                            beer_setpoint=beer_setpoint_current,
-                            heat_state="Heating OFF",
-                            cool_state="Cooling OFF",
-                            amb_target=ambient_target_setpoint,
-                            current_mode="OFF",
-                            ramp_end_target=ramp_end_target,
-                            ramp_start_time=ramp_start_time,
-                            ramp_is_finished=ramp_is_finished,
-                            ramp_target_message="",
-                            sensor_error_message=""
-                         )
-                    
+                    # Ensure final OFF state is sent to UI (Aux handled by set_desired_states("OFF") above)
+                    self._push_ui_data(outputs, beer_temp, amb_temp, False, False,
+                                       current_mode="OFF", ramp_target_message="", sensor_error_message="")
                     break # Exit the "while True" loop
                 else:
                     print("[Monitor Loop] Shutdown pending, waiting for compressor dwell time to expire...")
 
-            # The loop wait
-            self._stop_event.wait(5)
-            if self._stop_event.is_set():
-                break
+            # --- 5. NEXT INTERVAL (the wait is tick_scheduler.next_tick() at the top of the loop) ---
+            self.tick_scheduler.set_period(self.loop_rate.next_period(
+                outputs, beer_temp, amb_temp, final_heat or final_cool, tick.start, params))
                 
         print("TemperatureController: Monitoring thread stopped.")
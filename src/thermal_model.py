@@ -0,0 +1,255 @@
+"""
+fermvault app
+thermal_model.py
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+from collections import namedtuple
+from itertools import islice
+
+# --- OPTIONAL IMPORT: NumPy (only identification needs it; loading a model does not) ---
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- FOPDT IDENTIFICATION ---
+# First-order-plus-dead-time model of the beer, driven by the chamber air:
+#   tau * dBeer/dt = gain * ambient(t - dead_time) + bias - Beer
+# 'ambient' is the logged ambient probe reading (AmbientTemp). Rows without one (logs
+# written before that column existed, or a failed probe) use the middle of the ambient
+# envelope, which the air tracks through the thermostat; that lag then shows up as
+# dead time. 'bias' collects the room leak and fermentation heat. The log is resampled
+# onto a fixed step and fitted as
+#   beer[k+1] = a * beer[k] + b * ambient[k-d] + c
+# by least squares, for every dead time d up to IDENT_MAX_DEAD_TIME_S; the d with the
+# smallest residual wins. The CSV is streamed in chunks and only the normal equations
+# (3x3 per candidate d) are kept, so memory does not grow with the log.
+IDENT_STEP_S = 60
+IDENT_MAX_DEAD_TIME_S = 3600
+IDENT_CHUNK_ROWS = 50000
+IDENT_MIN_SAMPLES = 120
+# Modes whose MeasuredTemp is the beer probe (Ambient Hold logs the ambient probe)
+IDENT_MODES = ("Beer Hold", "Ramp-Up", "Fast Crash", "Autotune", "Profile")
+
+MODEL_FILE = "thermal_model.json"
+
+# tau_s / dead_time_s: seconds; gain: F beer per F ambient; bias_f: F; rmse_f: one-step fit error
+# samples: resampled steps used; log_start / log_end: first and last timestamps fitted
+ThermalModel = namedtuple("ThermalModel", "tau_s gain dead_time_s bias_f rmse_f samples step_s log_start log_end")
+
+
+def model_path(data_dir, chamber_id=None):
+    """Model file of the main vault, or of an additional chamber."""
+    return os.path.join(data_dir, MODEL_FILE if chamber_id is None else f"thermal_model_{chamber_id}.json")
+
+
+def save_model(model, path):
+    """Writes a model file (temp file + rename). Returns True on success."""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(model._asdict(), f, indent=4)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to save thermal model to {path}: {e}")
+        return False
+
+
+def load_model(path):
+    """Returns the ThermalModel in 'path', or None if there is none (or it is unreadable)."""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return ThermalModel(**{field: data[field] for field in ThermalModel._fields})
+    except Exception as e:
+        print(f"[ThermalModel] Ignoring unreadable model file {path}: {e}")
+        return None
+
+
+class _FopdtAccumulator:
+    """Resamples streamed (time, beer, ambient) chunks and accumulates the normal equations per dead time."""
+
+    def __init__(self, step_s, max_lag):
+        self.step_s = step_s
+        self.max_lag = max_lag
+        lags = max_lag + 1
+        self.xtx = np.zeros((lags, 3, 3))
+        self.xty = np.zeros((lags, 3))
+        self.yty = np.zeros(lags)
+        self.count = np.zeros(lags, dtype=np.int64)
+        # Rows of the last (possibly incomplete) step, carried into the next chunk
+        self._carry = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        # Last max_lag + 1 resampled steps: history for the next chunk's lags
+        self._tail = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+    def add(self, times, beer, ambient, final=False):
+        times = np.concatenate((self._carry[0], times))
+        beer = np.concatenate((self._carry[1], beer))
+        ambient = np.concatenate((self._carry[2], ambient))
+        if times.size == 0:
+            return
+        steps = times // self.step_s
+        if final:
+            done = np.ones(steps.size, dtype=bool)
+        else:
+            done = steps != steps[-1]
+            self._carry = (times[~done], beer[~done], ambient[~done])
+        if not done.any():
+            return
+
+        # --- RESAMPLE: mean per step ---
+        index, inverse = np.unique(steps[done], return_inverse=True)
+        counts = np.bincount(inverse)
+        y = np.bincount(inverse, beer[done]) / counts
+        u = np.bincount(inverse, ambient[done]) / counts
+
+        history = self._tail[0].size
+        index = np.concatenate((self._tail[0], index))
+        y = np.concatenate((self._tail[1], y))
+        u = np.concatenate((self._tail[2], u))
+        keep = self.max_lag + 1
+        self._tail = (index[-keep:], y[-keep:], u[-keep:])
+
+        # --- NORMAL EQUATIONS: beer[k+1] ~ a*beer[k] + b*ambient[k-d] + c ---
+        # Only pairs whose target is new in this chunk; all steps k-d..k+1 must be consecutive
+        for lag in range(self.max_lag + 1):
+            k = np.arange(max(lag, history - 1, 0), index.size - 1)
+            if k.size == 0:
+                continue
+            valid = index[k + 1] - index[k - lag] == lag + 1
+            k = k[valid]
+            if k.size == 0:
+                continue
+            x = np.column_stack((y[k], u[k - lag], np.ones(k.size)))
+            target = y[k + 1]
+            self.xtx[lag] += x.T @ x
+            self.xty[lag] += x.T @ target
+            self.yty[lag] += target @ target
+            self.count[lag] += k.size
+
+    def solve(self):
+        """Returns (a, b, c, lag, rmse, samples) of the best-fitting dead time, or None."""
+        best = None
+        for lag in range(self.max_lag + 1):
+            if self.count[lag] < IDENT_MIN_SAMPLES or np.linalg.cond(self.xtx[lag]) > 1e12:
+                continue
+            theta = np.linalg.solve(self.xtx[lag], self.xty[lag])
+            sse = self.yty[lag] - 2 * theta @ self.xty[lag] + theta @ self.xtx[lag] @ theta
+            mse = max(sse, 0.0) / self.count[lag]
+            if best is None or mse < best[4]:
+                best = (*theta, lag, mse, int(self.count[lag]))
+        if best is None:
+            return None
+        a, b, c, lag, mse, samples = best
+        return a, b, c, lag, float(np.sqrt(mse)), samples
+
+
+def _chunk_arrays(rows, columns):
+    """Parses one chunk of CSV rows into (times, beer, ambient) arrays, skipping malformed rows."""
+    ts, mode, temp, amb_min, amb_max, amb = columns
+    try:
+        picked = [row for row in rows if row[mode] in IDENT_MODES]
+        times = np.array([row[ts] for row in picked], dtype='datetime64[s]').astype(np.int64)
+        beer = np.array([row[temp] for row in picked], dtype=float)
+        midpoint = (np.array([row[amb_min] for row in picked], dtype=float) +
+                    np.array([row[amb_max] for row in picked], dtype=float)) / 2.0
+        if amb is None:
+            return times, beer, midpoint
+        measured = np.array([row[amb] or 'nan' for row in picked], dtype=float)
+        return times, beer, np.where(np.isnan(measured), midpoint, measured)
+    except (IndexError, ValueError):
+        good = []
+        for row in rows:
+            try:
+                if row[mode] in IDENT_MODES:
+                    ambient = float(row[amb]) if amb is not None and row[amb] else (float(row[amb_min]) + float(row[amb_max])) / 2.0
+                    good.append((np.datetime64(row[ts], 's').astype(np.int64), float(row[temp]), ambient))
+            except (IndexError, ValueError):
+                continue # Truncated line (power loss) or garbage
+        if not good:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        times, beer, ambient = zip(*good)
+        return np.array(times, dtype=np.int64), np.array(beer), np.array(ambient)
+
+
+def identify_fopdt(log_file_path, step_s=IDENT_STEP_S, max_dead_time_s=IDENT_MAX_DEAD_TIME_S, chunk_rows=IDENT_CHUNK_ROWS):
+    """
+    Fits the FOPDT beer model to a pid_log.csv (streamed in chunks of 'chunk_rows').
+    Returns a ThermalModel, or None if the log is too short or never moves enough to
+    identify (e.g. a perfectly steady hold). Requires NumPy.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for thermal model identification")
+    step_s = int(step_s)
+    acc = _FopdtAccumulator(step_s, int(max_dead_time_s // step_s))
+    log_start = log_end = None
+    with open(log_file_path, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:
+            return None
+        columns = [header.index(name) for name in
+                   ('Timestamp', 'ControlMode', 'MeasuredTemp', 'AmbientSetpoint_Min', 'AmbientSetpoint_Max')]
+        columns.append(header.index('AmbientTemp') if 'AmbientTemp' in header else None)
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            times, beer, ambient = _chunk_arrays(rows, columns)
+            if times.size:
+                log_start = log_start or str(times[0].astype('datetime64[s]')).replace('T', ' ')
+                log_end = str(times[-1].astype('datetime64[s]')).replace('T', ' ')
+            acc.add(times, beer, ambient)
+    acc.add(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), final=True)
+
+    fit = acc.solve()
+    if fit is None:
+        return None
+    a, b, c, lag, rmse, samples = fit
+    if not 0.0 < a < 1.0:
+        return None # Not a stable first-order response
+    return ThermalModel(
+        tau_s=float(-step_s / np.log(a)), gain=float(b / (1.0 - a)), dead_time_s=float(lag * step_s),
+        bias_f=float(c / (1.0 - a)), rmse_f=rmse, samples=samples, step_s=step_s,
+        log_start=log_start, log_end=log_end,
+    )
+
+
+def identify_all(data_dir, **options):
+    """
+    Identifies a model for every PID log in 'data_dir' (pid_log.csv for the main vault,
+    pid_log_<id>.csv per chamber) and writes the model files next to them.
+    Returns {chamber_id or None: ThermalModel or None}.
+    """
+    models = {}
+    for name in sorted(os.listdir(data_dir)):
+        match = re.fullmatch(r"pid_log(?:_(.+))?\.csv", name)
+        if not match:
+            continue
+        chamber_id = match.group(1)
+        model = identify_fopdt(os.path.join(data_dir, name), **options)
+        if model is not None:
+            save_model(model, model_path(data_dir, chamber_id))
+        models[chamber_id] = model
+    return models
+
+
+if __name__ == "__main__":
+    # Usage: python thermal_model.py [data_dir]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.expanduser('~'), 'fermvault-data')
+    for chamber_id, model in identify_all(data_dir).items():
+        name = chamber_id or "main vault"
+        if model is None:
+            print(f"[ThermalModel] {name}: not enough varied data to identify a model.")
+        else:
+            print(f"[ThermalModel] {name}: tau {model.tau_s / 3600:.2f} h, gain {model.gain:.3f}, "
+                  f"dead time {model.dead_time_s / 60:.0f} min, bias {model.bias_f:.2f} F, "
+                  f"fit RMSE {model.rmse_f:.3f} F over {model.samples} steps ({model.log_start} .. {model.log_end})")
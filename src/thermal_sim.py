@@ -0,0 +1,340 @@
+"""
+fermvault app
+thermal_sim.py
+"""
+
+import math
+from collections import namedtuple
+
+from control_kernel import (KernelInputs, CoolingWindow, control_step, initial_state,
+                            PID_OUT_MIN, PID_OUT_MAX, AMBIENT_ENVELOPE_MIN_F, AMBIENT_ENVELOPE_MAX_F)
+from tick_scheduler import CONTROL_LOOP_PERIOD_S
+from autotune import autotune_from_series
+from thermal_model import load_model
+
+# --- OPTIONAL IMPORT: NumPy (only the batched path needs it) ---
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- THERMAL PLANT ---
+# Two lumped nodes: chamber air (read by the ambient probe) and beer (read by the beer
+# probe). Rates are per second; temperatures in F.
+#   room_f            - temperature outside the chamber
+#   air_loss_per_s    - air <-> room exchange (1 / air-to-room time constant)
+#   air_beer_per_s    - air <-> beer exchange seen by the air (small heat capacity)
+#   beer_air_per_s    - air <-> beer exchange seen by the beer (large heat capacity)
+#   cool_f_per_s      - air temperature drop rate while the compressor runs
+#   heat_f_per_s      - air temperature rise rate while the heater runs
+#   ferment_f_per_s   - beer self-heating from active fermentation
+ThermalPlant = namedtuple("ThermalPlant", (
+    "room_f air_loss_per_s air_beer_per_s beer_air_per_s cool_f_per_s heat_f_per_s ferment_f_per_s"
+))
+
+# A chest freezer holding ~5 gal: air settles in minutes, beer in hours
+DEFAULT_PLANT = ThermalPlant(
+    room_f=70.0, air_loss_per_s=1.0 / 3600, air_beer_per_s=1.0 / 900, beer_air_per_s=1.0 / 20000,
+    cool_f_per_s=0.05, heat_f_per_s=0.01, ferment_f_per_s=0.0,
+)
+
+DEFAULT_DURATION_S = 24 * 3600.0
+# Beer within this band of the setpoint counts as settled
+SETTLE_BAND_F = 0.5
+
+# Per-run scores. In a batch every field is an array with one entry per parameter set.
+#   overshoot_f       - furthest the beer went past the setpoint, on the far side from where it started
+#   settling_time_s   - time after which the beer stays within SETTLE_BAND_F (inf if it never does)
+#   compressor_cycles / heater_cycles - relay OFF->ON transitions
+#   rms_error_f       - RMS of beer minus setpoint over the run
+#   cool_duty         - fraction of ticks with the compressor running
+SimScore = namedtuple("SimScore", "overshoot_f settling_time_s compressor_cycles heater_cycles rms_error_f cool_duty")
+
+# One row per control tick (simulate(..., trace=[]))
+SimSample = namedtuple("SimSample", "t beer_f air_f setpoint_f amb_min amb_max heat cool")
+
+# ControlParams keys a batch can vary per parameter set
+BATCH_PARAM_KEYS = ("pid_kp", "pid_ki", "pid_kd", "pid_idle_zone", "beer_pid_envelope_width", "crash_pid_envelope_width")
+# Modes the batched path implements (the PID-assisted holds the gains apply to)
+BATCH_MODES = ("Beer Hold", "Fast Crash")
+
+
+def plant_from_model(model, base=DEFAULT_PLANT):
+    """
+    Returns 'base' with the beer node fitted to an identified ThermalModel (or the path
+    of a model file): the beer time constant, and the model bias as self-heating.
+    The air node, thermostat and relays produce the dead time themselves.
+    """
+    if isinstance(model, str):
+        model = load_model(model)
+        if model is None:
+            raise ValueError("No usable thermal model file")
+    return base._replace(beer_air_per_s=1.0 / model.tau_s, ferment_f_per_s=model.bias_f / model.tau_s)
+
+
+def plant_step(plant, beer_f, air_f, heat, cool, dt):
+    """
+    Advances the plant by dt seconds (explicit Euler). Works on floats or NumPy arrays
+    (heat/cool may be bools or bool arrays). Returns (beer_f, air_f).
+    """
+    d_air = (plant.air_loss_per_s * (plant.room_f - air_f) + plant.air_beer_per_s * (beer_f - air_f)
+             + plant.heat_f_per_s * heat - plant.cool_f_per_s * cool)
+    d_beer = plant.beer_air_per_s * (air_f - beer_f) + plant.ferment_f_per_s
+    return beer_f + d_beer * dt, air_f + d_air * dt
+
+
+class CompressorGuard:
+    """
+    The cooling protection of RelayControl.set_desired_states() (fail-safe lockout,
+    max runtime, dwell) without GPIO, settings or logging. Starts in the startup dwell,
+    as RelayControl does.
+    """
+
+    def __init__(self, params, start_time):
+        self.params = params
+        self.cool_on = False
+        self.last_cool_change = start_time
+        self.cool_start_time = None
+        self.cool_disabled_until = 0.0
+
+    def cooling_window(self, current_time):
+        """Same as RelayControl.cooling_window()."""
+        return CoolingWindow(
+            self.cool_on,
+            current_time - self.cool_start_time if self.cool_start_time is not None else 0.0,
+            max(0.0, self.last_cool_change + self.params.cooling_dwell_time_s - current_time),
+            max(0.0, self.cool_disabled_until - current_time),
+        )
+
+    def apply(self, desired_heat, desired_cool, current_time):
+        """Returns the enforced (heat, cool) relay states."""
+        final_cool = desired_cool
+        if current_time < self.cool_disabled_until:
+            final_cool = False
+        elif final_cool and self.cool_start_time is not None and current_time - self.cool_start_time >= self.params.max_cool_runtime_s:
+            self.cool_disabled_until = current_time + self.params.fail_safe_shutdown_time_s
+            self.cool_start_time = None
+            final_cool = False
+        elif self.last_cool_change + self.params.cooling_dwell_time_s - current_time > 0:
+            final_cool = self.cool_on
+        elif final_cool != self.cool_on:
+            self.last_cool_change = current_time
+            self.cool_start_time = current_time if final_cool else None
+        self.cool_on = final_cool
+        return desired_heat and not final_cool, final_cool
+
+
+# --- SCALAR (REFERENCE) SIMULATION ---
+def simulate(params, plant=DEFAULT_PLANT, duration_s=DEFAULT_DURATION_S, beer_start_f=None, air_start_f=None,
+             control_period_s=CONTROL_LOOP_PERIOD_S, substeps=1, settle_band_f=SETTLE_BAND_F, start_time=0.0, trace=None,
+             planner=None):
+    """
+    Runs one closed loop: the real control_step() (any control mode, ramp included)
+    and CompressorGuard driving the plant at a fixed control period. The beer and air
+    start at the room temperature unless given. Readings are fed unfiltered.
+    Appends a SimSample per tick to 'trace' if a list is given. A CompressorPlanner
+    given as 'planner' schedules the compressor as it does on the Pi. Returns a SimScore.
+    """
+    beer = plant.room_f if beer_start_f is None else float(beer_start_f)
+    air = beer if air_start_f is None else float(air_start_f)
+    state = initial_state()
+    guard = CompressorGuard(params, start_time)
+    dt = control_period_s / substeps
+    ticks = int(duration_s / control_period_s)
+
+    direction = None
+    overshoot = 0.0
+    last_out_t = None
+    sq_error = 0.0
+    cool_ticks = 0
+    cool_cycles = heat_cycles = 0
+    prev_heat = prev_cool = False
+    t = 0.0
+    for i in range(ticks):
+        t = i * control_period_s
+        outputs, state = control_step(KernelInputs(beer, air, start_time + t, t, True, True), params, state)
+        desired_cool = outputs.desired_cool
+        if planner is not None and planner.applies(outputs, params):
+            desired_cool = planner.decide(outputs, params, beer, air, guard.cooling_window(start_time + t), start_time + t)
+        heat, cool = guard.apply(outputs.desired_heat, desired_cool, start_time + t)
+
+        # --- SCORING (beer as read at this tick) ---
+        setpoint = outputs.beer_setpoint
+        error = beer - setpoint
+        if direction is None:
+            direction = 1.0 if error > 0 else -1.0 if error < 0 else 0.0
+        overshoot = max(overshoot, -direction * error if direction else abs(error))
+        if abs(error) > settle_band_f:
+            last_out_t = t
+        sq_error += error * error
+        cool_ticks += cool
+        cool_cycles += cool and not prev_cool
+        heat_cycles += heat and not prev_heat
+        prev_heat, prev_cool = heat, cool
+        if trace is not None:
+            trace.append(SimSample(t, beer, air, setpoint, outputs.amb_min, outputs.amb_max, heat, cool))
+
+        for _ in range(substeps):
+            beer, air = plant_step(plant, beer, air, heat, cool, dt)
+
+    if last_out_t is None:
+        settling = 0.0
+    elif last_out_t >= t:
+        settling = math.inf
+    else:
+        settling = last_out_t + control_period_s
+    return SimScore(overshoot, settling, cool_cycles, heat_cycles,
+                    math.sqrt(sq_error / ticks) if ticks else 0.0, cool_ticks / ticks if ticks else 0.0)
+
+
+def simulate_autotune(params, plant=DEFAULT_PLANT, duration_s=None, **sim_options):
+    """
+    Runs an Autotune session ('params' in the "Autotune" control mode) on the plant and
+    returns the proposed AutotuneResult, or None if no stable oscillation was found.
+    """
+    if params.control_mode != "Autotune":
+        raise ValueError(f"simulate_autotune needs the 'Autotune' control mode, not '{params.control_mode}'")
+    trace = []
+    simulate(params, plant, params.autotune.max_duration_s if duration_s is None else duration_s, trace=trace, **sim_options)
+    return autotune_from_series([sample.t for sample in trace], [sample.beer_f for sample in trace],
+                                params.beer_hold_f, params.autotune)
+
+
+# --- BATCHED (VECTORIZED) SIMULATION ---
+def _pid_step_batch(kp, ki, kd, setpoint, pv, integral, last_error, dt):
+    """control_kernel.pid_step() over arrays (one entry per parameter set)."""
+    error = setpoint - pv
+    p_term = kp * error
+    d_term = kd * ((error - last_error) / dt) if dt > 0 else 0.0 * error
+    integral = integral + error * dt
+    output = p_term + ki * integral + d_term
+
+    # Output clamping and back-calculation anti-windup
+    clamped = np.clip(output, PID_OUT_MIN, PID_OUT_MAX)
+    safe_ki = np.where(ki != 0, ki, 1.0)
+    integral = np.where((clamped != output) & (ki != 0), (clamped - p_term - d_term) / safe_ki, integral)
+    return clamped, integral, error
+
+
+def simulate_batch(params, plant=DEFAULT_PLANT, duration_s=DEFAULT_DURATION_S, beer_start_f=None, air_start_f=None,
+                   control_period_s=CONTROL_LOOP_PERIOD_S, substeps=1, settle_band_f=SETTLE_BAND_F, **batch_values):
+    """
+    Runs many closed loops at once. 'batch_values' maps BATCH_PARAM_KEYS (and optionally
+    beer_start_f / air_start_f) to arrays; they broadcast to one run per entry, with every
+    other setting taken from 'params'. Implements the Beer Hold / Fast Crash kernel
+    logic and CompressorGuard element-wise, so each run matches simulate() with the
+    same settings. Returns a SimScore of arrays. Requires NumPy.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for batched simulation")
+    mode = params.control_mode
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Batched simulation supports {BATCH_MODES}, not '{mode}'")
+    unknown = set(batch_values) - set(BATCH_PARAM_KEYS)
+    if unknown:
+        raise ValueError(f"Cannot batch {sorted(unknown)}; use one of {BATCH_PARAM_KEYS}")
+
+    values = {key: np.asarray(batch_values.get(key, getattr(params, key)), dtype=float) for key in BATCH_PARAM_KEYS}
+    values["beer"] = np.asarray(plant.room_f if beer_start_f is None else beer_start_f, dtype=float)
+    values["air"] = values["beer"] if air_start_f is None else np.asarray(air_start_f, dtype=float)
+    values = dict(zip(values, np.broadcast_arrays(*values.values())))
+    kp, ki, kd = values["pid_kp"], values["pid_ki"], values["pid_kd"]
+    idle_zone = values["pid_idle_zone"]
+    if mode == "Beer Hold":
+        setpoint, width = params.beer_hold_f, values["beer_pid_envelope_width"]
+    else:
+        setpoint, width = params.fast_crash_hold_f, values["crash_pid_envelope_width"]
+    beer = values["beer"].copy()
+    air = values["air"].copy()
+    shape = beer.shape
+
+    # Kernel PID state
+    integral = np.zeros(shape)
+    last_error = np.zeros(shape)
+    # CompressorGuard state (startup dwell from t=0)
+    cool_on = np.zeros(shape, dtype=bool)
+    last_cool_change = np.zeros(shape)
+    cool_start = np.full(shape, np.nan)
+    cool_disabled_until = np.zeros(shape)
+    # Scores
+    direction = np.sign(beer - setpoint)
+    overshoot = np.zeros(shape)
+    last_out_t = np.full(shape, -1.0)
+    sq_error = np.zeros(shape)
+    cool_ticks = np.zeros(shape, dtype=int)
+    cool_cycles = np.zeros(shape, dtype=int)
+    heat_cycles = np.zeros(shape, dtype=int)
+    prev_heat = np.zeros(shape, dtype=bool)
+
+    dt = control_period_s / substeps
+    ticks = int(duration_s / control_period_s)
+    t = 0.0
+    for i in range(ticks):
+        t = i * control_period_s
+        # --- KERNEL: PID-assisted hold (control_kernel._pid_hold, reset every pass) ---
+        pid_dt = 0.0 if i == 0 else control_period_s
+        integral[:] = 0.0
+        last_error[:] = 0.0
+        integral = np.where(np.abs(beer - setpoint) <= idle_zone, 0.0, integral)
+        pid_output, integral, last_error = _pid_step_batch(kp, ki, kd, setpoint, beer, integral, last_error, pid_dt)
+        ambient_setpoint = setpoint + pid_output
+        amb_min = np.clip(ambient_setpoint - width, AMBIENT_ENVELOPE_MIN_F, AMBIENT_ENVELOPE_MAX_F)
+        amb_max = np.clip(ambient_setpoint + width, AMBIENT_ENVELOPE_MIN_F, AMBIENT_ENVELOPE_MAX_F)
+        desired_heat = air < amb_min
+        desired_cool = air > amb_max
+
+        # --- COMPRESSOR PROTECTION (CompressorGuard.apply) ---
+        locked = t < cool_disabled_until
+        overrun = ~locked & desired_cool & ~np.isnan(cool_start) & (t - cool_start >= params.max_cool_runtime_s)
+        cool_disabled_until = np.where(overrun, t + params.fail_safe_shutdown_time_s, cool_disabled_until)
+        free = ~locked & ~overrun
+        dwell = free & (last_cool_change + params.cooling_dwell_time_s - t > 0)
+        cool = np.where(free, np.where(dwell, cool_on, desired_cool), False)
+        changed = free & ~dwell & (cool != cool_on)
+        last_cool_change = np.where(changed, t, last_cool_change)
+        cool_start = np.where(overrun | (changed & ~cool), np.nan, np.where(changed & cool, t, cool_start))
+        heat = desired_heat & ~cool
+
+        # --- SCORING ---
+        error = beer - setpoint
+        overshoot = np.maximum(overshoot, np.where(direction != 0, -direction * error, np.abs(error)))
+        last_out_t = np.where(np.abs(error) > settle_band_f, t, last_out_t)
+        sq_error += error * error
+        cool_ticks += cool
+        cool_cycles += cool & ~cool_on
+        heat_cycles += heat & ~prev_heat
+        cool_on, prev_heat = cool, heat
+
+        for _ in range(substeps):
+            beer, air = plant_step(plant, beer, air, heat, cool, dt)
+
+    settling = np.where(last_out_t < 0, 0.0, np.where(last_out_t >= t, np.inf, last_out_t + control_period_s))
+    return SimScore(overshoot, settling, cool_cycles, heat_cycles,
+                    np.sqrt(sq_error / max(ticks, 1)), cool_ticks / max(ticks, 1))
+
+
+# --- GAIN GRID SEARCH ---
+def score_cost(score, overshoot_weight=1.0, settling_weight_per_h=0.25, cycle_weight=0.05, rms_weight=1.0):
+    """Single figure of merit (lower is better) for a SimScore of floats or arrays."""
+    return (overshoot_weight * score.overshoot_f + settling_weight_per_h * score.settling_time_s / 3600.0
+            + cycle_weight * score.compressor_cycles + rms_weight * score.rms_error_f)
+
+
+def grid_search(params, grid, plant=DEFAULT_PLANT, top=10, cost_weights=None, **sim_options):
+    """
+    Scores every combination of the values in 'grid' (BATCH_PARAM_KEYS -> sequence) in one
+    batch; 'sim_options' go to simulate_batch() (duration_s, beer_start_f...). Returns up
+    to 'top' (cost, {key: value}, SimScore) tuples, best first.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for grid search")
+    keys = list(grid)
+    mesh = np.meshgrid(*(np.asarray(grid[key], dtype=float) for key in keys), indexing="ij")
+    flat = {key: axis.ravel() for key, axis in zip(keys, mesh)}
+    scores = simulate_batch(params, plant, **sim_options, **flat)
+    costs = score_cost(scores, **(cost_weights or {}))
+    results = []
+    for index in np.argsort(costs, kind="stable")[:top]:
+        results.append((float(costs[index]), {key: float(flat[key][index]) for key in keys},
+                        SimScore(*(field[index].item() for field in scores))))
+    return results
@@ -0,0 +1,110 @@
+"""
+fermvault app
+tick_scheduler.py
+"""
+
+import threading
+from collections import namedtuple
+
+from clock import SYSTEM_CLOCK
+
+# Control loop period (seconds)
+CONTROL_LOOP_PERIOD_S = 5.0
+
+# index: tick number; start: monotonic start time; dt: exact seconds since the previous
+# tick started; lateness: seconds past its deadline; skipped: deadlines dropped before it
+Tick = namedtuple("Tick", "index start dt lateness skipped")
+
+
+class TickScheduler:
+    """
+    Fixed-rate scheduler on the monotonic clock. Ticks target absolute deadlines
+    (first tick + n * period), so the time spent working does not stretch the period
+    and wall-clock (NTP) corrections cannot disturb it. If a tick overruns one or more
+    later deadlines, those ticks are skipped (and counted) and the grid is kept.
+    'clock' is a clock.Clock (a VirtualClock runs the schedule in simulated time).
+
+    The period can change between ticks (set_period) and wake() starts the next tick
+    immediately, re-anchoring the grid there.
+    """
+
+    def __init__(self, period_s=CONTROL_LOOP_PERIOD_S, clock=None):
+        self.period_s = period_s
+        self.clock = clock or SYSTEM_CLOCK
+        self._wake_event = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """Restarts the schedule; the next tick is due immediately."""
+        self._next_deadline = None
+        self._last_start = None
+        self.ticks = 0
+        self.overruns = 0          # Ticks whose work ran past the following deadline
+        self.skipped_ticks = 0     # Deadlines dropped because of overruns
+        self.wakeups = 0           # Ticks started early by wake()
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self._lateness_total = 0.0
+
+    def set_period(self, period_s):
+        """Changes the period; the next deadline becomes the last tick's start + period_s."""
+        if period_s == self.period_s:
+            return
+        self.period_s = period_s
+        if self._last_start is not None:
+            self._next_deadline = self._last_start + period_s
+
+    def wake(self):
+        """Ends the current wait (or the next one) so a tick starts now. Thread-safe."""
+        self._wake_event.set()
+
+    def next_tick(self, stop_event=None):
+        """
+        Waits for the next deadline and returns its Tick, or None if stop_event is set.
+        The first call after reset() returns immediately. Call wake() after setting
+        stop_event to end a wait early.
+        """
+        now = self.clock.monotonic()
+        skipped = 0
+        if self._next_deadline is None:
+            self._next_deadline = now
+        elif now >= self._next_deadline + self.period_s:
+            # The previous tick's work overran whole periods: skip them, stay on the grid
+            skipped = int((now - self._next_deadline) // self.period_s)
+            self._next_deadline += skipped * self.period_s
+            self.overruns += 1
+            self.skipped_ticks += skipped
+
+        wait_s = self._next_deadline - now
+        if wait_s > 0 and self.clock.wait(self._wake_event, wait_s):
+            # Woken early: run now and keep the grid from here
+            self._next_deadline = self.clock.monotonic()
+            self.wakeups += 1
+        self._wake_event.clear()
+        if stop_event is not None and stop_event.is_set():
+            return None
+
+        start = self.clock.monotonic()
+        lateness = max(0.0, start - self._next_deadline)
+        dt = self.period_s if self._last_start is None else start - self._last_start
+        self._last_start = start
+        self._next_deadline += self.period_s
+
+        self.ticks += 1
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self._lateness_total += lateness
+        return Tick(self.ticks, start, dt, lateness, skipped)
+
+    def stats(self):
+        """Returns scheduling metrics: ticks, overruns, skipped ticks and start-time lateness (jitter)."""
+        return {
+            "period_s": self.period_s,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped_ticks,
+            "wakeups": self.wakeups,
+            "last_lateness_s": self.last_lateness,
+            "max_lateness_s": self.max_lateness,
+            "mean_lateness_s": self._lateness_total / self.ticks if self.ticks else 0.0,
+        }
@@ -0,0 +1,202 @@
+"""
+fermvault app
+tests/test_control_kernel.py
+
+Parity checks for control_step() against the monitor/standby logic it replaced:
+Beer Hold / Fast Crash PID envelopes, the three Ramp-Up stages, the sensor-error
+fail-safe, the shutdown override and preview passes (drives_relays=False).
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from control_kernel import KernelInputs, control_step, initial_state
+from control_params import ControlParams
+
+BEER_ID = "28-000000000001"
+AMB_ID = "28-000000000002"
+START = 1_700_000_000.0 # Wall clock of the first pass (epoch seconds)
+HOUR = 3600.0
+
+
+def _params(**settings):
+    settings.setdefault("ds18b20_beer_sensor", BEER_ID)
+    settings.setdefault("ds18b20_ambient_sensor", AMB_ID)
+    return ControlParams(**settings)
+
+
+def _step(params, state, beer, amb, wall=START, mono=100.0, monitoring=True, drives_relays=True):
+    return control_step(KernelInputs(beer, amb, wall, mono, monitoring, drives_relays), params, state)
+
+
+# --- BEER HOLD / FAST CRASH ---
+def test_beer_hold_pid_envelope():
+    params = _params(control_mode="Beer Hold", beer_hold_f=55.0, pid_kp=2.0, pid_ki=0.03, pid_kd=20.0)
+
+    # First pass: no dt yet, so P only (2 * -2 = -4); envelope 51 +/- 1
+    out, state = _step(params, initial_state(), 57.0, 53.0)
+    assert out.beer_setpoint == 55.0
+    assert (out.amb_min, out.amb_max) == pytest.approx((50.0, 52.0))
+    assert out.pid_log == pytest.approx((55.0, 57.0, -4.0, 50.0, 52.0))
+    assert (out.desired_heat, out.desired_cool) == (False, True)
+    assert out.sensor_error_message == "" and not out.fail_safe_active
+
+    # Each pass restarts the integral and derivative memory (the old set_setpoint() per pass):
+    # P -3, I 0.03 * (-1.5 * 60) = -2.7, D 20 * (-1.5 / 60) = -0.5
+    out, state = _step(params, state, 56.5, 50.0, wall=START + 60, mono=160.0)
+    assert out.pid_log[2] == pytest.approx(-6.2)
+    assert (out.amb_min, out.amb_max) == pytest.approx((47.8, 49.8))
+    assert (out.desired_heat, out.desired_cool) == (False, True)
+
+
+def test_beer_hold_idle_zone_heats_below_envelope():
+    params = _params(control_mode="Beer Hold", beer_hold_f=55.0, pid_kp=2.0)
+    out, _ = _step(params, initial_state(), 55.25, 52.0)
+    # Inside the idle zone: P only (-0.5), envelope 54.5 +/- 1, ambient below it -> heat
+    assert (out.amb_min, out.amb_max) == pytest.approx((53.5, 55.5))
+    assert (out.desired_heat, out.desired_cool) == (True, False)
+
+
+def test_fast_crash_clamps_output_and_uses_crash_envelope():
+    params = _params(control_mode="Fast Crash", fast_crash_hold_f=34.0, crash_pid_envelope_width=2.0)
+    out, _ = _step(params, initial_state(), 40.0, 35.0)
+    assert out.beer_setpoint == 34.0
+    assert out.pid_log[2] == -10.0 # P = -12, clamped to PID_OUT_MIN
+    assert (out.amb_min, out.amb_max) == pytest.approx((22.0, 26.0))
+    assert out.desired_cool and not out.desired_heat
+
+
+def test_ambient_hold_thermostat():
+    params = _params(control_mode="Ambient Hold", ambient_hold_f=68.0, ambient_deadband=1.0)
+    out, _ = _step(params, initial_state(), None, 66.5)
+    assert out.sensor_error_message == "" # A missing beer probe is not critical here
+    assert (out.amb_min, out.amb_max) == (67.0, 69.0)
+    assert (out.desired_heat, out.desired_cool) == (True, False)
+    assert out.pid_log == (68.0, 66.5, 0.0, 67.0, 69.0)
+
+
+# --- RAMP-UP ---
+def test_ramp_up_stages():
+    params = _params(control_mode="Ramp-Up", beer_hold_f=55.0, ramp_up_hold_f=68.0, ramp_up_duration_hours=30.0)
+
+    # Stage 1: pre-ramp hold at the start temperature until the beer gets there
+    out, state = _step(params, initial_state(), 50.0, 52.0)
+    assert out.ramp_target_message == "Ramp pre-condition"
+    assert out.messages == ("Ramp pre-condition: bringing beer to setpoint before starting ramp.",)
+    assert out.persist == {}
+    assert state.ramp_pre_ramp
+
+    # Within ramp_pre_ramp_tolerance: the start is latched and persisted
+    out, state = _step(params, state, 55.1, 55.0, wall=START + 60, mono=160.0)
+    assert out.persist == {"ramp_start_time": START + 60, "ramp_latched_start_temp": 55.0, "ramp_is_finished": False}
+    assert not state.ramp_pre_ramp and state.ramp_start_temp == 55.0
+
+    # Stage 2: the target moves linearly from the latched start
+    out, state = _step(params, state, 61.0, 60.0, wall=START + 60 + 15 * HOUR, mono=200.0)
+    assert state.ramp_target == pytest.approx(61.5)
+    assert out.pid_log[0] == pytest.approx(61.5)
+    assert out.ramp_target_message.startswith("Target 68.0 F at ")
+    assert out.messages == ("Ramp started: 0.43 F degree change every hour.",)
+
+    # Stage 3: inside the landing zone the PID holds the end temperature
+    out, state = _step(params, state, 67.8, 67.0, wall=START + 60 + 29.9 * HOUR, mono=260.0)
+    assert out.ramp_target_message == "Ramp Landing..."
+    assert out.pid_log[0] == 68.0
+    # One log-once flag covers "Ramp started" and the landing message, as before the kernel
+    assert out.messages == ()
+
+    # Time up: finished, persisted once, then held at the end temperature
+    out, state = _step(params, state, 68.0, 67.0, wall=START + 60 + 30 * HOUR, mono=320.0)
+    assert out.ramp_target_message == "Ramp Finished"
+    assert out.persist == {"ramp_is_finished": True}
+    assert state.ramp_finished and state.ramp_target == 68.0
+    out, state = _step(params, state, 68.0, 67.0, wall=START + 60 + 31 * HOUR, mono=380.0)
+    assert out.ramp_target_message == "Ramp Finished" and out.beer_setpoint == 68.0
+
+
+# --- SENSOR ERRORS AND FAIL-SAFE ---
+def test_beer_probe_failure_limp_home_and_recovery():
+    params = _params(control_mode="Beer Hold", beer_hold_f=55.0, ambient_deadband=1.0)
+    out, state = _step(params, initial_state(), None, 57.0)
+    assert out.sensor_error_message == "FAIL: Beer Sensor Missing"
+    assert out.fail_safe_active
+    # Thermostat on ambient around the beer setpoint
+    assert (out.amb_min, out.amb_max) == (54.0, 56.0)
+    assert (out.desired_heat, out.desired_cool) == (False, True)
+    assert out.messages == ("Beer sensor reading failed. Check connection.",
+                            "FAIL-SAFE: Beer sensor failed. Holding chamber at 55.0 F.")
+
+    # Latched: the next failed pass logs nothing
+    out, state = _step(params, state, None, 55.0, mono=160.0)
+    assert out.messages == () and out.fail_safe_active
+    assert not out.desired_heat and not out.desired_cool
+
+    out, state = _step(params, state, 55.5, 55.0, mono=220.0)
+    assert not out.fail_safe_active and out.sensor_error_message == ""
+    assert out.messages == ("Beer sensor re-connected.", "FAIL-SAFE: Beer sensor re-connected. Resuming normal control.")
+
+
+def test_both_probes_failed_shuts_down():
+    params = _params(control_mode="Beer Hold")
+    out, _ = _step(params, initial_state(), None, None)
+    assert out.sensor_error_message == "FAIL: Both Sensors Failed"
+    assert not out.fail_safe_active
+    assert (out.desired_heat, out.desired_cool) == (False, False)
+    assert (out.amb_min, out.amb_max) == (0.0, 0.0)
+    assert out.pid_log is None
+
+
+def test_unassigned_probe_messages():
+    params = _params(control_mode="Fast Crash", ds18b20_beer_sensor="unassigned")
+    out, _ = _step(params, initial_state(), None, 40.0)
+    assert out.sensor_error_message == "FAIL: Beer Sensor Unassigned"
+    assert out.fail_safe_active
+    assert "Beer sensor is unassigned. Please set in System Settings." in out.messages
+
+    params = _params(control_mode="Ambient Hold", ds18b20_ambient_sensor="unassigned")
+    out, _ = _step(params, initial_state(), 55.0, None)
+    assert out.sensor_error_message == "FAIL: Ambient Sensor Unassigned"
+    assert (out.desired_heat, out.desired_cool) == (False, False)
+
+
+def test_shutdown_override():
+    params = _params(control_mode="Beer Hold", beer_hold_f=55.0)
+    out, _ = _step(params, initial_state(), 60.0, 62.0, monitoring=False)
+    assert out.current_mode == "OFF"
+    assert (out.desired_heat, out.desired_cool) == (False, False)
+    assert out.console[-1] == "[Monitor Loop] Shutdown requested. Sending OFF commands."
+
+
+# --- PREVIEW PASSES (standby, drives_relays=False) ---
+def test_preview_keeps_only_the_sensor_latches():
+    params = _params(control_mode="Ramp-Up", beer_hold_f=55.0, ramp_up_hold_f=68.0)
+    state = initial_state()
+
+    # Beer at the start temperature: a driving pass would latch the ramp; a preview must not
+    out, preview_state = _step(params, state, 55.0, 54.0, monitoring=False, drives_relays=False)
+    assert out.current_mode == "Ramp-Up" and out.beer_setpoint == 55.0
+    assert out.persist == {} and out.pid_log is None and out.messages == ()
+    assert preview_state == state
+
+    # A probe failure seen by a preview is latched (logged once, not again by the monitor loop)
+    out, preview_state = _step(params, state, None, 54.0, monitoring=False, drives_relays=False)
+    assert out.messages == ("Beer sensor reading failed. Check connection.",
+                            "FAIL-SAFE: Beer sensor failed. Holding chamber at 55.0 F.")
+    assert not preview_state.beer_ok and preview_state.fail_safe_logged
+    assert preview_state._replace(beer_ok=True, fail_safe_logged=False) == state
+
+    out, _ = _step(params, preview_state, None, 54.0, mono=160.0)
+    assert out.messages == ()
+
+
+def test_preview_does_not_touch_pid_state():
+    params = _params(control_mode="Beer Hold", beer_hold_f=55.0)
+    _, state = _step(params, initial_state(), 57.0, 53.0)
+    out, preview_state = _step(params, state, 58.0, 53.0, mono=400.0, drives_relays=False)
+    assert out.pid_log is None
+    assert preview_state == state # pid_last_time, integral and last error unchanged
+    assert out.desired_cool # The preview still reports the relay demand for the UI
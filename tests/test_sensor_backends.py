@@ -0,0 +1,102 @@
+"""
+fermvault app
+tests/test_sensor_backends.py
+
+The sysfs backends against the fake w1 tree: bulk-trigger reads, the 'temperature'
+attribute with its w1_slave fallback, and the switch to concurrent reads when the
+bulk trigger cannot be written.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sensor_backends import (FakeSysfsBackend, W1TemperatureBackend, build_fake_w1_tree,
+                             W1_BULK_READ_FILE, W1_TEMPERATURE_FILE)
+
+MASTER = "w1_bus_master1"
+PROBES = {"28-000000000001": 18.5, "28-000000000002": 21.25}
+
+
+def _bulk_read_file(root_dir):
+    return os.path.join(root_dir, MASTER, W1_BULK_READ_FILE)
+
+
+def _make_trigger_unwritable(root_dir):
+    # A directory in place of therm_bulk_read: the write fails even when run as root
+    os.remove(_bulk_read_file(root_dir))
+    os.mkdir(_bulk_read_file(root_dir))
+
+
+def test_bulk_trigger_then_read_back(tmp_path):
+    backend = FakeSysfsBackend(dict(PROBES, **{"28-000000000003": None}), root_dir=str(tmp_path))
+    readings = backend.read_many(list(PROBES) + ["28-000000000003"])
+    assert readings == dict(PROBES, **{"28-000000000003": None}) # CRC failure reads as None
+    with open(_bulk_read_file(str(tmp_path))) as f:
+        assert f.read() == "trigger\n"
+    assert backend.use_bulk_conversion
+    backend.close()
+
+
+def test_list_devices_follows_master_slaves(tmp_path):
+    backend = FakeSysfsBackend(PROBES, root_dir=str(tmp_path))
+    assert sorted(backend.list_devices()) == sorted(PROBES)
+    backend.set_temp("28-000000000009", 4.0)
+    backend.remove_probe("28-000000000001")
+    assert sorted(backend.list_devices()) == ["28-000000000002", "28-000000000009"]
+    backend.close()
+
+
+def test_unwritable_trigger_falls_back_to_concurrent_reads(tmp_path, capsys):
+    backend = FakeSysfsBackend(PROBES, root_dir=str(tmp_path))
+    _make_trigger_unwritable(str(tmp_path))
+
+    assert backend.read_many(list(PROBES)) == PROBES
+    assert not backend.use_bulk_conversion
+    assert capsys.readouterr().out.count("Using concurrent reads from now on.") == 1
+
+    # Later acquisitions go straight to concurrent reads: no retry, no repeated log line
+    backend.set_temp("28-000000000001", 19.0)
+    assert backend.read_many(list(PROBES)) == dict(PROBES, **{"28-000000000001": 19.0})
+    assert "Bulk conversion trigger failed" not in capsys.readouterr().out
+    backend.close()
+
+
+def test_no_bulk_read_file_uses_concurrent_reads(tmp_path):
+    backend = FakeSysfsBackend(PROBES, root_dir=str(tmp_path), bulk_read=False)
+    assert backend.read_many(list(PROBES)) == PROBES
+    assert backend.use_bulk_conversion # Nothing failed; the kernel just has no bulk read
+    backend.close()
+
+
+def test_temperature_attribute_with_w1_slave_fallback(tmp_path):
+    root_dir = build_fake_w1_tree(str(tmp_path), PROBES)
+    # Only the first probe exposes the kernel 'temperature' attribute (millidegrees C)
+    attribute = os.path.join(root_dir, "28-000000000001", W1_TEMPERATURE_FILE)
+    with open(attribute, "w") as f:
+        f.write("18500\n")
+
+    backend = W1TemperatureBackend(root_dir)
+    assert backend.read_many(list(PROBES)) == PROBES
+
+    # The attribute stays open and is re-read from offset 0
+    with open(attribute, "w") as f:
+        f.write("20125\n")
+    assert backend.read_one("28-000000000001") == 20.125
+
+    backend.device_removed("28-000000000001")
+    assert "28-000000000001" not in backend._fds
+    backend.close()
+
+
+def test_temperature_backend_unwritable_trigger(tmp_path, capsys):
+    root_dir = build_fake_w1_tree(str(tmp_path), PROBES)
+    _make_trigger_unwritable(root_dir)
+    backend = W1TemperatureBackend(root_dir)
+
+    assert backend.read_many(list(PROBES)) == PROBES
+    assert backend.read_many(list(PROBES)) == PROBES
+    assert not backend.use_bulk_conversion
+    assert capsys.readouterr().out.count("Using concurrent reads from now on.") == 1
+    backend.close()